@@ -0,0 +1,84 @@
+"""Задержка проверки доступности авто в зависимости от истории бронирований.
+
+Старая проверка через get_car_booking на больших историях прогоняется
+меньшее число раз, см. LEGACY_ROW_BUDGET.
+
+Запуск: python -m bench.availability
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+# База создаётся во временном каталоге, рабочая db.sqlite3 не затрагивается
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import insert, delete
+
+from core.database.models import async_main, async_session, dispose_engines, Booking
+import core.database.requests as rq
+
+HISTORY_SIZES = (100, 1_000, 10_000, 100_000)
+ROUNDS = 200
+# Старая проверка читает всю историю машины: число её прогонов ограничено
+# объёмом прочитанных строк, иначе на 100 тыс. броней замер идёт минутами
+LEGACY_ROW_BUDGET = 200_000
+LEGACY_MIN_ROUNDS = 3
+CAR_ID = 1
+
+
+async def seed(size):
+    start = date(2000, 1, 1)
+    rows = [
+        {
+            "user_id": 1,
+            "car_id": CAR_ID,
+            "start_date": start + timedelta(days=i * 3),
+            "end_date": start + timedelta(days=i * 3 + 1),
+            "total_price": 100,
+            "payment_status": ("completed", "failed", "cancelled")[i % 3],
+        }
+        for i in range(size)
+    ]
+    async with async_session() as session:
+        await session.execute(delete(Booking))
+        await session.execute(insert(Booking), rows)
+        await session.commit()
+
+
+async def legacy_check(start_date, end_date):
+    bookings = await rq.get_car_booking(CAR_ID)
+    for booking in bookings:
+        if start_date <= booking.end_date and end_date >= booking.start_date:
+            return False
+    return True
+
+
+async def measure(check, start_date, end_date, rounds=ROUNDS):
+    began = time.perf_counter()
+    for _ in range(rounds):
+        await check(CAR_ID, start_date, end_date)
+    return (time.perf_counter() - began) / rounds * 1000
+
+
+async def main():
+    await async_main()
+    start_date = date.today() + timedelta(days=1)
+    end_date = start_date + timedelta(days=7)
+    print(f"{'history':>10} {'is_car_available, ms':>22} {'get_car_booking, ms':>22}")
+    for size in HISTORY_SIZES:
+        await seed(size)
+        fast = await measure(rq.is_car_available, start_date, end_date)
+        slow = await measure(
+            lambda car_id, s, e: legacy_check(s, e), start_date, end_date,
+            rounds=max(LEGACY_MIN_ROUNDS, min(ROUNDS, LEGACY_ROW_BUDGET // size)),
+        )
+        print(f"{size:>10} {fast:>22.3f} {slow:>22.3f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,80 @@
+"""Стоимость маршрутизации нажатия кнопки в зависимости от числа обработчиков.
+
+linear - обработчики aiogram с фильтрами по префиксу, как раньше в
+core/handlers.py; нажимается кнопка последнего из них (худший случай).
+table - один обработчик с таблицей core.callbacks.CallbackTable.
+Обновления подаются в Dispatcher.feed_update без сети.
+
+Запуск: python -m bench.callback_routing [--rounds 2000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.getcwd())
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import CallbackQuery, Update, User
+
+from core.callbacks import Action, CallbackTable
+
+HANDLER_COUNTS = (10, 50, 200, 1000)
+USER = User(id=1, is_bot=False, first_name="Bench")
+
+
+async def noop(callback: CallbackQuery):
+    pass
+
+
+def linear_router(count):
+    router = Router()
+    for i in range(count):
+        router.callback_query.register(noop, lambda c, prefix=f"act{i}_": c.data.startswith(prefix))
+    return router, f"act{count - 1}_42"
+
+
+def table_router(count):
+    # Коды действий однобуквенные, для тысячи действий берём иероглифы
+    table = CallbackTable()
+    actions = [Action(f"bench{count}_{i}", chr(0x4E00 + count * 10 + i), int) for i in range(count)]
+    for action in actions:
+        async def handler(callback: CallbackQuery, value):
+            pass
+        table.handler(action)(handler)
+    router = Router()
+    router.callback_query.register(table.dispatch)
+    return router, actions[-1].pack(42)
+
+
+async def measure(router, data, rounds):
+    dispatcher = Dispatcher()
+    dispatcher.include_router(router)
+    bot = Bot("123456:BENCH")
+    update = Update(
+        update_id=1,
+        callback_query=CallbackQuery(id="1", from_user=USER, chat_instance="1", data=data),
+    )
+    for _ in range(1000):
+        await dispatcher.feed_update(bot, update)
+    began = time.perf_counter()
+    for _ in range(rounds):
+        await dispatcher.feed_update(bot, update)
+    return (time.perf_counter() - began) / rounds * 1e6
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'handlers':>8} {'linear, us':>12} {'table, us':>12}")
+    for count in HANDLER_COUNTS:
+        linear = await measure(*linear_router(count), args.rounds)
+        table = await measure(*table_router(count), args.rounds)
+        print(f"{count:>8} {linear:>12.1f} {table:>12.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
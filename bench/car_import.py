@@ -0,0 +1,106 @@
+"""Импорт каталога из CSV: добавление и массовое изменение машин.
+
+Генерирует файл на --rows машин (часть строк с ошибками), загружает его
+так же, как /import, затем загружает второй файл с новой ценой и
+доступностью для каждой машины. Печатает время, строки в секунду и
+пиковый прирост RssAnon.
+
+Запуск: python -m bench.car_import [--rows 100000] [--batch-size 1000]
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from core.database.models import async_main, dispose_engines
+import core.database.requests as rq
+from core.imports import import_cars
+
+TYPES = ("sedan", "suv", "hatchback")
+BRANDS = ("Toyota", "Kia", "Hyundai", "BMW", "Лада", "Škoda")
+# Каждая тысячная строка с ошибкой
+BAD_ROW_EVERY = 1000
+
+
+def anon_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+async def measure(coro):
+    """Время выполнения и пиковый прирост RssAnon в МБ."""
+    baseline = peak = anon_rss_mb()
+    task = asyncio.ensure_future(coro)
+    began = time.perf_counter()
+    while not task.done():
+        await asyncio.wait([task], timeout=0.05)
+        peak = max(peak, anon_rss_mb())
+    return task.result(), time.perf_counter() - began, peak - baseline
+
+
+def write_new_cars(path, count):
+    rnd = random.Random(0)
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, delimiter=";")
+        writer.writerow(("brand", "model", "type", "description", "price_per_day", "image_url"))
+        for i in range(count):
+            price = "много" if i % BAD_ROW_EVERY == 0 else f"{rnd.randrange(1000, 20000)},50"
+            writer.writerow((
+                rnd.choice(BRANDS), f"Model {i}", TYPES[i % len(TYPES)],
+                f"{rnd.choice((5, 7))} мест", price, "",
+            ))
+
+
+def write_changes(path, count):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(("id", "price_per_day", "is_available"))
+        for car_id in range(1, count + 1):
+            writer.writerow((car_id, 3000 + car_id % 100, int(car_id % 10 != 0)))
+
+
+async def run(name, path, batch_size):
+    (added, updated, errors), elapsed, memory = await measure(
+        import_cars(path, batch_size=batch_size)
+    )
+    rows = added + updated + len(errors)
+    print(
+        f"{name:<8} {added:>8} {updated:>8} {len(errors):>7} {elapsed:>8.2f} "
+        f"{rows / elapsed:>10.0f} {memory:>8.1f}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    await async_main()
+    write_new_cars("new.csv", args.rows)
+    write_changes("changes.csv", args.rows)
+    await rq.rebuild_facets()
+
+    print(f"{'file':<8} {'added':>8} {'updated':>8} {'errors':>7} {'s':>8} {'rows/s':>10} {'RSS MB':>8}")
+    await run("new", "new.csv", args.batch_size)
+    await run("changes", "changes.csv", args.batch_size)
+
+    cars = await rq.get_cars()
+    assert rq.facets.total == len(cars)
+    assert rq.facets.available == sum(car.is_available for car in cars)
+    print(f"catalog: {len(cars)} cars, {rq.facets.available} available")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Стоимость страницы каталога в зависимости от её номера.
+
+Запуск: python -m bench.catalog_pages [--cars 100000] [--page-size 10]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import insert
+
+from core.database.models import async_main, async_session, dispose_engines, Car
+import core.database.requests as rq
+
+TYPES = ("sedan", "suv", "hatchback")
+ROUNDS = 1000
+
+
+async def seed(count):
+    rnd = random.Random(0)
+    rows = [
+        {
+            "brand": f"Brand{i % 50}",
+            "model": f"Model{i}",
+            "type": TYPES[i % len(TYPES)],
+            "description": "",
+            "price_per_day": rnd.randrange(1000, 20000),
+            "is_available": True,
+            "image_url": "",
+        }
+        for i in range(count)
+    ]
+    async with async_session() as session:
+        await session.execute(insert(Car), rows)
+        await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cars", type=int, default=100_000)
+    parser.add_argument("--page-size", type=int, default=10)
+    args = parser.parse_args()
+
+    await async_main()
+    await seed(args.cars)
+
+    began = time.perf_counter()
+    await rq.catalog_cache.get()
+    print(f"catalog load: {(time.perf_counter() - began) * 1000:.1f} ms")
+
+    # Собираем курсоры, проходя каталог вперёд
+    cursors = [None]
+    while True:
+        page = await rq.get_cars_by_filter(after=cursors[-1], limit=args.page_size)
+        if len(page) < args.page_size:
+            break
+        cursors.append(rq.catalog_key(page[-1]))
+    print(f"pages: {len(cursors)}")
+
+    print(f"{'page':>8} {'us/page':>10}")
+    for number in (1, 10, 100, 1000, len(cursors)):
+        if number > len(cursors):
+            continue
+        cursor = cursors[number - 1]
+        began = time.perf_counter()
+        for _ in range(ROUNDS):
+            await rq.get_cars_by_filter(after=cursor, limit=args.page_size)
+        print(f"{number:>8} {(time.perf_counter() - began) / ROUNDS * 1_000_000:>10.1f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
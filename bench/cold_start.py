@@ -0,0 +1,117 @@
+"""Время от запуска bot.py до ответа на первое обновление.
+
+Бот запускается отдельным процессом против заглушки Bot API; обновление
+/start уже ждёт в очереди. Первый запуск создаёт базу и в статистику не
+входит, остальные - обычные перезапуски с уже существующей базой.
+
+Запуск: python -m bench.cold_start [--runs 5] [--repo путь к другой версии бота]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+REPO = os.getcwd()
+os.chdir(tempfile.mkdtemp())
+
+from bench.fake_bot_api import FakeBotAPI
+
+api = FakeBotAPI()
+
+
+def seed(cars, bookings):
+    db = sqlite3.connect("db.sqlite3")
+    db.executemany(
+        "INSERT INTO cars (brand, model, type, description, price_per_day, is_available, image_url) "
+        "VALUES ('Toyota', ?, 'sedan', '', 2000, 1, '')",
+        [(f"Camry {i}",) for i in range(cars)],
+    )
+    today = date.today()
+    db.executemany(
+        "INSERT INTO bookings (user_id, car_id, start_date, end_date, total_price, payment_status) "
+        "VALUES (1, ?, ?, ?, 1000, 'completed')",
+        [
+            (i % cars + 1, today + timedelta(days=i % 150), today + timedelta(days=i % 150 + 2))
+            for i in range(bookings)
+        ],
+    )
+    db.commit()
+    db.close()
+
+
+async def time_to_first_update(repo, user_id, timeout=60):
+    api.send_text(user_id, "/start")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([os.getcwd(), repo])}
+    began = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.join(repo, "bot.py"), "--loop-lag-ms", "0",
+        env=env,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            at, method, _, _ = await asyncio.wait_for(api.inbox(user_id).get(), timeout)
+            if method == "sendmessage":
+                return at - began
+    finally:
+        process.send_signal(signal.SIGINT)
+        await process.wait()
+
+
+async def import_time(repo):
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([os.getcwd(), repo])}
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c",
+        "import time; began = time.perf_counter(); import bot; print(time.perf_counter() - began)",
+        env=env,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    return float(stdout)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--repo", default=REPO)
+    parser.add_argument("--cars", type=int, default=200)
+    parser.add_argument("--bookings", type=int, default=5000)
+    args = parser.parse_args()
+    repo = os.path.abspath(args.repo)
+
+    url = await api.start()
+    with open("config.py", "w") as f:
+        f.write(
+            'TELEGRAM_BOT_TOKEN = "123456:COLDSTART"\n'
+            'PAYMENTS_TOKEN = "123:TEST:cold"\n'
+            "ADMIN_IDS = []\n"
+            f'TELEGRAM_API_URL = "{url}"\n'
+        )
+
+    # Импорт aiogram и модулей бота не зависит от кода запуска, поэтому
+    # меряется отдельно и вычитается
+    imports = min([await import_time(repo) for _ in range(3)])
+    first = await time_to_first_update(repo, 100_000)
+    seed(args.cars, args.bookings)
+    runs = [await time_to_first_update(repo, 100_001 + i) for i in range(args.runs)]
+    await api.stop()
+
+    median = statistics.median(runs)
+    print(f"imports: {imports * 1000:.0f} ms")
+    print(f"first boot (empty db): {first * 1000:.0f} ms")
+    print(
+        f"restart: median {median * 1000:.0f} ms, "
+        f"min {min(runs) * 1000:.0f} ms, max {max(runs) * 1000:.0f} ms"
+    )
+    print(f"restart without imports: median {(median - imports) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+"""Сводки по дням: стоимость поддержки и выигрыш на отчётах.
+
+1. Перестройка сводок по истории броней (то же делает миграция и
+   python -m core.database.stats backfill).
+2. «Загрузка по типам за 90 дней»: полный проход по броням с арифметикой
+   дат в Python против запроса к type_daily_stats.
+3. Случайная последовательность броней, оплат, отмен и смен типа машины
+   через функции core.database.requests, после которой сводки сверяются
+   с таблицей броней.
+
+Запуск: python -m bench.daily_stats [--bookings 200000] [--operations 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import select
+
+from core.database.models import async_main, dispose_engines, engine, Booking, Car, PAID_BOOKING_STATUSES
+import core.database.requests as rq
+import core.database.stats as stats
+
+CARS = 200
+TYPES = ("sedan", "suv", "hatchback", "minivan", "coupe")
+STATUSES = ("completed", "confirmed", "cancelled", "failed", "expired")
+
+
+def seed(bookings):
+    db = sqlite3.connect("db.sqlite3")
+    db.executemany(
+        "INSERT INTO cars (brand, model, type, description, price_per_day, is_available, image_url) "
+        "VALUES ('Toyota', ?, ?, '', 2000, 1, '')",
+        ((f"Camry {i}", TYPES[i % len(TYPES)]) for i in range(CARS)),
+    )
+    today = date.today()
+    db.executemany(
+        "INSERT INTO bookings (user_id, car_id, start_date, end_date, total_price, payment_status) "
+        "VALUES (1, ?, ?, ?, ?, ?)",
+        (
+            (
+                random.randrange(1, CARS + 1),
+                start,
+                start + timedelta(days=length - 1),
+                2000 * length + random.randrange(100) / 100,
+                random.choice(STATUSES),
+            )
+            for _ in range(bookings)
+            for start, length in [(today - timedelta(days=random.randrange(1000)), random.randint(1, 7))]
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+async def naive_utilization(days=90):
+    # Так отчёт пришлось бы считать без сводок
+    today = date.today()
+    first = today - timedelta(days=days - 1)
+    async with rq.session_for_read() as session:
+        types = dict((await session.execute(select(Car.id, Car.type))).all())
+        result = await session.execute(
+            select(Booking.car_id, Booking.start_date, Booking.end_date, Booking.total_price)
+            .where(Booking.payment_status.in_(PAID_BOOKING_STATUSES))
+        )
+        booked = defaultdict(int)
+        for car_id, start_date, end_date, total_price in result:
+            for day, _, _ in stats.booking_days(start_date, end_date, total_price):
+                if first <= day <= today and car_id in types:
+                    booked[types[car_id]] += 1
+    return booked
+
+
+async def random_operations(count):
+    today = date.today()
+    cars = list(range(1, CARS + 1))
+    created = []
+    for i in range(count):
+        action = random.random()
+        car_id = random.choice(cars)
+        start = today + timedelta(days=random.randrange(-60, 60))
+        end = start + timedelta(days=random.randrange(5))
+        if action < 0.35:
+            booking = await rq.add_booking(1, 1000 + i, random.choice(STATUSES), car_id, start, end)
+            created.append(booking.id)
+        elif action < 0.6:
+            booking, _ = await rq.reserve_car(
+                1, car_id, start, end, 1500, payment_status="pending",
+                expires_at=rq.datetime.utcnow() + timedelta(minutes=15),
+            )
+            if booking:
+                created.append(booking.id)
+        elif action < 0.75 and created:
+            await rq.complete_hold(random.choice(created), 1700 + i)
+        elif action < 0.85 and created:
+            async with rq.session_for_write() as session:
+                await rq.cancel_booking(random.choice(created), session)
+        elif action < 0.95 and created:
+            async with rq.session_for_write() as session:
+                await rq.confirm_booking(random.choice(created), session)
+        elif action < 0.99:
+            async with rq.session_for_write() as session:
+                await rq.update_car(car_id, session, type=random.choice(TYPES))
+        else:
+            async with rq.session_for_write() as session:
+                await rq.delete_car(car_id, session)
+            cars.remove(car_id)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=200_000)
+    parser.add_argument("--operations", type=int, default=2000)
+    args = parser.parse_args()
+
+    await async_main()
+    seed(args.bookings)
+
+    began = time.perf_counter()
+    async with engine.begin() as conn:
+        rows = await stats.backfill(conn)
+    print(f"backfill: {args.bookings} bookings -> {rows} rows in {time.perf_counter() - began:.2f} s")
+
+    began = time.perf_counter()
+    naive = await naive_utilization()
+    naive_time = time.perf_counter() - began
+    began = time.perf_counter()
+    async with rq.session_for_read() as session:
+        report = await stats.utilization_by_type(session)
+    summary_time = time.perf_counter() - began
+    assert {row[0]: row[2] for row in report} == dict(naive), "сводка не совпала с полным проходом"
+    print(f"utilization by type, 90 days: full scan {naive_time * 1000:.0f} ms, summary {summary_time * 1000:.1f} ms")
+
+    began = time.perf_counter()
+    await random_operations(args.operations)
+    print(f"{args.operations} random operations in {time.perf_counter() - began:.1f} s")
+    async with engine.connect() as conn:
+        mismatches = await stats.check(conn)
+    print(f"consistency check: {len(mismatches)} mismatches")
+    await dispose_engines()
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,127 @@
+"""Смешанная нагрузка чтения и записи на движок по умолчанию и на
+настроенный профиль (WAL, pragma, отдельные пулы чтения и записи).
+
+Читатели проверяют пересечения броней, писатели вставляют брони и
+коммитят каждую по отдельности, как обработчики бота.
+
+Запуск: python -m bench.engine_profile [--readers 8] [--writers 2] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import and_, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from core.database.models import Base, Booking, Car, create_engines
+
+CARS = 200
+BOOKINGS = 5000
+
+
+async def seed(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Car), [
+            {
+                "brand": "Toyota",
+                "model": f"Camry {i}",
+                "type": "sedan",
+                "description": "",
+                "price_per_day": 2000,
+                "is_available": True,
+                "image_url": "",
+            }
+            for i in range(CARS)
+        ])
+        today = date.today()
+        rows = []
+        for i in range(BOOKINGS):
+            start = today + timedelta(days=random.randrange(365))
+            rows.append({
+                "user_id": 1,
+                "car_id": random.randrange(1, CARS + 1),
+                "start_date": start,
+                "end_date": start + timedelta(days=3),
+                "total_price": 6000,
+                "payment_status": "completed",
+            })
+        await conn.execute(insert(Booking), rows)
+
+
+async def reader(sessionmaker, deadline, latencies):
+    today = date.today()
+    while time.perf_counter() < deadline:
+        start = today + timedelta(days=random.randrange(365))
+        began = time.perf_counter()
+        async with sessionmaker() as session:
+            await session.scalars(select(Booking.id).where(and_(
+                Booking.car_id == random.randrange(1, CARS + 1),
+                Booking.start_date <= start + timedelta(days=7),
+                Booking.end_date >= start,
+            )))
+        latencies.append(time.perf_counter() - began)
+
+
+async def writer(sessionmaker, deadline, counter):
+    today = date.today()
+    while time.perf_counter() < deadline:
+        start = today + timedelta(days=random.randrange(365))
+        async with sessionmaker() as session:
+            session.add(Booking(
+                user_id=1,
+                car_id=random.randrange(1, CARS + 1),
+                start_date=start,
+                end_date=start + timedelta(days=3),
+                total_price=6000,
+                payment_status="completed",
+            ))
+            await session.commit()
+        counter[0] += 1
+
+
+async def run(name, write_engine, read_engine, args):
+    await seed(write_engine)
+    write_session = async_sessionmaker(write_engine)
+    read_session = async_sessionmaker(read_engine)
+    latencies = []
+    writes = [0]
+    deadline = time.perf_counter() + args.seconds
+    await asyncio.gather(
+        *(reader(read_session, deadline, latencies) for _ in range(args.readers)),
+        *(writer(write_session, deadline, writes) for _ in range(args.writers)),
+    )
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000
+    print(
+        f"{name:<10} {len(latencies) / args.seconds:>10.0f} "
+        f"{writes[0] / args.seconds:>10.0f} {p95:>14.2f}"
+    )
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'reads/s':>10} {'writes/s':>10} {'read p95, ms':>14}")
+    default = create_async_engine("sqlite+aiosqlite:///default.sqlite3")
+    await run("default", default, default, args)
+    await run("tuned", *create_engines("tuned.sqlite3", read_pool_size=args.readers), args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,213 @@
+"""Заглушка Telegram Bot API на aiohttp для нагрузочных тестов.
+
+Отдаёт боту подготовленные обновления через getUpdates и складывает ответы
+бота во входящие виртуальных пользователей. Бот направляется сюда
+настройкой TELEGRAM_API_URL.
+"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Car booking", "username": "car_booking_bot"}
+
+# Сколько максимум ждёт getUpdates, чтобы бот быстро останавливался
+MAX_POLL_TIMEOUT = 1
+
+
+def user_dict(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def inline_markup(params):
+    # В объекте Message Telegram возвращает только inline-клавиатуру
+    markup = json.loads(params.get("reply_markup") or "{}")
+    if "inline_keyboard" in markup:
+        return {"reply_markup": markup}
+    return {}
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.updates = asyncio.Queue()
+        self.inboxes = {}
+        self.calls = {}
+        # Время выдачи обновления боту: от него считается задержка обработчика
+        self.delivered_at = {}
+        self._update_ids = iter(range(1, 1 << 62))
+        self._message_ids = iter(range(1, 1 << 62))
+        self._query_chats = {}
+        # Payload последнего счёта в чате: Telegram возвращает его в
+        # pre_checkout_query и successful_payment
+        self._payloads = {}
+        # Режим flood control: каждый flood_every-й sendMessage получает 429
+        # с retry_after и не доставляется
+        self.flood_every = 0
+        self.retry_after = 1
+        self.rate_limited = 0
+        self._sends = 0
+        self._runner = None
+
+    def inbox(self, chat_id):
+        if chat_id not in self.inboxes:
+            self.inboxes[chat_id] = asyncio.Queue()
+        return self.inboxes[chat_id]
+
+    def message(self, chat_id, sender, **fields):
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": sender,
+            **fields,
+        }
+
+    # Обновления от пользователей
+
+    def push(self, kind, payload):
+        update_id = next(self._update_ids)
+        self.updates.put_nowait({"update_id": update_id, kind: payload})
+        return update_id
+
+    def send_text(self, user_id, text):
+        return self.push("message", self.message(user_id, user_dict(user_id), text=text))
+
+    def send_contact(self, user_id, phone):
+        contact = {"phone_number": phone, "first_name": f"User {user_id}", "user_id": user_id}
+        return self.push("message", self.message(user_id, user_dict(user_id), contact=contact))
+
+    def press(self, user_id, message, data):
+        query_id = f"cq{next(self._update_ids)}"
+        self._query_chats[query_id] = user_id
+        return self.push("callback_query", {
+            "id": query_id,
+            "from": user_dict(user_id),
+            "chat_instance": str(user_id),
+            "message": message,
+            "data": data,
+        })
+
+    def pre_checkout(self, user_id, total_amount):
+        query_id = f"pc{next(self._update_ids)}"
+        self._query_chats[query_id] = user_id
+        return self.push("pre_checkout_query", {
+            "id": query_id,
+            "from": user_dict(user_id),
+            "currency": "RUB",
+            "total_amount": total_amount,
+            "invoice_payload": self._payloads.get(user_id, ""),
+        })
+
+    def pay(self, user_id, total_amount):
+        payment = {
+            "currency": "RUB",
+            "total_amount": total_amount,
+            "invoice_payload": self._payloads.get(user_id, ""),
+            "telegram_payment_charge_id": f"tg{user_id}",
+            "provider_payment_charge_id": f"pr{user_id}",
+        }
+        return self.push("message", self.message(
+            user_id, user_dict(user_id), successful_payment=payment
+        ))
+
+    # Методы Bot API
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        params = dict(await request.post())
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getupdates":
+            updates = await self.get_updates(params)
+            if request.transport is None or request.transport.is_closing():
+                # Клиент ушёл, не дождавшись ответа: обновления получит следующий
+                for update in updates:
+                    self.updates.put_nowait(update)
+                return self.ok([])
+            return self.ok(updates)
+        if method == "getme":
+            return self.ok(BOT_USER)
+
+        if method == "sendmessage" and self.flood_every:
+            self._sends += 1
+            if self._sends % self.flood_every == 0:
+                self.rate_limited += 1
+                return self.too_many_requests()
+
+        result = True
+        chat_id = params.get("chat_id")
+        if method in ("sendmessage", "sendphoto", "sendinvoice"):
+            fields = {"text": params.get("text", params.get("caption", ""))}
+            fields.update(inline_markup(params))
+            if method == "sendinvoice":
+                fields["invoice"] = {
+                    "title": params["title"],
+                    "description": params["description"],
+                    "start_parameter": params.get("start_parameter", ""),
+                    "currency": params["currency"],
+                    "total_amount": sum(p["amount"] for p in json.loads(params["prices"])),
+                }
+                self._payloads[int(chat_id)] = params["payload"]
+            result = self.message(int(chat_id), BOT_USER, **fields)
+        elif method == "sendmediagroup":
+            media = json.loads(params["media"])
+            result = [self.message(int(chat_id), BOT_USER, text="") for _ in media]
+        elif method in ("editmessagetext", "editmessagereplymarkup"):
+            fields = {"text": params.get("text", "")}
+            fields.update(inline_markup(params))
+            result = self.message(int(chat_id), BOT_USER, **fields)
+            result["message_id"] = int(params["message_id"])
+        elif method in ("answercallbackquery", "answerprecheckoutquery"):
+            query_id = params.get("callback_query_id") or params.get("pre_checkout_query_id")
+            chat_id = self._query_chats.pop(query_id, None)
+
+        if chat_id is not None:
+            self.inbox(int(chat_id)).put_nowait((time.perf_counter(), method, params, result))
+        return self.ok(result)
+
+    async def get_updates(self, params):
+        timeout = min(int(params.get("timeout", 0)), MAX_POLL_TIMEOUT)
+        limit = int(params.get("limit", 100))
+        try:
+            first = await asyncio.wait_for(self.updates.get(), timeout or 0.01)
+        except asyncio.TimeoutError:
+            return []
+        batch = [first]
+        while len(batch) < limit and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        now = time.perf_counter()
+        for update in batch:
+            self.delivered_at[update["update_id"]] = now
+        return batch
+
+    @staticmethod
+    def ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+    def too_many_requests(self):
+        return web.json_response(
+            {
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            },
+            status=429,
+        )
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
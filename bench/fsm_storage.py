@@ -0,0 +1,60 @@
+"""Накладные расходы FSM-хранилища на одно обновление.
+
+Каждое «обновление» повторяет то, что делает aiogram при переходе по шагам
+бронирования: чтение состояния, чтение и запись данных, смена состояния.
+
+Запуск: python -m bench.fsm_storage [--updates 20000] [--users 1000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+sys.path.insert(0, os.getcwd())
+
+from core.storage import SQLiteStorage
+
+
+async def run(storage, updates, users):
+    began = time.perf_counter()
+    for i in range(updates):
+        key = StorageKey(bot_id=1, chat_id=i % users, user_id=i % users)
+        await storage.get_state(key)
+        data = await storage.get_data(key)
+        data.update(car_id=i, start_date=date.today())
+        await storage.set_data(key, data)
+        await storage.set_state(key, "BookingState:selecting_dates")
+    elapsed = time.perf_counter() - began
+    await storage.close()
+    return elapsed / updates * 1_000_000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    storages = {
+        "MemoryStorage": MemoryStorage(),
+        "SQLiteStorage(shared=False)": SQLiteStorage(
+            os.path.join(directory, "local.sqlite3"), shared=False
+        ),
+        "SQLiteStorage(shared=True)": SQLiteStorage(
+            os.path.join(directory, "shared.sqlite3"), shared=True
+        ),
+    }
+    for name, storage in storages.items():
+        overhead = await run(storage, args.updates, args.users)
+        print(f"{name:<30} {overhead:>8.1f} us/update")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
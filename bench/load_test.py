@@ -0,0 +1,314 @@
+"""Сквозной нагрузочный тест бота на заглушке Bot API.
+
+Виртуальные пользователи проходят путь регистрация -> каталог -> карточка
+автомобиля -> бронирование -> оплата. Бот работает в режиме polling с
+обработчиками из core/handlers.py и чистой базой во временном каталоге.
+Задержка шага - время от выдачи обновления боту до последнего ответа бота
+на него.
+
+После сценария через очередь исходящих сообщений рассылается
+--flood-messages сообщений, а заглушка отвечает 429 с retry_after на каждый
+--flood-every-й sendMessage: проверяется, что очередь выдерживает паузу и
+доставляет каждое сообщение ровно один раз. Половина сообщений уходит
+напрямую и проходит через очередь как интерактивные ответы. Затем в один чат
+ставится FAIRNESS_BACKLOG сообщений, и сообщение в другой чат должно уйти
+быстрее FAIRNESS_MAX_WAIT.
+
+Запуск: python -m bench.load_test [--users 200] [--cars 50] [--max-p95-ms 250]
+Ненулевой код возврата, если были ошибки, потерянные сообщения или p95 выше
+порога.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+# Бот читает настройки из config.py, для теста подставляем свои
+config = types.ModuleType("config")
+config.TELEGRAM_BOT_TOKEN = "123456:LOADTEST"
+config.PAYMENTS_TOKEN = "123:TEST:load"
+config.ADMIN_IDS = []
+sys.modules["config"] = config
+
+from bench.fake_bot_api import FakeBotAPI
+import core.callbacks as cb
+
+api = FakeBotAPI()
+latencies = defaultdict(list)
+
+
+# Длинная рассылка в один чат не должна задерживать сообщения в другие
+FAIRNESS_CHATS = (900_001, 900_002)
+FAIRNESS_BACKLOG = 12
+FAIRNESS_MAX_WAIT = 1.0
+
+
+class StepFailed(Exception):
+    pass
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class VirtualUser:
+    def __init__(self, user_id, car_id, start_date, timeout):
+        self.user_id = user_id
+        self.car_id = car_id
+        self.start_date = start_date
+        self.timeout = timeout
+
+    async def step(self, name, push, expect, count=1):
+        update_id = push()
+        inbox = api.inbox(self.user_id)
+        replies = []
+        while len(replies) < count:
+            try:
+                at, method, params, result = await asyncio.wait_for(inbox.get(), self.timeout)
+            except asyncio.TimeoutError:
+                raise StepFailed(f"{name}: нет ответа {expect}")
+            # Ответы на предыдущие шаги, пришедшие с опозданием, пропускаем
+            delivered = api.delivered_at.get(update_id)
+            if method == expect and delivered is not None and at >= delivered:
+                replies.append((params, result))
+        latencies[name].append(at - delivered)
+        params, result = replies[-1]
+        if params.get("text", "").startswith(("Произошла ошибка", "Ошибка")):
+            raise StepFailed(f"{name}: {params['text']}")
+        return params, result
+
+    async def run(self):
+        uid = self.user_id
+        end_date = self.start_date + timedelta(days=1)
+        dates = f"{self.start_date:%d.%m.%Y}-{end_date:%d.%m.%Y}"
+
+        await self.step("start", lambda: api.send_text(uid, "/start"), "sendmessage")
+        await self.step("register", lambda: api.send_text(uid, "Регистрация"), "sendmessage")
+        await self.step("name", lambda: api.send_text(uid, f"User {uid}"), "sendmessage")
+        await self.step("phone", lambda: api.send_contact(uid, f"7900{uid:07d}"), "sendmessage")
+        _, menu = await self.step("catalog", lambda: api.send_text(uid, "Каталог"), "sendmessage")
+        _, page = await self.step(
+            "filter", lambda: api.press(uid, menu, cb.FILTER.pack("all")), "editmessagetext"
+        )
+        _, card = await self.step(
+            "car", lambda: api.press(uid, page, cb.CAR.pack(self.car_id)), "editmessagetext"
+        )
+        await self.step(
+            "book", lambda: api.press(uid, card, cb.BOOK.pack(self.car_id)), "sendmessage", count=2
+        )
+        _, confirmation = await self.step(
+            "dates", lambda: api.send_text(uid, dates), "sendmessage"
+        )
+        _, invoice = await self.step(
+            "confirm", lambda: api.press(uid, confirmation, cb.CONFIRM_BOOKING.pack()), "sendinvoice"
+        )
+        amount = invoice["invoice"]["total_amount"]
+        params, _ = await self.step(
+            "pre_checkout", lambda: api.pre_checkout(uid, amount), "answerprecheckoutquery"
+        )
+        if params.get("ok") != "true":
+            raise StepFailed(f"pre_checkout: {params.get('error_message')}")
+        params, _ = await self.step("payment", lambda: api.pay(uid, amount), "sendmessage")
+        if "успешно" not in params["text"]:
+            raise StepFailed(f"payment: {params['text']}")
+
+
+async def seed(count):
+    from sqlalchemy import insert
+    from core.database.models import async_session, Car
+
+    rows = [
+        {
+            "brand": "Toyota",
+            "model": f"Camry {i}",
+            "type": ("sedan", "suv", "hatchback")[i % 3],
+            "description": "Комфортный автомобиль",
+            "price_per_day": 2000 + i * 10,
+            "is_available": True,
+            "image_url": "",
+        }
+        for i in range(count)
+    ]
+    async with async_session() as session:
+        await session.execute(insert(Car), rows)
+        await session.commit()
+
+
+async def check_flood_control(sender, bot, chat_ids, messages, every):
+    """Рассылка при ответах 429: (доставлено, потеряно, повторов).
+
+    Чётные сообщения ставятся в очередь с приоритетом BULK, нечётные
+    отправляются напрямую и проходят через очередь как интерактивные ответы.
+    """
+    from core.sender import BULK
+
+    api.flood_every = every
+    futures = []
+    for i in range(messages):
+        chat_id = chat_ids[i % len(chat_ids)]
+        if i % 2:
+            futures.append(asyncio.ensure_future(bot.send_message(chat_id, f"flood {i}")))
+        else:
+            futures.append(sender.submit(
+                chat_id, lambda i=i, chat_id=chat_id: bot.send_message(chat_id, f"flood {i}"), priority=BULK
+            ))
+    await asyncio.gather(*futures, return_exceptions=True)
+    api.flood_every = 0
+
+    delivered = Counter()
+    for chat_id in chat_ids:
+        inbox = api.inbox(chat_id)
+        while not inbox.empty():
+            _, method, params, _ = inbox.get_nowait()
+            if method == "sendmessage" and params["text"].startswith("flood "):
+                delivered[params["text"]] += 1
+    duplicates = sum(count - 1 for count in delivered.values())
+    return len(delivered), messages - len(delivered), duplicates
+
+
+async def check_fairness(sender, bot, backlog=FAIRNESS_BACKLOG):
+    """Задержка сообщения в другой чат, пока в один чат стоит длинная рассылка, с."""
+    from core.sender import BULK
+
+    busy_chat, other_chat = FAIRNESS_CHATS
+    futures = [
+        sender.submit(busy_chat, lambda i=i: bot.send_message(busy_chat, f"backlog {i}"), priority=BULK)
+        for i in range(backlog)
+    ]
+    began = time.perf_counter()
+    await sender.submit(other_chat, lambda: bot.send_message(other_chat, "other"), priority=BULK)
+    waited = time.perf_counter() - began
+    await asyncio.gather(*futures, return_exceptions=True)
+    return waited
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--cars", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=0, help="0 - все пользователи сразу")
+    parser.add_argument("--timeout", type=float, default=10, help="ожидание ответа на шаг, с")
+    parser.add_argument("--max-p95-ms", type=float, help="порог p95 всех шагов для CI")
+    parser.add_argument("--flood-messages", type=int, default=200, help="0 - без проверки 429")
+    parser.add_argument("--flood-every", type=int, default=5)
+    args = parser.parse_args()
+
+    config.TELEGRAM_API_URL = await api.start()
+
+    from aiogram import Dispatcher
+    from core.database.models import async_main, dispose_engines, engine, read_engine
+    from core.handlers import router
+    from core.metrics import metrics
+    from core.middlewares import setup_metrics, setup_user_identity
+    from core.sender import sender, setup_outbound
+    from core.storage import storage
+    from core.utils import bot
+    import core.database.requests as rq
+
+    await async_main()
+    await seed(args.cars)
+    await rq.rebuild_occupancy()
+    await rq.rebuild_facets()
+
+    dp = Dispatcher(storage=storage)
+    dp.include_router(router)
+    setup_metrics(dp, router, engine, read_engine)
+    setup_user_identity(dp)
+    setup_outbound(bot)
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False))
+
+    # Каждая машина бронируется на свои непересекающиеся двухдневные периоды
+    tomorrow = date.today() + timedelta(days=1)
+    users = [
+        VirtualUser(
+            user_id=100_000 + i,
+            car_id=i % args.cars + 1,
+            start_date=tomorrow + timedelta(days=i // args.cars * 3),
+            timeout=args.timeout,
+        )
+        for i in range(args.users)
+    ]
+    limit = asyncio.Semaphore(args.concurrency or args.users)
+
+    async def run(user):
+        async with limit:
+            await user.run()
+
+    began = time.perf_counter()
+    results = await asyncio.gather(*(run(user) for user in users), return_exceptions=True)
+    elapsed = time.perf_counter() - began
+
+    await dp.stop_polling()
+    await polling
+    flood = None
+    if args.flood_messages:
+        began_flood = time.perf_counter()
+        flood = await check_flood_control(
+            sender, bot, [user.user_id for user in users], args.flood_messages, args.flood_every
+        )
+        flood_elapsed = time.perf_counter() - began_flood
+    fairness_wait = await check_fairness(sender, bot)
+    await sender.close()
+    await storage.close()
+    await dispose_engines()
+    await api.stop()
+
+    failures = [r for r in results if isinstance(r, Exception)]
+    for failure in failures[:5]:
+        print(f"error: {failure!r}")
+
+    updates = sum(len(values) for values in latencies.values())
+    print(f"users: {args.users}, failed: {len(failures)}, updates: {updates}")
+    print(f"throughput: {updates / elapsed:.0f} updates/s in {elapsed:.2f} s")
+    queries = metrics.update_queries
+    print(f"db queries per update: {queries.sum / max(queries.count, 1):.2f}")
+    if flood:
+        delivered, lost, duplicates = flood
+        print(
+            f"flood control: {api.rate_limited} x 429, delivered {delivered}/{args.flood_messages} "
+            f"in {flood_elapsed:.2f} s, lost {lost}, duplicates {duplicates}"
+        )
+    print(f"fairness: other chat waited {fairness_wait * 1000:.0f} ms behind {FAIRNESS_BACKLOG} queued messages")
+    print()
+    print(f"{'step':<14} {'p50, ms':>9} {'p95, ms':>9} {'p99, ms':>9}")
+    all_latencies = []
+    for name, values in latencies.items():
+        all_latencies += values
+        print(
+            f"{name:<14} {percentile(values, 0.5) * 1000:>9.1f} "
+            f"{percentile(values, 0.95) * 1000:>9.1f} {percentile(values, 0.99) * 1000:>9.1f}"
+        )
+    if not all_latencies:
+        return 1
+    p95 = percentile(all_latencies, 0.95) * 1000
+    print(
+        f"{'all':<14} {percentile(all_latencies, 0.5) * 1000:>9.1f} "
+        f"{p95:>9.1f} {percentile(all_latencies, 0.99) * 1000:>9.1f}"
+    )
+
+    if failures:
+        return 1
+    if flood and (flood[1] or flood[2]):
+        return 1
+    if fairness_wait > FAIRNESS_MAX_WAIT:
+        print(f"сообщение в свободный чат ждало {fairness_wait:.2f} s")
+        return 1
+    if args.max_p95_ms is not None and p95 > args.max_p95_ms:
+        print(f"p95 {p95:.1f} ms выше порога {args.max_p95_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,175 @@
+"""Планировщик напоминаний: память, отмена и перезапуск.
+
+База заполняется напрямую через sqlite3: --reminders напоминаний, из них
+--due уже наступивших. Замеряются загрузка всех напоминаний в память
+(время и прирост RssAnon), стоимость отмены и добавления, затем доставка
+наступивших с остановкой посередине: первый планировщик останавливается,
+а два новых, как два процесса с общей базой, загружают напоминания заново
+и досылают остальные. Каждое наступившее напоминание должно прийти ровно
+один раз. Отправка подменяется счётчиком, чтобы не упираться в лимиты
+Telegram.
+
+Запуск: python -m bench.reminders [--reminders 1000000] [--due 5000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import types
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+# Бот читает настройки из config.py, для замера подставляем свои
+config = types.ModuleType("config")
+config.TELEGRAM_BOT_TOKEN = "123456:BENCH"
+config.PAYMENTS_TOKEN = "123:TEST:bench"
+config.ADMIN_IDS = []
+sys.modules["config"] = config
+
+from core.database.models import async_main, dispose_engines
+import core.reminders as reminders
+from core.timers import TimerWheel
+
+USERS = 1000
+CARS = 100
+OPS = 100_000
+
+
+def anon_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+def due_at(reminder_id, due, now):
+    # Наступившие - минуту назад, остальные - раз в день в 9:00 на год вперёд
+    if reminder_id <= due:
+        return now - timedelta(minutes=1)
+    return datetime.combine(now.date() + timedelta(days=1 + reminder_id % 365), datetime.min.time()) + timedelta(hours=9)
+
+
+def seed(count, due, now):
+    db = sqlite3.connect("db.sqlite3")
+    db.executemany(
+        "INSERT INTO users (tg_id, name) VALUES (?, ?)",
+        ((1_000_000 + i, f"Клиент {i}") for i in range(USERS)),
+    )
+    db.executemany(
+        "INSERT INTO cars (brand, model, type, description, price_per_day, is_available, image_url) "
+        "VALUES ('Toyota', ?, 'sedan', '', 2000, 1, '')",
+        ((f"Camry {i}",) for i in range(CARS)),
+    )
+    start = date.today() + timedelta(days=30)
+    db.executemany(
+        "INSERT INTO bookings (user_id, car_id, start_date, end_date, total_price, payment_status) "
+        "VALUES (?, ?, ?, ?, 4000, 'completed')",
+        ((i % USERS + 1, i % CARS + 1, start.isoformat(), (start + timedelta(days=1)).isoformat())
+         for i in range(count // 2)),
+    )
+    db.executemany(
+        "INSERT INTO reminders (id, booking_id, kind, due_at) VALUES (?, ?, ?, ?)",
+        ((i, (i - 1) // 2 + 1, ("start", "end")[i % 2], due_at(i, due, now).isoformat(" "))
+         for i in range(1, count + 1)),
+    )
+    db.commit()
+    db.close()
+
+
+class FakeBot:
+    def __init__(self):
+        self.delivered = Counter()
+
+    async def send_message(self, chat_id, text):
+        await asyncio.sleep(0)
+        self.delivered[text] += 1
+
+
+class FakeSender:
+    def submit(self, chat_id, call, priority=None):
+        return asyncio.ensure_future(call())
+
+
+async def measure(coro):
+    """Время выполнения и пиковый прирост RssAnon в МБ."""
+    baseline = peak = anon_rss_mb()
+    task = asyncio.ensure_future(coro)
+    began = time.perf_counter()
+    while not task.done():
+        await asyncio.wait([task], timeout=0.05)
+        peak = max(peak, anon_rss_mb())
+    return task.result(), time.perf_counter() - began, peak - baseline
+
+
+async def deliver_until(schedulers, done, timeout=60):
+    tasks = [asyncio.create_task(scheduler.run()) for scheduler in schedulers]
+    deadline = time.monotonic() + timeout
+    while not done() and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reminders", type=int, default=1_000_000)
+    parser.add_argument("--due", type=int, default=5000)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    await async_main()
+    seed(args.reminders, args.due, now)
+
+    bot = FakeBot()
+    reminders.bot = bot
+    reminders.sender = FakeSender()
+    # Текст должен различать напоминания, чтобы посчитать повторы
+    reminders.reminder_text = lambda reminder: str(reminder.id)
+
+    scheduler = reminders.ReminderScheduler(TimerWheel())
+    _, elapsed, memory = await measure(scheduler.load())
+    print(f"load {len(scheduler.wheel)} reminders: {elapsed:.2f} s, RssAnon +{memory:.0f} MB")
+
+    wheel = scheduler.wheel
+    ids = random.Random(0).sample(range(args.due + 1, args.reminders + 1), min(OPS, args.reminders - args.due))
+    began = time.perf_counter()
+    for reminder_id in ids:
+        wheel.cancel(reminder_id, due_at(reminder_id, args.due, now))
+    cancel_us = (time.perf_counter() - began) / len(ids) * 1e6
+    began = time.perf_counter()
+    for reminder_id in ids:
+        wheel.add(reminder_id, due_at(reminder_id, args.due, now))
+    add_us = (time.perf_counter() - began) / len(ids) * 1e6
+    print(f"cancel: {cancel_us:.2f} us, add: {add_us:.2f} us")
+
+    # Первый планировщик останавливается на середине, два новых начинают с базы
+    due_ids = set(range(1, args.due + 1))
+    await deliver_until([scheduler], lambda: sum(bot.delivered.values()) >= args.due // 2)
+    first = sum(bot.delivered.values())
+    restarted = [reminders.ReminderScheduler(TimerWheel()) for _ in range(2)]
+    await asyncio.gather(*(scheduler.load() for scheduler in restarted))
+    await deliver_until(restarted, lambda: len(bot.delivered) >= args.due)
+
+    delivered = set(map(int, bot.delivered))
+    duplicates = sum(count - 1 for count in bot.delivered.values())
+    missing = len(due_ids - delivered)
+    early = len(delivered - due_ids)
+    print(
+        f"due {args.due}: before stop {first}, after restart {len(delivered) - first + duplicates}, "
+        f"duplicates {duplicates}, missing {missing}, sent early {early}"
+    )
+    print(f"pending after delivery: {', '.join(str(len(scheduler.wheel)) for scheduler in restarted)}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
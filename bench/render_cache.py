@@ -0,0 +1,71 @@
+"""Процессорное время на один callback каталога с кэшем рендеринга и без него.
+
+Запуск: python -m bench.render_cache [--cars 1000]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import insert
+
+from core.database.models import async_main, async_session, dispose_engines, Car
+from core.render import render_cache, render_cars_page, render_car_details
+
+ROUNDS = 2000
+
+
+async def seed(count):
+    rows = [
+        {
+            "brand": "Toyota",
+            "model": f"Camry {i}",
+            "type": ("sedan", "suv")[i % 2],
+            "description": "Комфортный автомобиль",
+            "price_per_day": 2000 + i,
+            "is_available": True,
+            "image_url": "",
+        }
+        for i in range(count)
+    ]
+    async with async_session() as session:
+        await session.execute(insert(Car), rows)
+        await session.commit()
+
+
+async def callback_cost(render, *args, cached):
+    began = time.process_time()
+    for _ in range(ROUNDS):
+        if not cached:
+            render_cache._items.clear()
+        await render(*args)
+    return (time.process_time() - began) / ROUNDS * 1_000_000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cars", type=int, default=1000)
+    args = parser.parse_args()
+
+    await async_main()
+    await seed(args.cars)
+
+    cases = {
+        "filter page": (render_cars_page, "sedan"),
+        "car details": (render_car_details, 1),
+    }
+    print(f"{'callback':<14} {'no cache, us':>14} {'cached, us':>12}")
+    for name, (render, *render_args) in cases.items():
+        cold = await callback_cost(render, *render_args, cached=False)
+        warm = await callback_cost(render, *render_args, cached=True)
+        print(f"{name:<14} {cold:>14.1f} {warm:>12.1f}")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,113 @@
+"""Память и время выгрузки отчёта по броням.
+
+База заполняется напрямую через sqlite3, затем отчёт выгружается так же,
+как это делает /report. Память меряется по RssAnon: страницы файла базы,
+отображённые через mmap, в неё не входят, так как это кэш ОС, а не куча
+процесса. С --naive после этого выполняется загрузка всех броней
+через get_all_bookings для сравнения.
+
+Запуск: python -m bench.report_export [--bookings 1000000] [--status completed] [--naive]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from core.database.models import async_main, dispose_engines
+import core.database.requests as rq
+from core.reports import export_bookings
+
+CARS = 200
+USERS = 10_000
+
+
+def anon_rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) / 1024
+    return 0
+
+
+async def measure(coro):
+    """Время выполнения и пиковый прирост RssAnon в МБ."""
+    baseline = peak = anon_rss_mb()
+    task = asyncio.ensure_future(coro)
+    began = time.perf_counter()
+    while not task.done():
+        await asyncio.wait([task], timeout=0.05)
+        peak = max(peak, anon_rss_mb())
+    return task.result(), time.perf_counter() - began, peak - baseline
+
+
+def seed(bookings):
+    db = sqlite3.connect("db.sqlite3")
+    db.executemany(
+        "INSERT INTO users (tg_id, name, phone) VALUES (?, ?, '+70000000000')",
+        ((1_000_000 + i, f"Клиент {i}") for i in range(USERS)),
+    )
+    db.executemany(
+        "INSERT INTO cars (brand, model, type, description, price_per_day, is_available, image_url) "
+        "VALUES ('Toyota', ?, 'sedan', '', 2000, 1, '')",
+        ((f"Camry {i}",) for i in range(CARS)),
+    )
+    start = date(2020, 1, 1)
+    statuses = ("completed", "confirmed", "cancelled", "failed")
+    db.executemany(
+        "INSERT INTO bookings (user_id, car_id, start_date, end_date, total_price, payment_status) "
+        "VALUES (?, ?, ?, ?, 6000, ?)",
+        (
+            (
+                i % USERS + 1,
+                i % CARS + 1,
+                start + timedelta(days=i % 1800),
+                start + timedelta(days=i % 1800 + 3),
+                statuses[i % len(statuses)],
+            )
+            for i in range(bookings)
+        ),
+    )
+    db.commit()
+    db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bookings", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=("csv", "xlsx"), default="csv")
+    parser.add_argument("--status")
+    parser.add_argument("--naive", action="store_true")
+    args = parser.parse_args()
+
+    await async_main()
+    seed(args.bookings)
+
+    (path, count), elapsed, memory = await measure(
+        export_bookings(date(2000, 1, 1), date(2100, 1, 1), args.status, args.format)
+    )
+    print(
+        f"export: {count} rows in {elapsed:.1f} s, "
+        f"{os.path.getsize(path) / 1024 / 1024:.1f} MB file ({os.path.basename(path)}), "
+        f"RssAnon +{memory:.1f} MB"
+    )
+    os.remove(path)
+
+    if args.naive:
+        async def load_all():
+            async with rq.session_for_read() as session:
+                return await rq.get_all_bookings(session)
+
+        bookings, elapsed, memory = await measure(load_all())
+        print(f"get_all_bookings: {len(bookings)} rows in {elapsed:.1f} s, RssAnon +{memory:.1f} MB")
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
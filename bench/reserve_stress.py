@@ -0,0 +1,80 @@
+"""Нагрузочная проверка reserve_car: конкурентные брони одного автомобиля.
+
+Запуск: python -m bench.reserve_stress [--processes 4] [--requests 200]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from datetime import date, timedelta
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+CAR_ID = 1
+
+
+async def worker(requests, seed):
+    import core.database.requests as rq
+    from core.database.models import dispose_engines
+
+    rnd = random.Random(seed)
+    base = date.today() + timedelta(days=1)
+
+    async def one():
+        start = base + timedelta(days=rnd.randrange(60))
+        end = start + timedelta(days=rnd.randrange(1, 5))
+        booking, conflicts = await rq.reserve_car(1, CAR_ID, start, end, 100)
+        return booking is not None
+
+    results = await asyncio.gather(*(one() for _ in range(requests)))
+    await dispose_engines()
+    return sum(results)
+
+
+async def create_schema():
+    from core.database.models import async_main, dispose_engines
+
+    await async_main()
+    await dispose_engines()
+
+
+def run_process(requests, seed):
+    return asyncio.run(worker(requests, seed))
+
+
+async def check_overlaps():
+    import core.database.requests as rq
+    from core.database.models import dispose_engines
+
+    bookings = sorted(await rq.get_car_booking(CAR_ID), key=lambda b: b.start_date)
+    overlaps = sum(
+        1 for prev, cur in zip(bookings, bookings[1:]) if cur.start_date <= prev.end_date
+    )
+    await dispose_engines()
+    return len(bookings), overlaps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(create_schema())
+    with multiprocessing.Pool(args.processes) as pool:
+        created = pool.starmap(
+            run_process, [(args.requests, seed) for seed in range(args.processes)]
+        )
+    total, overlaps = asyncio.run(check_overlaps())
+    print(f"attempts: {args.processes * args.requests}, reserved: {sum(created)}")
+    print(f"bookings in db: {total}, overlaps: {overlaps}")
+    if overlaps:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Задержка полнотекстового поиска по каталогу.
+
+cold - поиск страницы по cars_names_fts и cars_fts без кэша, cached -
+search_cars с кэшем показанных страниц. Печатает p50/p95/max по каждому виду запроса.
+Перед замером проверяется, что машина с маркой из запроса стоит первой, даже
+если слово раньше встречается в описаниях сотен других машин.
+
+Запуск: python -m bench.search [--cars 100000] [--rounds 200]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+os.chdir(tempfile.mkdtemp())
+
+from sqlalchemy import insert
+
+from core.database.models import async_main, async_session, dispose_engines, Car
+import core.database.requests as rq
+
+TYPES = ("sedan", "suv", "hatchback")
+BRANDS = ("Toyota", "Kia", "Hyundai", "BMW", "Лада", "Škoda", "Volkswagen", "Mercedes")
+MODELS = ("Camry", "Rio", "Solaris", "X5", "Веста", "Octavia", "Polo", "E200")
+QUERIES = {
+    "brand": ("toyota", "kia", "лада", "skoda"),
+    "prefix": ("camr", "sol", "вес", "oct"),
+    "brand+model": ("toyota camry", "лада веста", "kia rio"),
+    "exact model": ("camry 12345", "rio 777", "polo 99999"),
+    "broad": ("7 мест", "автомат", "suv"),
+    "miss": ("ferrari", "zzz"),
+}
+
+
+# Слово из описаний RELEVANCE_DECOYS машин и марка машины, добавленной последней
+RELEVANCE_WORD = "Lamborghini"
+RELEVANCE_DECOYS = 300
+
+
+async def seed(count):
+    rnd = random.Random(0)
+    rows = [
+        {
+            "brand": rnd.choice(BRANDS),
+            "model": f"{rnd.choice(MODELS)} {i}",
+            "type": TYPES[i % len(TYPES)],
+            "description": f"{rnd.choice((5, 7))} мест, {rnd.choice(('автомат', 'механика'))}",
+            "price_per_day": rnd.randrange(1000, 20000),
+            "is_available": True,
+            "image_url": "",
+        }
+        for i in range(count)
+    ]
+    rows += [
+        {
+            "brand": "Kia", "model": f"Rio {i}", "type": "sedan",
+            "description": f"не {RELEVANCE_WORD}", "price_per_day": 1000,
+            "is_available": True, "image_url": "",
+        }
+        for i in range(RELEVANCE_DECOYS)
+    ]
+    rows.append({
+        "brand": RELEVANCE_WORD, "model": "Huracan", "type": "sedan", "description": "",
+        "price_per_day": 50000, "is_available": True, "image_url": "",
+    })
+    async with async_session() as session:
+        for start in range(0, len(rows), 10_000):
+            await session.execute(insert(Car), rows[start:start + 10_000])
+        await session.commit()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return (
+        samples[len(samples) // 2] * 1000,
+        samples[int(len(samples) * 0.95)] * 1000,
+        samples[-1] * 1000,
+    )
+
+
+async def measure(search, queries, rounds):
+    samples = []
+    for i in range(rounds):
+        query = queries[i % len(queries)]
+        began = time.perf_counter()
+        await search(query)
+        samples.append(time.perf_counter() - began)
+    return percentiles(samples)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cars", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    await async_main()
+    began = time.perf_counter()
+    await seed(args.cars)
+    print(f"insert {args.cars} cars with FTS triggers: {time.perf_counter() - began:.1f} s")
+    await rq.catalog_cache.get()
+
+    found = await rq.search_cars(RELEVANCE_WORD.lower(), limit=20)
+    assert found and found[0].brand == RELEVANCE_WORD, [car.brand for car in found[:3]]
+    total = 0
+    while await rq.search_cars(RELEVANCE_WORD.lower(), limit=50, offset=total):
+        total += 50
+    assert total > RELEVANCE_DECOYS, total
+    print(f"relevance: brand match first among {RELEVANCE_DECOYS + 1} matches")
+
+    async def search(query):
+        await rq.search_cars(query, limit=20)
+
+    cache = rq.search_cache
+
+    print(f"{'query':>12} {'cold p50/p95/max, ms':>22} {'cached p50/p95/max, ms':>24}")
+    for name, queries in QUERIES.items():
+        # Кэш нулевого размера ничего не хранит
+        rq.search_cache = rq.SearchCache(max_size=0)
+        cold_ms = await measure(search, queries, args.rounds)
+        rq.search_cache = cache
+        cached_ms = await measure(search, queries, args.rounds)
+        print(
+            f"{name:>12} {'/'.join(f'{v:.2f}' for v in cold_ms):>22} "
+            f"{'/'.join(f'{v:.3f}' for v in cached_ms):>24}"
+        )
+    await dispose_engines()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
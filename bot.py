@@ -1,22 +1,100 @@
+import argparse
 import asyncio
 import logging
-from aiogram import Bot, Dispatcher
+from aiogram import Dispatcher
 from core.handlers import router
-from core.database.models import async_main
-from config import TELEGRAM_BOT_TOKEN
+from core.database.models import async_main, dispose_engines, engine, read_engine
+from core.metrics import start_metrics_server
+from core.middlewares import setup_metrics, setup_throttling, setup_user_identity
+from core.profiler import LoopLagMonitor
+from core.holds import sweeper
+from core.reminders import scheduler
+from core.storage import storage
+from core.webhook import run_webhook
+from core.sender import sender, setup_outbound
+from core.utils import bot
+import core.database.requests as rq
+import config
 
 
-async def main():
+async def main(args):
     await async_main()
-    bot = Bot(token=TELEGRAM_BOT_TOKEN)
-    dp = Dispatcher()
+    # Кэши прогреваются, пока устанавливается соединение с Telegram;
+    # bot.me() запоминает ответ, и polling не запрашивает его повторно
+    await asyncio.gather(
+        bot.me(),
+        rq.catalog_cache.get(),
+        rq.rebuild_occupancy(),
+        rq.rebuild_facets(),
+        sweeper.load(),
+        scheduler.load(),
+    )
+    sweeper_task = asyncio.create_task(sweeper.run())
+    reminder_task = asyncio.create_task(scheduler.run())
+    lag_monitor = None
+    if args.loop_lag_ms:
+        lag_monitor = LoopLagMonitor(threshold=args.loop_lag_ms / 1000)
+        lag_monitor.start()
+    dp = Dispatcher(storage=storage)
     dp.include_router(router)
-    await dp.start_polling(bot)
+    setup_metrics(dp, router, engine, read_engine)
+    setup_throttling(dp, exempt_ids=config.ADMIN_IDS)
+    setup_user_identity(dp)
+    setup_outbound(bot)
+    metrics_runner = None
+    if args.metrics_port:
+        metrics_runner = await start_metrics_server(args.host, args.metrics_port)
+    try:
+        if args.mode == "webhook":
+            await run_webhook(
+                dp,
+                bot,
+                host=args.host,
+                port=args.port,
+                path=args.path,
+                workers=args.workers,
+                queue_size=args.queue_size,
+                secret_token=args.secret or getattr(config, "WEBHOOK_SECRET", None),
+                webhook_url=getattr(config, "WEBHOOK_URL", None),
+            )
+        else:
+            await dp.start_polling(bot)
+    finally:
+        sweeper_task.cancel()
+        reminder_task.cancel()
+        # Планировщик при отмене возвращает в таблицу забранные, но не
+        # отправленные напоминания: ждём его до закрытия очереди и базы
+        await asyncio.gather(sweeper_task, reminder_task, return_exceptions=True)
+        await sender.close()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if lag_monitor:
+            await lag_monitor.stop()
+        await dispose_engines()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Car booking bot")
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--path", default="/webhook")
+    parser.add_argument("--workers", type=int, default=8, help="число параллельных обработчиков")
+    parser.add_argument("--queue-size", type=int, default=100, help="размер очереди обработчика")
+    parser.add_argument("--secret", help="секретный токен вебхука")
+    parser.add_argument("--metrics-port", type=int, help="порт HTTP-сервера метрик Prometheus")
+    parser.add_argument(
+        "--loop-lag-ms",
+        type=int,
+        default=100,
+        help="логировать блокировки цикла событий дольше порога, 0 - выключить",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
     try:
         logging.basicConfig(level=logging.INFO)
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         print("Bot off")
@@ -0,0 +1,189 @@
+"""Данные inline-кнопок: компактный формат с версией и таблица обработчиков.
+
+callback_data имеет вид <версия><код действия><поле>:<поле>..., например
+"1c2s" - карточка машины 100. Целые числа записываются в base36, даты - как
+порядковый номер дня в base36, суммы - в копейках. Telegram ограничивает
+callback_data 64 байтами, pack проверяет длину при создании кнопки.
+
+Все нажатия проходят через один обработчик aiogram, который находит функцию
+по коду действия в словаре, поэтому маршрутизация не зависит от числа
+кнопок. Кнопки старого формата ("car_5", "filter_all") из уже отправленных
+сообщений разбираются как версия 0.
+"""
+import inspect
+import logging
+from datetime import date
+from decimal import Decimal
+
+from aiogram.types import CallbackQuery
+
+VERSION = "1"
+MAX_LENGTH = 64
+SEPARATOR = ":"
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def to_base36(number):
+    if number < 0:
+        return "-" + to_base36(-number)
+    digits = []
+    while True:
+        number, rest = divmod(number, 36)
+        digits.append(DIGITS[rest])
+        if not number:
+            return "".join(reversed(digits))
+
+
+def _pack_str(value):
+    if SEPARATOR in value:
+        raise ValueError(f"Separator {SEPARATOR!r} in callback field {value!r}")
+    return value
+
+
+# Тип поля -> (упаковка, распаковка)
+FIELD_TYPES = {
+    int: (to_base36, lambda text: int(text, 36)),
+    str: (_pack_str, str),
+    date: (lambda day: to_base36(day.toordinal()), lambda text: date.fromordinal(int(text, 36))),
+    Decimal: (lambda amount: to_base36(int(Decimal(str(amount)) * 100)), lambda text: Decimal(int(text, 36)) / 100),
+}
+
+ACTIONS = {}
+
+
+class Action:
+    """Вид кнопки: однобуквенный код и типы полей."""
+
+    def __init__(self, name, code, *fields):
+        if code in ACTIONS:
+            raise ValueError(f"Callback code {code!r} is already used by {ACTIONS[code].name}")
+        self.name = name
+        self.code = code
+        self.fields = fields
+        self._packers = [FIELD_TYPES[field][0] for field in fields]
+        self._parsers = [FIELD_TYPES[field][1] for field in fields]
+        ACTIONS[code] = self
+
+    def pack(self, *values):
+        if len(values) != len(self.fields):
+            raise TypeError(f"{self.name} expects {len(self.fields)} fields, got {len(values)}")
+        data = VERSION + self.code + SEPARATOR.join(
+            pack(value) for pack, value in zip(self._packers, values)
+        )
+        if len(data.encode()) > MAX_LENGTH:
+            raise ValueError(f"Callback data {data!r} is longer than {MAX_LENGTH} bytes")
+        return data
+
+    def unpack(self, payload):
+        parts = payload.split(SEPARATOR) if self.fields else []
+        if len(parts) != len(self.fields) or not self.fields and payload:
+            raise ValueError(f"Malformed {self.name} callback payload {payload!r}")
+        return tuple(parse(part) for parse, part in zip(self._parsers, parts))
+
+    def __repr__(self):
+        return f"Action({self.name!r})"
+
+
+def unpack(data):
+    """(действие, значения полей); ValueError для неизвестных данных."""
+    if data[:1] == VERSION:
+        action = ACTIONS.get(data[1:2])
+        if action is not None:
+            return action, action.unpack(data[2:])
+    legacy = _unpack_legacy(data)
+    if legacy is None:
+        raise ValueError(f"Unknown callback data {data!r}")
+    return legacy
+
+
+class CallbackTable:
+    """Обработчики inline-кнопок по коду действия.
+
+    Функция получает CallbackQuery, затем значения полей по порядку, затем
+    именованные аргументы aiogram (state, user и т.п.), которые объявлены
+    в её сигнатуре. state=... ограничивает кнопку состоянием FSM: в другом
+    состоянии нажатие просто подтверждается.
+    """
+
+    def __init__(self):
+        self._handlers = {}
+
+    def handler(self, action, state=None):
+        def decorator(func):
+            if action.code in self._handlers:
+                raise ValueError(f"{action.name} already has a handler")
+            names = list(inspect.signature(func).parameters)[1 + len(action.fields):]
+            self._handlers[action.code] = (func, state.state if state else None, names)
+            return func
+        return decorator
+
+    def _resolve(self, data):
+        try:
+            action, values = unpack(data or "")
+        except ValueError:
+            return None, ()
+        return self._handlers.get(action.code), values
+
+    def handler_name(self, callback):
+        entry, _ = self._resolve(callback.data)
+        return entry[0].__name__ if entry else "unknown_callback"
+
+    async def dispatch(self, callback: CallbackQuery, **data):
+        entry, values = self._resolve(callback.data)
+        if entry is None:
+            logging.warning(f"Unhandled callback data {callback.data!r}")
+            await callback.answer("Кнопка устарела, откройте меню заново")
+            return
+        func, state, names = entry
+        if state is not None and await data["state"].get_state() != state:
+            await callback.answer()
+            return
+        return await func(callback, *values, **{name: data[name] for name in names})
+
+
+# Кнопки бота. Коды не меняются и не используются повторно: они уже есть
+# в отправленных сообщениях
+FILTER = Action("filter", "f", str)
+PAGE = Action("page", "p", str, Decimal, int, str)  # направление, цена и id курсора, фильтр
+FREE_DATES = Action("free_dates", "F")
+BACK_TO_CATALOG = Action("back_to_catalog", "k")
+CAR = Action("car", "c", int)
+BOOK = Action("book", "b", int)
+CALENDAR = Action("calendar", "m", int, int, int)  # машина, год, месяц
+DAY = Action("day", "d", int, date)
+IGNORE = Action("ignore", "i")
+CONFIRM_BOOKING = Action("confirm_booking", "y")
+CANCEL_BOOKING = Action("cancel_booking", "n")
+
+# Версия 0: строки вида <действие>_<поля через _>
+_LEGACY_EXACT = {
+    "free_dates": FREE_DATES,
+    "back_to_catalog": BACK_TO_CATALOG,
+    "ignore": IGNORE,
+    "confirm_booking": CONFIRM_BOOKING,
+    "cancel_booking": CANCEL_BOOKING,
+}
+
+
+def _unpack_legacy(data):
+    action = _LEGACY_EXACT.get(data)
+    if action is not None:
+        return action, ()
+    prefix, _, rest = data.partition("_")
+    try:
+        if prefix == "filter":
+            return FILTER, (rest,)
+        if prefix in ("car", "book"):
+            return CAR if prefix == "car" else BOOK, (int(rest),)
+        if prefix == "cal":
+            car_id, year, month = rest.split("_")
+            return CALENDAR, (int(car_id), int(year), int(month))
+        if prefix == "day":
+            car_id, ordinal = rest.split("_")
+            return DAY, (int(car_id), date.fromordinal(int(ordinal)))
+        if prefix == "page":
+            direction, cents, car_id, filter_type = rest.split("_", 3)
+            return PAGE, (direction, Decimal(cents) / 100, int(car_id), filter_type)
+    except ValueError:
+        return None
+    return None
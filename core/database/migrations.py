@@ -0,0 +1,153 @@
+import logging
+
+from sqlalchemy import text
+
+# Номер последней применённой миграции хранится в schema_version. Если он
+# совпадает с последним шагом, запуск ограничивается одним запросом.
+#
+# Первый шаг создаёт схему по текущим моделям, поэтому на новой базе все
+# последующие шаги должны ничего не менять: колонки добавляются только при
+# их отсутствии, индексы и таблицы - с IF NOT EXISTS / checkfirst.
+
+SCHEMA_VERSION_TABLE = (
+    "CREATE TABLE IF NOT EXISTS schema_version ("
+    "version INTEGER PRIMARY KEY, description TEXT, "
+    "applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+)
+
+
+async def _columns(conn, table):
+    result = await conn.execute(text(f"PRAGMA table_info({table})"))
+    return {row[1] for row in result}
+
+
+async def create_schema(conn, metadata):
+    # Базы, созданные до появления версий, уже содержат таблицы: create_all
+    # их не трогает, а недостающее добавляют следующие шаги
+    await conn.run_sync(metadata.create_all)
+
+
+async def add_booking_holds(conn, metadata):
+    if "expires_at" not in await _columns(conn, "bookings"):
+        await conn.execute(text("ALTER TABLE bookings ADD COLUMN expires_at DATETIME"))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_booking_car_dates "
+        "ON bookings (car_id, start_date, end_date)"
+    ))
+    await conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS idx_booking_hold_expiry "
+        "ON bookings (payment_status, expires_at)"
+    ))
+
+
+async def fix_booking_user_ids(conn, metadata):
+    # Раньше в bookings.user_id записывался Telegram id вместо users.id
+    await conn.execute(text(
+        "UPDATE bookings SET user_id = "
+        "(SELECT users.id FROM users WHERE users.tg_id = bookings.user_id) "
+        "WHERE user_id NOT IN (SELECT id FROM users) "
+        "AND user_id IN (SELECT tg_id FROM users)"
+    ))
+
+
+async def add_daily_stats(conn, metadata):
+    # Модуль сводок импортирует модели, а модели - этот модуль
+    from core.database.stats import backfill
+
+    for name in ("car_daily_stats", "type_daily_stats"):
+        await conn.run_sync(metadata.tables[name].create, checkfirst=True)
+    await backfill(conn)
+
+
+# Полнотекстовый поиск по машинам. Таблица FTS5 хранит только индекс, текст
+# берётся из cars; триггеры обновляют индекс при любой записи в cars, в том
+# числе из других процессов. prefix ускоряет поиск по началу слова
+CARS_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cars_fts USING fts5("
+    "brand, model, type, description, content='cars', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER IF NOT EXISTS cars_fts_insert AFTER INSERT ON cars BEGIN "
+    "INSERT INTO cars_fts (rowid, brand, model, type, description) "
+    "VALUES (new.id, new.brand, new.model, new.type, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS cars_fts_delete AFTER DELETE ON cars BEGIN "
+    "INSERT INTO cars_fts (cars_fts, rowid, brand, model, type, description) "
+    "VALUES ('delete', old.id, old.brand, old.model, old.type, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS cars_fts_update "
+    "AFTER UPDATE OF brand, model, type, description ON cars BEGIN "
+    "INSERT INTO cars_fts (cars_fts, rowid, brand, model, type, description) "
+    "VALUES ('delete', old.id, old.brand, old.model, old.type, old.description); "
+    "INSERT INTO cars_fts (rowid, brand, model, type, description) "
+    "VALUES (new.id, new.brand, new.model, new.type, new.description); END",
+)
+
+
+async def add_car_search(conn, metadata):
+    for statement in CARS_FTS:
+        await conn.execute(text(statement))
+    await conn.execute(text("INSERT INTO cars_fts (cars_fts) VALUES ('rebuild')"))
+
+
+# Отдельный индекс названий: в нём нет слов из описаний, поэтому поиск по
+# марке, модели и типу не перебирает совпадения в описаниях
+CARS_NAMES_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS cars_names_fts USING fts5("
+    "brand, model, type, content='cars', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')",
+    "CREATE TRIGGER IF NOT EXISTS cars_names_fts_insert AFTER INSERT ON cars BEGIN "
+    "INSERT INTO cars_names_fts (rowid, brand, model, type) "
+    "VALUES (new.id, new.brand, new.model, new.type); END",
+    "CREATE TRIGGER IF NOT EXISTS cars_names_fts_delete AFTER DELETE ON cars BEGIN "
+    "INSERT INTO cars_names_fts (cars_names_fts, rowid, brand, model, type) "
+    "VALUES ('delete', old.id, old.brand, old.model, old.type); END",
+    "CREATE TRIGGER IF NOT EXISTS cars_names_fts_update "
+    "AFTER UPDATE OF brand, model, type ON cars BEGIN "
+    "INSERT INTO cars_names_fts (cars_names_fts, rowid, brand, model, type) "
+    "VALUES ('delete', old.id, old.brand, old.model, old.type); "
+    "INSERT INTO cars_names_fts (rowid, brand, model, type) "
+    "VALUES (new.id, new.brand, new.model, new.type); END",
+)
+
+
+async def add_car_names_search(conn, metadata):
+    for statement in CARS_NAMES_FTS:
+        await conn.execute(text(statement))
+    await conn.execute(text("INSERT INTO cars_names_fts (cars_names_fts) VALUES ('rebuild')"))
+
+
+async def add_reminders(conn, metadata):
+    from core.database.reminders import backfill
+
+    await conn.run_sync(metadata.tables["reminders"].create, checkfirst=True)
+    await backfill(conn)
+
+
+# Шаги применяются по порядку; номер шага - его позиция в списке начиная с 1.
+# Существующие шаги не меняются, изменения схемы добавляются новыми шагами
+MIGRATIONS = [
+    ("initial schema", create_schema),
+    ("booking holds: expires_at and indexes", add_booking_holds),
+    ("bookings.user_id refers to users.id", fix_booking_user_ids),
+    ("daily revenue and occupancy stats", add_daily_stats),
+    ("full-text search over cars", add_car_search),
+    ("booking reminders", add_reminders),
+    ("full-text search over car names", add_car_names_search),
+]
+
+
+async def migrate(engine, metadata):
+    async with engine.begin() as conn:
+        await conn.execute(text(SCHEMA_VERSION_TABLE))
+        current = await conn.scalar(text("SELECT max(version) FROM schema_version")) or 0
+        if current >= len(MIGRATIONS):
+            return current
+
+        for version, (description, step) in enumerate(MIGRATIONS, start=1):
+            if version <= current:
+                continue
+            logging.info(f"Applying migration {version}: {description}")
+            await step(conn, metadata)
+            await conn.execute(
+                text("INSERT INTO schema_version (version, description) VALUES (:v, :d)"),
+                {"v": version, "d": description},
+            )
+    return len(MIGRATIONS)
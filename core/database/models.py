@@ -1,9 +1,10 @@
-from datetime import datetime
+from datetime import date, datetime
 
 from sqlalchemy.ext.asyncio import AsyncAttrs, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 from sqlalchemy import (
+    event,
     Column,
     Integer,
     String,
@@ -15,11 +16,59 @@ from sqlalchemy import (
     DateTime,
     Enum,
     Index,
+    PrimaryKeyConstraint,
 )
 
-engine = create_async_engine(url="sqlite+aiosqlite:///db.sqlite3")
+from core.database.migrations import migrate
+
+DATABASE_PATH = "db.sqlite3"
+
+# Настройки соединений SQLite. WAL позволяет читать во время записи,
+# synchronous=NORMAL в режиме WAL не теряет согласованность при сбое
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    "cache_size": -16000,  # в КиБ
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+def _set_pragmas(sync_engine, pragmas):
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def create_engines(path=DATABASE_PATH, pragmas=SQLITE_PRAGMAS, read_pool_size=4):
+    """Движки записи и чтения одной базы.
+
+    SQLite допускает одного писателя, поэтому у движка записи одно
+    соединение и транзакции записи выстраиваются в очередь в пуле, а не
+    ждут блокировку файла. Чтение идёт через отдельный пул соединений с
+    query_only и в режиме WAL не ждёт писателя.
+    """
+    url = f"sqlite+aiosqlite:///{path}"
+    write_engine = create_async_engine(url, pool_size=1, max_overflow=0, pool_timeout=60)
+    read_engine = create_async_engine(url, pool_size=read_pool_size, max_overflow=0)
+    _set_pragmas(write_engine.sync_engine, pragmas)
+    _set_pragmas(read_engine.sync_engine, {**pragmas, "query_only": "ON"})
+    return write_engine, read_engine
+
+
+engine, read_engine = create_engines()
 
 async_session = async_sessionmaker(engine)
+read_session = async_sessionmaker(read_engine)
+
+
+async def dispose_engines():
+    await engine.dispose()
+    await read_engine.dispose()
 
 
 class Base(AsyncAttrs, DeclarativeBase):
@@ -65,15 +114,80 @@ class Booking(Base):
     end_date: Mapped[datetime] = mapped_column(Date)
     total_price: Mapped[float] = mapped_column(DECIMAL(10, 2))
     payment_status = mapped_column(
-        Enum("pending", "completed", "failed", name="payment_status_enum")
+        Enum(
+            "pending",
+            "completed",
+            "confirmed",
+            "failed",
+            "cancelled",
+            "expired",
+            name="payment_status_enum",
+        )
     )
+    # Срок удержания неоплаченной брони (статус pending)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
 
     __table_args__ = (
         Index('idx_booking_dates', 'start_date', 'end_date'),
+        Index('idx_booking_car_dates', 'car_id', 'start_date', 'end_date'),
         Index('idx_booking_status', 'payment_status'),
+        Index('idx_booking_hold_expiry', 'payment_status', 'expires_at'),
+    )
+
+
+# Статусы оплаченных броней
+PAID_BOOKING_STATUSES = ("completed", "confirmed")
+
+
+# Сводные таблицы по дням для отчётов. Учитываются только оплаченные брони;
+# booked - число броней, занимающих машину в этот день, started - число
+# броней, начинающихся в этот день, revenue - доля суммы брони за день в
+# копейках. Поддерживаются в тех же транзакциях, что и брони
+# (core/database/stats.py)
+class CarDailyStats(Base):
+    __tablename__ = "car_daily_stats"
+
+    car_id: Mapped[int] = mapped_column(Integer)
+    day: Mapped[date] = mapped_column(Date)
+    booked: Mapped[int] = mapped_column(Integer, default=0)
+    started: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('car_id', 'day'),
+    )
+
+
+class TypeDailyStats(Base):
+    __tablename__ = "type_daily_stats"
+
+    car_type: Mapped[str] = mapped_column(String(50))
+    day: Mapped[date] = mapped_column(Date)
+    booked: Mapped[int] = mapped_column(Integer, default=0)
+    started: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[int] = mapped_column(Integer, default=0)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('car_type', 'day'),
+        Index('idx_type_stats_day', 'day'),
+    )
+
+
+# Напоминания о начале и окончании оплаченных броней. Строка удаляется,
+# когда напоминание отправлено или бронь перестала быть оплаченной
+# (core/database/reminders.py)
+class Reminder(Base):
+    __tablename__ = "reminders"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    booking_id: Mapped[int] = mapped_column(Integer, ForeignKey("bookings.id"))
+    kind = mapped_column(Enum("start", "end", name="reminder_kind_enum"))
+    due_at: Mapped[datetime] = mapped_column(DateTime)
+
+    __table_args__ = (
+        Index('idx_reminder_booking', 'booking_id'),
     )
 
 
 async def async_main():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    await migrate(engine, Base.metadata)
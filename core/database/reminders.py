@@ -0,0 +1,150 @@
+"""Напоминания о бронях: таблица reminders.
+
+У оплаченной брони две строки: накануне начала и в последний день аренды,
+обе в REMINDER_TIME по UTC, как и остальные сроки в базе. Строки
+добавляются и удаляются в той же сессии, что и смена статуса брони,
+поэтому напоминание не теряется при сбое и не остаётся у отменённой брони.
+Перед отправкой напоминание забирается из таблицы одним DELETE ...
+RETURNING, поэтому его отправляет ровно один процесс; после временной
+ошибки строка возвращается. Таблица содержит только ожидающие отправки.
+"""
+from collections import namedtuple
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from core.database.models import Booking, Car, Reminder, User, PAID_BOOKING_STATUSES
+
+reminders = Reminder.__table__
+
+REMINDER_TIME = time(9, 0)
+BACKFILL_CHUNK = 10_000
+
+# Забранное напоминание с данными для текста
+ClaimedReminder = namedtuple(
+    "ClaimedReminder",
+    "id booking_id kind due_at tg_id brand model start_date end_date",
+)
+
+
+def is_paid(status):
+    return status in PAID_BOOKING_STATUSES
+
+
+def reminder_rows(booking_id, start_date, end_date, now=None):
+    """Строки напоминаний брони. Опоздавшее напоминание (бронь оплачена
+    позже его срока) отправляется сразу, пока событие не прошло."""
+    now = now or datetime.utcnow()
+    rows = []
+    for kind, due_at, deadline in (
+        ("start", datetime.combine(start_date - timedelta(days=1), REMINDER_TIME),
+         datetime.combine(start_date, time())),
+        ("end", datetime.combine(end_date, REMINDER_TIME),
+         datetime.combine(end_date + timedelta(days=1), time())),
+    ):
+        if now < deadline:
+            rows.append({"booking_id": booking_id, "kind": kind, "due_at": max(due_at, now)})
+    return rows
+
+
+async def add_for_booking(connection, booking_id, start_date, end_date):
+    """Добавляет напоминания брони и возвращает пары (id, due_at)."""
+    rows = reminder_rows(booking_id, start_date, end_date)
+    if not rows:
+        return []
+    result = await connection.execute(
+        insert(reminders).returning(reminders.c.id, reminders.c.due_at), rows
+    )
+    return result.all()
+
+
+async def remove_for_booking(connection, booking_id):
+    """Удаляет напоминания брони и возвращает пары (id, due_at)."""
+    result = await connection.execute(
+        delete(reminders)
+        .where(reminders.c.booking_id == booking_id)
+        .returning(reminders.c.id, reminders.c.due_at)
+    )
+    return result.all()
+
+
+async def claim(connection, reminder_ids):
+    """Удаляет напоминания и возвращает их вместе с данными брони.
+
+    Напоминание, которое уже забрал другой процесс или удалила отмена
+    брони, в результат не попадает.
+    """
+    result = await connection.execute(
+        delete(reminders)
+        .where(reminders.c.id.in_(reminder_ids))
+        .returning(reminders.c.id, reminders.c.booking_id, reminders.c.kind, reminders.c.due_at)
+    )
+    claimed = result.all()
+    if not claimed:
+        return []
+    result = await connection.execute(
+        select(Booking.id, User.tg_id, Car.brand, Car.model, Booking.start_date, Booking.end_date)
+        .join(User, User.id == Booking.user_id)
+        .outerjoin(Car, Car.id == Booking.car_id)
+        .where(Booking.id.in_({row.booking_id for row in claimed}))
+    )
+    bookings = {booking_id: details for booking_id, *details in result.all()}
+    return [
+        ClaimedReminder(*row, *bookings[row.booking_id])
+        for row in claimed
+        if row.booking_id in bookings
+    ]
+
+
+async def restore(connection, claimed, due_at):
+    """Возвращает неотправленные напоминания со сроком due_at и возвращает
+    пары (id, due_at). Напоминания отменённых за это время броней пропадают."""
+    if not claimed:
+        return []
+    result = await connection.execute(
+        select(Booking.id).where(
+            Booking.id.in_({reminder.booking_id for reminder in claimed}),
+            Booking.payment_status.in_(PAID_BOOKING_STATUSES),
+        )
+    )
+    paid = set(result.scalars())
+    rows = [
+        {"id": reminder.id, "booking_id": reminder.booking_id, "kind": reminder.kind, "due_at": due_at}
+        for reminder in claimed
+        if reminder.booking_id in paid
+    ]
+    if rows:
+        await connection.execute(insert(reminders), rows)
+    return [(row["id"], due_at) for row in rows]
+
+
+async def apply_status_change(connection, booking, old_status):
+    """(добавленные, удалённые) напоминания при смене статуса брони:
+    меняется что-то, только если бронь стала или перестала быть оплаченной."""
+    was_paid, paid = is_paid(old_status), is_paid(booking.payment_status)
+    if paid and not was_paid:
+        return await add_for_booking(
+            connection, booking.id, booking.start_date, booking.end_date
+        ), []
+    if was_paid and not paid:
+        return [], await remove_for_booking(connection, booking.id)
+    return [], []
+
+
+async def backfill(connection):
+    # Напоминания для оплаченных броней, которые ещё не закончились
+    await connection.execute(delete(reminders))
+    result = await connection.execute(
+        select(Booking.id, Booking.start_date, Booking.end_date).where(
+            Booking.payment_status.in_(PAID_BOOKING_STATUSES),
+            Booking.end_date >= datetime.utcnow().date(),
+        )
+    )
+    now = datetime.utcnow()
+    rows = [
+        row
+        for booking in result.all()
+        for row in reminder_rows(*booking, now=now)
+    ]
+    for start in range(0, len(rows), BACKFILL_CHUNK):
+        await connection.execute(insert(reminders), rows[start:start + BACKFILL_CHUNK])
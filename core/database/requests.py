@@ -1,15 +1,172 @@
-from core.database.models import async_session
-from core.database.models import User, Car, Booking
-from sqlalchemy import select, update
+from core.database.models import async_session, read_session
+from core.database.models import User, Car, Booking, Reminder, PAID_BOOKING_STATUSES
+import core.database.stats as stats
+import core.database.reminders as reminders
+from core.storage import storage
+from core.occupancy import OccupancyIndex
+from core.facets import FacetIndex
+from core.timers import TimerWheel
+from sqlalchemy import select, insert, update, text, or_, and_
 from sqlalchemy.ext.asyncio import AsyncSession
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, defaultdict
 from datetime import datetime
+import asyncio
 import logging
-
-# Временное хранилище для данных бронирования
-booking_temp_data = {}
+import re
+import time
+
+# Чтение идёт через пул соединений только для чтения, запись - через
+# единственное соединение писателя. Проверки перед записью, которые должны
+# видеть последние данные, выполняются в сессии записи
+def session_for_read():
+    return read_session()
+
+
+def session_for_write():
+    return async_session()
+
+
+# Блокировки по автомобилям: проверка и вставка брони выполняются как одно целое
+_car_locks = defaultdict(asyncio.Lock)
+
+
+# Ключ сортировки каталога и курсор постраничного просмотра
+def catalog_key(car):
+    return (car.price_per_day, car.id)
+
+
+class CatalogCache:
+    """Кэш каталога автомобилей в памяти процесса.
+
+    Каталог меняется редко, поэтому он целиком читается одним запросом и
+    раскладывается по id, по типу и по цене. Любая запись в каталог сбрасывает
+    кэш и увеличивает version. max_age ограничивает устаревание, если каталог
+    изменил другой процесс. Счётчики facets перестраиваются при каждом
+    перечитывании, поэтому тоже подтягивают чужие изменения.
+    """
+
+    def __init__(self, max_age=60, facets=None):
+        self.max_age = max_age
+        self.facets = facets
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = None
+        self._loaded_at = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        self.version += 1
+        self._data = None
+
+    async def get(self):
+        data = self._data
+        if data is not None and time.monotonic() - self._loaded_at < self.max_age:
+            self.hits += 1
+            return data
+
+        async with self._lock:
+            if self._data is not None and time.monotonic() - self._loaded_at < self.max_age:
+                self.hits += 1
+                return self._data
+            self.misses += 1
+            version = self.version
+            async with session_for_read() as session:
+                result = await session.scalars(
+                    select(Car).order_by(Car.price_per_day, Car.id)
+                )
+                by_price = result.all()
+
+            by_type = {}
+            for car in by_price:
+                by_type.setdefault(car.type, []).append(car)
+            data = {
+                "by_id": {car.id: car for car in by_price},
+                "all": sorted(by_price, key=lambda car: car.id),
+                "by_price": by_price,
+                "by_price_keys": [catalog_key(car) for car in by_price],
+                "by_type": by_type,
+                "by_type_keys": {
+                    car_type: [catalog_key(car) for car in cars]
+                    for car_type, cars in by_type.items()
+                },
+            }
+            # Если каталог изменился во время загрузки, результат не сохраняем
+            if version == self.version:
+                self._data = data
+                self._loaded_at = time.monotonic()
+                # Версия меняется при каждом перечитывании: по max_age
+                # могли подтянуться изменения другого процесса
+                self.version += 1
+                if self.facets is not None:
+                    self.facets.load(
+                        (car.type, car.price_per_day, car.is_available) for car in data["all"]
+                    )
+            return data
+
+
+# Счётчики меню каталога; перестраиваются при каждом перечитывании каталога,
+# а запись в каталог сбрасывает его кэш
+facets = FacetIndex()
+
+catalog_cache = CatalogCache(facets=facets)
+
+# Занятость автомобилей по дням; обновляется при каждом изменении брони
+occupancy = OccupancyIndex()
+
+# Сроки неотправленных напоминаний по id строки reminders; обновляются после
+# коммита каждой транзакции, которая добавляет или удаляет напоминания
+reminder_wheel = TimerWheel()
+
+
+def _schedule_reminders(added=(), removed=()):
+    for reminder_id, due_at in added:
+        reminder_wheel.add(reminder_id, due_at)
+    for reminder_id, due_at in removed:
+        reminder_wheel.cancel(reminder_id, due_at)
+
+
+class UserCache:
+    """LRU-кэш пользователей по tg_id.
+
+    Пользователь нужен почти каждому обновлению, поэтому строка users
+    читается из базы один раз в ttl секунд. Отсутствие пользователя тоже
+    кэшируется; set_user сбрасывает запись.
+    """
+
+    def __init__(self, max_size=10_000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+
+    def get(self, tg_id):
+        # Возвращает (найдено в кэше, пользователь или None)
+        item = self._items.get(tg_id)
+        if item is None or time.monotonic() - item[0] > self.ttl:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self._items.move_to_end(tg_id)
+        return True, item[1]
+
+    def put(self, tg_id, user):
+        self._items[tg_id] = (time.monotonic(), user)
+        self._items.move_to_end(tg_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, tg_id):
+        self._items.pop(tg_id, None)
+
+
+user_cache = UserCache()
 
 async def set_user(tg_id, name, phone=None):
-    async with async_session() as session:
+    async with session_for_write() as session:
         user = await session.scalar(select(User).filter(User.tg_id == tg_id))
         
         if not user:
@@ -19,23 +176,66 @@ async def set_user(tg_id, name, phone=None):
         elif phone:  # Обновляем телефон, если он предоставлен
             user.phone = phone
             await session.commit()
+        user_cache.invalidate(tg_id)
         return user
 
 
 async def get_cars():
-    async with async_session() as session:
-        result = await session.execute(select(Car))
-        return result.scalars().all()
+    catalog = await catalog_cache.get()
+    return catalog["all"]
 
 
 async def get_car_booking(car_id):
-    async with async_session() as session:
+    async with session_for_read() as session:
         result = await session.execute(select(Booking).where(Booking.car_id == car_id))
         return result.scalars().all()
 
 
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+# Оплаченные брони занимают автомобиль всегда, pending - только до
+# истечения удержания
+def _active_booking_clause(now=None):
+    now = now or datetime.utcnow()
+    return or_(
+        Booking.payment_status.in_(PAID_BOOKING_STATUSES),
+        and_(
+            Booking.payment_status == "pending",
+            or_(Booking.expires_at.is_(None), Booking.expires_at > now),
+        ),
+    )
+
+
+def _conflicts_query(car_id, start_date, end_date):
+    # Пересечение интервалов проверяется в SQL по индексу idx_booking_car_dates
+    return select(Booking.id).where(
+        Booking.car_id == car_id,
+        Booking.start_date <= _to_date(end_date),
+        Booking.end_date >= _to_date(start_date),
+        _active_booking_clause(),
+    )
+
+
+async def find_conflicts(car_id, start_date, end_date):
+    async with session_for_read() as session:
+        result = await session.scalars(_conflicts_query(car_id, start_date, end_date))
+        return result.all()
+
+
+async def is_car_available(car_id, start_date, end_date):
+    async with session_for_read() as session:
+        conflict = await session.scalar(
+            _conflicts_query(car_id, start_date, end_date).limit(1)
+        )
+        return conflict is None
+
+
 async def add_booking(user_id, total_price, payment_status, car_id=None, start_date=None, end_date=None):
-    async with async_session() as session:
+    async with session_for_write() as session:
         try:
             # Преобразуем datetime в date
             if isinstance(start_date, datetime):
@@ -52,8 +252,16 @@ async def add_booking(user_id, total_price, payment_status, car_id=None, start_d
                 payment_status=payment_status,
             )
             session.add(booking)
+            added = []
+            if stats.is_paid(payment_status):
+                await stats.apply_booking(session, car_id, start_date, end_date, total_price)
+                await session.flush()
+                added = await reminders.add_for_booking(session, booking.id, start_date, end_date)
             await session.commit()
             await session.refresh(booking)  # Обновляем объект после коммита
+            if _is_booking_active(booking):
+                occupancy.occupy(car_id, start_date, end_date)
+            _schedule_reminders(added)
             return booking
         except Exception as e:
             logging.error(f"Error in add_booking: {e}")
@@ -61,14 +269,150 @@ async def add_booking(user_id, total_price, payment_status, car_id=None, start_d
             return None
 
 
+# Возвращает (booking, []) при успехе, (None, conflicts) если даты заняты
+# и (None, []) при ошибке
+async def reserve_car(
+    user_id,
+    car_id,
+    start_date,
+    end_date,
+    total_price,
+    payment_status="completed",
+    expires_at=None,
+):
+    start_date, end_date = _to_date(start_date), _to_date(end_date)
+    async with _car_locks[car_id]:
+        async with session_for_write() as session:
+            try:
+                # BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому другой
+                # процесс не вставит бронь между нашей проверкой и вставкой
+                await session.execute(text("BEGIN IMMEDIATE"))
+                result = await session.scalars(
+                    _conflicts_query(car_id, start_date, end_date)
+                )
+                conflicts = result.all()
+                if conflicts:
+                    await session.rollback()
+                    return None, conflicts
+
+                booking = Booking(
+                    user_id=user_id,
+                    car_id=car_id,
+                    start_date=start_date,
+                    end_date=end_date,
+                    total_price=total_price,
+                    payment_status=payment_status,
+                    expires_at=expires_at,
+                )
+                session.add(booking)
+                added = []
+                if stats.is_paid(payment_status):
+                    await stats.apply_booking(session, car_id, start_date, end_date, total_price)
+                    await session.flush()
+                    added = await reminders.add_for_booking(session, booking.id, start_date, end_date)
+                await session.commit()
+                await session.refresh(booking)
+                occupancy.occupy(car_id, start_date, end_date)
+                _schedule_reminders(added)
+                return booking, []
+            except Exception as e:
+                logging.error(f"Error in reserve_car: {e}")
+                await session.rollback()
+                return None, []
+
+
+# Переводит удержание в оплаченную бронь. Если удержание уже истекло,
+# даты проверяются повторно: бронь подтверждается, только если их никто не занял
+async def complete_hold(booking_id, total_price, payment_status="completed"):
+    async with session_for_read() as session:
+        booking = await session.get(Booking, booking_id)
+        if not booking:
+            return None, []
+        car_id = booking.car_id
+
+    async with _car_locks[car_id]:
+        async with session_for_write() as session:
+            try:
+                await session.execute(text("BEGIN IMMEDIATE"))
+                booking = await session.get(Booking, booking_id)
+                if booking.payment_status in PAID_BOOKING_STATUSES:
+                    return booking, []
+
+                result = await session.scalars(
+                    _conflicts_query(car_id, booking.start_date, booking.end_date)
+                    .where(Booking.id != booking_id)
+                )
+                conflicts = result.all()
+                if conflicts:
+                    await session.rollback()
+                    return None, conflicts
+
+                old_status = booking.payment_status
+                booking.payment_status = payment_status
+                booking.total_price = total_price
+                booking.expires_at = None
+                await stats.apply_status_change(session, booking, old_status)
+                changes = await reminders.apply_status_change(session, booking, old_status)
+                await session.commit()
+                await session.refresh(booking)
+                occupancy.occupy(car_id, booking.start_date, booking.end_date)
+                _schedule_reminders(*changes)
+                return booking, []
+            except Exception as e:
+                logging.error(f"Error in complete_hold: {e}")
+                await session.rollback()
+                return None, []
+
+
+async def expire_holds(booking_ids):
+    async with session_for_write() as session:
+        result = await session.execute(
+            update(Booking)
+            .where(
+                Booking.id.in_(booking_ids),
+                Booking.payment_status == "pending",
+                Booking.expires_at <= datetime.utcnow(),
+            )
+            .values(payment_status="expired")
+            .returning(Booking.car_id, Booking.start_date, Booking.end_date)
+        )
+        expired = result.all()
+        await session.commit()
+        for car_id, start_date, end_date in expired:
+            occupancy.release(car_id, start_date, end_date)
+        return len(expired)
+
+
+async def get_active_holds():
+    async with session_for_read() as session:
+        result = await session.scalars(
+            select(Booking).where(
+                Booking.payment_status == "pending",
+                Booking.expires_at.is_not(None),
+            )
+        )
+        return result.all()
+
+
+async def is_hold_active(booking_id):
+    async with session_for_read() as session:
+        booking = await session.get(Booking, booking_id)
+        return bool(
+            booking
+            and booking.payment_status == "pending"
+            and booking.expires_at
+            and booking.expires_at > datetime.utcnow()
+        )
+
+
 async def get_bookings():
-    async with async_session() as session:
+    async with session_for_read() as session:
         result = await session.execute(select(Booking))
         return result.scalars().all()
 
 
 async def get_booking(booking_id):
-    async with async_session() as session:
+    async with session_for_read() as session:
         return await session.scalar(select(Booking).where(Booking.id == booking_id))
 
 
@@ -85,6 +429,7 @@ async def add_car(
     )
     session.add(car)
     await session.commit()
+    catalog_cache.invalidate()
     return car
 
 
@@ -92,19 +437,65 @@ async def delete_car(car_id, session: AsyncSession):
     car = await session.get(Car, car_id)
     if car:
         await session.delete(car)
+        await stats.move_car_type(session, car_id, car.type, None)
         await session.commit()
+        catalog_cache.invalidate()
         return True
     return False
 
 
+# Изменение цены, доступности и других полей автомобиля
+async def update_car(car_id, session: AsyncSession, **values):
+    old_type = None
+    if "type" in values:
+        old_type = await session.scalar(select(Car.type).where(Car.id == car_id))
+    result = await session.execute(
+        update(Car).where(Car.id == car_id).values(**values)
+    )
+    if old_type is not None and old_type != values["type"]:
+        await stats.move_car_type(session, car_id, old_type, values["type"])
+    await session.commit()
+    catalog_cache.invalidate()
+    return result.rowcount > 0
+
+
+# Пакет импорта каталога одной транзакцией: new_cars - поля новых машин,
+# changes - id и изменяемые поля существующих. Возвращает id из changes,
+# которых нет в базе. Кэш каталога сбрасывает вызывающий после всех пакетов
+async def import_cars_batch(new_cars, changes):
+    missing = set()
+    async with session_for_write() as session:
+        if changes:
+            result = await session.execute(
+                select(Car.id, Car.type).where(Car.id.in_([c["id"] for c in changes]))
+            )
+            old = dict(result.all())
+            missing = {change["id"] for change in changes} - old.keys()
+            changes = [change for change in changes if change["id"] in old]
+            # executemany требует одинакового набора полей в строках
+            groups = defaultdict(list)
+            for change in changes:
+                groups[tuple(sorted(change))].append(change)
+            for group in groups.values():
+                await session.execute(update(Car), group)
+            for change in changes:
+                old_type = old[change["id"]]
+                if change.get("type", old_type) != old_type:
+                    await stats.move_car_type(session, change["id"], old_type, change["type"])
+        if new_cars:
+            await session.execute(insert(Car), new_cars)
+        await session.commit()
+    return missing
+
+
 async def get_all_cars(session: AsyncSession):
     result = await session.scalars(select(Car))
     return result.all()
 
 
 async def get_car_by_id(car_id):
-    async with async_session() as session:
-        return await session.get(Car, car_id)
+    catalog = await catalog_cache.get()
+    return catalog["by_id"].get(car_id)
 
 
 async def get_all_bookings(session: AsyncSession):
@@ -112,6 +503,47 @@ async def get_all_bookings(session: AsyncSession):
     return result.all()
 
 
+# Столбцы отчёта по броням; порядок совпадает с заголовком в core/reports.py
+REPORT_COLUMNS = (
+    Booking.id,
+    Booking.start_date,
+    Booking.end_date,
+    Booking.payment_status,
+    Booking.total_price,
+    Car.id,
+    Car.brand,
+    Car.model,
+    User.tg_id,
+    User.name,
+    User.phone,
+)
+
+
+async def stream_booking_report(start_date, end_date, status=None, chunk_size=1000):
+    """Брони, пересекающие период, порциями по chunk_size строк.
+
+    Строки читаются курсором на стороне базы и не попадают в identity map
+    сессии, поэтому память не зависит от размера выгрузки.
+    """
+    query = (
+        select(*REPORT_COLUMNS)
+        .outerjoin(Car, Car.id == Booking.car_id)
+        .outerjoin(User, User.id == Booking.user_id)
+        .where(Booking.start_date <= end_date, Booking.end_date >= start_date)
+        .order_by(Booking.start_date, Booking.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if status:
+        # Унарный плюс не даёт SQLite выбрать индекс по статусу: с ним все
+        # строки сортировались бы во временном B-дереве в памяти, а по
+        # индексу дат они уже идут в нужном порядке
+        query = query.where(text("+bookings.payment_status = :status").bindparams(status=status))
+    async with session_for_read() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+
 async def get_booking_by_id(booking_id, session: AsyncSession):
     return await session.get(Booking, booking_id)
 
@@ -119,41 +551,271 @@ async def get_booking_by_id(booking_id, session: AsyncSession):
 async def confirm_booking(booking_id, session: AsyncSession):
     booking = await session.get(Booking, booking_id)
     if booking:
+        old_status = booking.payment_status
         booking.payment_status = "confirmed"
+        await stats.apply_status_change(session, booking, old_status)
+        changes = await reminders.apply_status_change(session, booking, old_status)
         await session.commit()
+        _schedule_reminders(*changes)
         return True
     return False
 
 
+def _is_booking_active(booking, now=None):
+    now = now or datetime.utcnow()
+    if booking.payment_status in PAID_BOOKING_STATUSES:
+        return True
+    return booking.payment_status == "pending" and (
+        booking.expires_at is None or booking.expires_at > now
+    )
+
+
 async def cancel_booking(booking_id, session: AsyncSession):
     booking = await session.get(Booking, booking_id)
     if booking:
+        was_active = _is_booking_active(booking)
+        period = (booking.car_id, booking.start_date, booking.end_date)
+        old_status = booking.payment_status
         booking.payment_status = "cancelled"
+        await stats.apply_status_change(session, booking, old_status)
+        changes = await reminders.apply_status_change(session, booking, old_status)
         await session.commit()
+        if was_active:
+            occupancy.release(*period)
+        _schedule_reminders(*changes)
         return True
     return False
 
 
+async def rebuild_occupancy():
+    today = datetime.utcnow().date()
+    async with session_for_read() as session:
+        result = await session.execute(
+            select(Booking.car_id, Booking.start_date, Booking.end_date).where(
+                Booking.end_date >= today,
+                _active_booking_clause(),
+            )
+        )
+        rows = result.all()
+    occupancy.load(rows)
+    logging.info(f"Occupancy index rebuilt from {len(rows)} bookings")
+
+
+async def rebuild_facets():
+    # Счётчики строит сам catalog_cache при загрузке каталога
+    catalog_cache.invalidate()
+    await catalog_cache.get()
+    logging.info(f"Catalog facets rebuilt from {facets.total} cars")
+
+
+async def stream_pending_reminders(chunk_size=10_000):
+    """Пары (id, due_at) всех неотправленных напоминаний порциями."""
+    query = (
+        select(Reminder.id, Reminder.due_at)
+        .execution_options(yield_per=chunk_size)
+    )
+    async with session_for_read() as session:
+        result = await session.stream(query)
+        async for rows in result.partitions():
+            yield rows
+
+
+# Отправку напоминаний делят процессы с общей базой: забирает каждое один
+async def claim_reminders(reminder_ids):
+    async with session_for_write() as session:
+        claimed = await reminders.claim(session, reminder_ids)
+        await session.commit()
+        return claimed
+
+
+async def restore_reminders(claimed, due_at):
+    async with session_for_write() as session:
+        restored = await reminders.restore(session, claimed, due_at)
+        await session.commit()
+        return restored
+
+
 async def get_user(tg_id):
-    async with async_session() as session:
-        return await session.scalar(select(User).filter(User.tg_id == tg_id))
-
-
-async def get_cars_by_filter(car_type=None, min_price=None, max_price=None):
-    async with async_session() as session:
-        query = select(Car)
-        if car_type:
-            query = query.where(Car.type == car_type)
-        if min_price is not None:
-            query = query.where(Car.price_per_day >= min_price)
-        if max_price is not None:
-            query = query.where(Car.price_per_day <= max_price)
-        result = await session.execute(query)
-        return result.scalars().all()
+    found, user = user_cache.get(tg_id)
+    if found:
+        return user
+    async with session_for_read() as session:
+        user = await session.scalar(select(User).filter(User.tg_id == tg_id))
+    user_cache.put(tg_id, user)
+    return user
+
+
+# Keyset-пагинация по (price_per_day, id): after/before - ключ последней или
+# первой машины соседней страницы. Границы находятся бинарным поиском по
+# отсортированному каталогу, поэтому страница N стоит столько же, сколько первая
+# free_between=(start, end) оставляет только машины, свободные в этот период
+async def get_cars_by_filter(
+    car_type=None,
+    min_price=None,
+    max_price=None,
+    after=None,
+    before=None,
+    limit=None,
+    free_between=None,
+):
+    catalog = await catalog_cache.get()
+    if car_type:
+        cars = catalog["by_type"].get(car_type, [])
+        keys = catalog["by_type_keys"].get(car_type, [])
+    else:
+        cars = catalog["by_price"]
+        keys = catalog["by_price_keys"]
+
+    start = 0 if min_price is None else bisect_left(keys, (min_price,))
+    stop = len(keys) if max_price is None else bisect_right(keys, (max_price, float("inf")))
+    if after is not None:
+        start = max(start, bisect_right(keys, tuple(after)))
+    if before is not None:
+        stop = min(stop, bisect_left(keys, tuple(before)))
+    backwards = before is not None and after is None
+
+    if free_between:
+        # Занятые машины пропускаем, пока не наберётся limit свободных
+        is_free = occupancy.free_checker(*free_between)
+        positions = range(stop - 1, start - 1, -1) if backwards else range(start, stop)
+        found = []
+        for position in positions:
+            if is_free(cars[position].id):
+                found.append(cars[position])
+                if limit is not None and len(found) == limit:
+                    break
+        return found[::-1] if backwards else found
+
+    if limit is not None:
+        if backwards:
+            start = max(start, stop - limit)
+        else:
+            stop = min(stop, start + limit)
+    return cars[start:stop]
+
+
+# Полнотекстовый поиск. Машины ранжируются по уровням: все слова запроса
+# нашлись в марке и модели, затем в марке, модели и типе, затем где угодно,
+# включая описание; внутри уровня - по id. Первые два уровня ищутся в индексе
+# названий cars_names_fts, последний - в cars_fts. FTS5 отдаёт совпадения
+# в порядке rowid, поэтому ORDER BY rowid LIMIT читает только начало списка
+# совпадений, и страница широкого запроса стоит столько же, сколько узкого
+SEARCH_MAX_WORDS = 8
+# (таблица FTS5, фильтр колонок или None); совпадения каждого уровня
+# входят в совпадения следующего
+SEARCH_TIERS = (
+    ("cars_names_fts", "{brand model}"),
+    ("cars_names_fts", None),
+    ("cars_fts", None),
+)
+
+
+def search_words(query):
+    return re.findall(r"\w+", query.lower())[:SEARCH_MAX_WORDS]
+
+
+def fts_query(words):
+    # Каждое слово ищется по началу: "камр" находит "Камри"
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchCache:
+    """LRU-кэш страниц поиска: id машин страницы в порядке релевантности.
+
+    Ключ - нормализованные слова запроса, смещение и размер страницы, поэтому
+    "Toyota  Camry" и "toyota camry" попадают в одну запись, а хранятся только
+    показанные страницы. Как и готовые страницы каталога, записи действительны
+    для одной версии каталога.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._version = None
+
+    def get(self, key, version):
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+        ids = self._items.get(key)
+        if ids is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return ids
+
+    def put(self, key, version, ids):
+        ids = array("l", ids)
+        if version == self._version and key not in self._items:
+            self._items[key] = ids
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return ids
+
+
+search_cache = SearchCache()
+
+
+async def search_car_ids(words, limit, offset=0):
+    """id машин страницы поиска в порядке уровней SEARCH_TIERS."""
+    query = fts_query(words)
+    need = offset + limit
+    ids = []
+    async with session_for_read() as session:
+        for table, columns in SEARCH_TIERS:
+            # Следующий уровень читается, только если предыдущие исчерпаны,
+            # и их машины в нём пропускаются: LIMIT need хватает с запасом
+            result = await session.execute(
+                text(
+                    f"SELECT rowid FROM {table} WHERE {table} MATCH :query "
+                    f"ORDER BY rowid LIMIT :limit"
+                ),
+                {"query": f"{columns}: ({query})" if columns else query, "limit": need},
+            )
+            seen = set(ids)
+            ids += [car_id for (car_id,) in result if car_id not in seen]
+            if len(ids) >= need:
+                break
+    return ids[offset:need]
+
+
+async def search_cars(query, limit=10, offset=0):
+    """Машины, подходящие под текстовый запрос, по убыванию релевантности."""
+    words = search_words(query)
+    if not words:
+        return []
+    catalog = await catalog_cache.get()
+    version = catalog_cache.version
+    by_id = catalog["by_id"]
+    key = (tuple(words), offset, limit)
+    ids = search_cache.get(key, version)
+    if ids is None:
+        ids = search_cache.put(key, version, await search_car_ids(words, limit, offset))
+    return [by_id[car_id] for car_id in ids if car_id in by_id]
+
+
+# Данные неоплаченных бронирований хранятся в общем хранилище,
+# поэтому переживают перезапуск и видны всем процессам бота.
+# Ключ - users.id, как и Booking.user_id
+BOOKING_TEMP_NAMESPACE = "booking_temp"
 
 
 async def save_booking_temp_data(user_id: int, data: dict):
-    booking_temp_data[user_id] = data
+    await storage.kv_set(BOOKING_TEMP_NAMESPACE, user_id, data)
 
 async def get_booking_temp_data(user_id: int) -> dict:
-    return booking_temp_data.pop(user_id, None)
+    return await storage.kv_pop(BOOKING_TEMP_NAMESPACE, user_id)
+
+async def peek_booking_temp_data(user_id: int) -> dict:
+    return await storage.kv_get(BOOKING_TEMP_NAMESPACE, user_id)
+
+async def discard_booking_temp_data(user_id: int, booking_id: int):
+    # Удаляем данные только если они относятся к истёкшему удержанию
+    await storage.kv_delete_if(
+        BOOKING_TEMP_NAMESPACE,
+        user_id,
+        lambda data: data.get('booking_id') == booking_id,
+    )
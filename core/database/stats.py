@@ -0,0 +1,249 @@
+"""Сводные таблицы по дням: car_daily_stats и type_daily_stats.
+
+Каждая оплаченная бронь раскладывается по дням (начало и конец включительно)
+и добавляет в каждый день booked=1 и долю суммы в копейках, а в день начала
+ещё started=1. Изменения вносятся в той же сессии, что и изменение брони,
+поэтому попадают в базу одним коммитом с ней.
+
+Разовая перестройка и проверка согласованности:
+    python -m core.database.stats backfill
+    python -m core.database.stats check
+"""
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.database.models import Booking, Car, CarDailyStats, TypeDailyStats, PAID_BOOKING_STATUSES
+
+VALUE_COLUMNS = ("booked", "started", "revenue")
+
+car_stats = CarDailyStats.__table__
+type_stats = TypeDailyStats.__table__
+
+
+def is_paid(status):
+    return status in PAID_BOOKING_STATUSES
+
+
+def to_kopecks(amount):
+    return int((Decimal(str(amount)) * 100).to_integral_value())
+
+
+def booking_days(start_date, end_date, total_price):
+    """(день, started, выручка в копейках) по дням брони.
+
+    Остаток от деления суммы достаётся первым дням, поэтому сумма долей
+    всегда равна сумме брони.
+    """
+    days = (end_date - start_date).days + 1
+    if days <= 0:
+        return []
+    share, remainder = divmod(to_kopecks(total_price), days)
+    return [
+        (start_date + timedelta(days=i), int(i == 0), share + (i < remainder))
+        for i in range(days)
+    ]
+
+
+async def _add(connection, table, key, rows):
+    # Строки с нулевыми значениями удаляются, чтобы таблица содержала только
+    # дни с бронями
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[key, "day"],
+        set_={name: table.c[name] + stmt.excluded[name] for name in VALUE_COLUMNS},
+    )
+    await connection.execute(stmt, rows)
+    keys = {row[key] for row in rows}
+    await connection.execute(
+        delete(table).where(
+            table.c[key].in_(keys),
+            table.c.day.between(min(row["day"] for row in rows), max(row["day"] for row in rows)),
+            table.c.booked == 0,
+            table.c.started == 0,
+            table.c.revenue == 0,
+        )
+    )
+
+
+async def apply_booking(connection, car_id, start_date, end_date, total_price, sign=1):
+    """Добавляет (sign=1) или вычитает (sign=-1) оплаченную бронь."""
+    days = booking_days(start_date, end_date, total_price)
+    if not days:
+        return
+    rows = [
+        {"car_id": car_id, "day": day, "booked": sign, "started": sign * started, "revenue": sign * revenue}
+        for day, started, revenue in days
+    ]
+    await _add(connection, car_stats, "car_id", rows)
+    car_type = await connection.scalar(select(Car.type).where(Car.id == car_id))
+    if car_type is not None:
+        for row in rows:
+            del row["car_id"]
+            row["car_type"] = car_type
+        await _add(connection, type_stats, "car_type", rows)
+
+
+async def apply_status_change(connection, booking, old_status, old_total=None):
+    """Учитывает смену статуса брони: в сводке меняется что-то, только
+    если бронь перестала или стала оплаченной."""
+    was_paid, paid = is_paid(old_status), is_paid(booking.payment_status)
+    period = (booking.car_id, booking.start_date, booking.end_date)
+    if was_paid and not paid:
+        await apply_booking(connection, *period, booking.total_price if old_total is None else old_total, sign=-1)
+    elif paid and not was_paid:
+        await apply_booking(connection, *period, booking.total_price)
+
+
+async def move_car_type(connection, car_id, old_type, new_type):
+    """Переносит дни машины из сводки старого типа в новый. new_type=None -
+    машина удалена и её брони больше не относятся ни к одному типу."""
+    result = await connection.execute(
+        select(car_stats.c.day, *(car_stats.c[name] for name in VALUE_COLUMNS))
+        .where(car_stats.c.car_id == car_id)
+    )
+    days = result.all()
+    if not days:
+        return
+    for car_type, sign in ((old_type, -1), (new_type, 1)):
+        if car_type is None:
+            continue
+        await _add(connection, type_stats, "car_type", [
+            {
+                "car_type": car_type,
+                "day": day,
+                **{name: sign * value for name, value in zip(VALUE_COLUMNS, values)},
+            }
+            for day, *values in days
+        ])
+
+
+async def _expected(connection):
+    # Сводки, посчитанные заново по таблице броней
+    cars = defaultdict(lambda: [0, 0, 0])
+    types = defaultdict(lambda: [0, 0, 0])
+    result = await connection.stream(
+        select(Booking.car_id, Car.type, Booking.start_date, Booking.end_date, Booking.total_price)
+        .outerjoin(Car, Car.id == Booking.car_id)
+        .where(Booking.payment_status.in_(PAID_BOOKING_STATUSES))
+        .execution_options(yield_per=5000)
+    )
+    async for car_id, car_type, start_date, end_date, total_price in result:
+        for day, started, revenue in booking_days(start_date, end_date, total_price):
+            owners = [cars[car_id, day]]
+            if car_type is not None:
+                owners.append(types[car_type, day])
+            for totals in owners:
+                totals[0] += 1
+                totals[1] += started
+                totals[2] += revenue
+    return cars, types
+
+
+def _rows(totals, key):
+    return [
+        {key: owner, "day": day, **dict(zip(VALUE_COLUMNS, values))}
+        for (owner, day), values in totals.items()
+    ]
+
+
+async def backfill(connection, batch_size=5000):
+    """Пересчитывает обе сводки по таблице броней. Возвращает число строк."""
+    cars, types = await _expected(connection)
+    await connection.execute(delete(car_stats))
+    await connection.execute(delete(type_stats))
+    for table, rows in ((car_stats, _rows(cars, "car_id")), (type_stats, _rows(types, "car_type"))):
+        for i in range(0, len(rows), batch_size):
+            await connection.execute(insert(table), rows[i:i + batch_size])
+    return len(cars) + len(types)
+
+
+async def check(connection):
+    """Сравнивает сводки с таблицей броней. Возвращает список расхождений
+    (таблица, ключ, день, ожидалось, в таблице)."""
+    expected_cars, expected_types = await _expected(connection)
+    mismatches = []
+    for table, key, expected in (
+        (car_stats, "car_id", expected_cars),
+        (type_stats, "car_type", expected_types),
+    ):
+        actual = {}
+        result = await connection.stream(
+            select(table.c[key], table.c.day, *(table.c[name] for name in VALUE_COLUMNS))
+        )
+        async for owner, day, *values in result:
+            actual[owner, day] = values
+        for owner_day in expected.keys() | actual.keys():
+            want = expected.get(owner_day, [0, 0, 0])
+            have = actual.get(owner_day, [0, 0, 0])
+            if list(want) != list(have):
+                mismatches.append((table.name, *owner_day, want, have))
+    return mismatches
+
+
+async def utilization_by_type(connection, days=90, today=None):
+    """Загрузка и выручка по типам за последние days дней.
+
+    Возвращает список (тип, машин, занято машино-дней, доля занятости,
+    новых броней, выручка в рублях). Читает не больше days строк на тип.
+    """
+    today = today or date.today()
+    first = today - timedelta(days=days - 1)
+    result = await connection.execute(
+        select(
+            type_stats.c.car_type,
+            func.sum(type_stats.c.booked),
+            func.sum(type_stats.c.started),
+            func.sum(type_stats.c.revenue),
+        )
+        .where(type_stats.c.day.between(first, today))
+        .group_by(type_stats.c.car_type)
+    )
+    totals = {car_type: (booked, started, revenue) for car_type, booked, started, revenue in result}
+    result = await connection.execute(select(Car.type, func.count()).group_by(Car.type))
+    fleet = dict(result.all())
+    report = []
+    for car_type in sorted(fleet.keys() | totals.keys()):
+        booked, started, revenue = totals.get(car_type, (0, 0, 0))
+        cars = fleet.get(car_type, 0)
+        report.append((
+            car_type,
+            cars,
+            booked,
+            booked / (cars * days) if cars else 0,
+            started,
+            Decimal(revenue) / 100,
+        ))
+    return report
+
+
+async def _main(command):
+    from core.database.models import async_main, dispose_engines, engine
+
+    await async_main()
+    try:
+        if command == "backfill":
+            async with engine.begin() as conn:
+                rows = await backfill(conn)
+            print(f"Сводки перестроены: {rows} строк")
+            return 0
+        async with engine.connect() as conn:
+            mismatches = await check(conn)
+        for table, owner, day, want, have in mismatches[:20]:
+            print(f"{table} {owner} {day}: ожидалось {want}, в таблице {have}")
+        print(f"Расхождений: {len(mismatches)}")
+        return 1 if mismatches else 0
+    finally:
+        await dispose_engines()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in ("backfill", "check"):
+        print("Использование: python -m core.database.stats backfill|check")
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(sys.argv[1])))
@@ -0,0 +1,58 @@
+from bisect import bisect_right
+from collections import Counter
+
+# Границы ценовых диапазонов, руб/день: [0, 2000), [2000, 3000), ...,
+# [10000, без ограничения)
+PRICE_BOUNDS = (2000, 3000, 5000, 10000)
+
+
+class FacetIndex:
+    """Счётчики каталога для меню: машины по типам, по ценовым диапазонам
+    и число доступных.
+
+    Индекс строится заново при каждой загрузке кэша каталога, поэтому меню
+    каталога не выполняет COUNT(*) GROUP BY на каждое нажатие. version
+    меняется при каждой перестройке.
+    """
+
+    def __init__(self, bounds=PRICE_BOUNDS):
+        self.bounds = bounds
+        self.version = 0
+        self.total = 0
+        self.available = 0
+        self.types = Counter()
+        self.prices = [0] * (len(bounds) + 1)
+
+    def bucket(self, price):
+        return bisect_right(self.bounds, price)
+
+    def bucket_range(self, index):
+        # (нижняя граница, верхняя граница или None для последнего диапазона)
+        low = self.bounds[index - 1] if index else 0
+        high = self.bounds[index] if index < len(self.bounds) else None
+        return low, high
+
+    def load(self, cars):
+        # Полная перестройка по тройкам (тип, цена, доступность)
+        self.total = self.available = 0
+        self.types.clear()
+        self.prices = [0] * (len(self.bounds) + 1)
+        for car_type, price, is_available in cars:
+            self.total += 1
+            self.types[car_type] += 1
+            self.prices[self.bucket(price)] += 1
+            if is_available:
+                self.available += 1
+        self.version += 1
+
+    def type_counts(self):
+        # Непустые типы, самые многочисленные первыми
+        return sorted(self.types.items(), key=lambda item: (-item[1], item[0]))
+
+    def price_counts(self):
+        # Непустые ценовые диапазоны: (нижняя, верхняя граница, число машин)
+        return [
+            (*self.bucket_range(index), count)
+            for index, count in enumerate(self.prices)
+            if count
+        ]
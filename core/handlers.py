@@ -1,18 +1,67 @@
 from aiogram import F, Router
-from aiogram.types import Message, CallbackQuery, LabeledPrice, ContentType, InlineKeyboardMarkup, InlineKeyboardButton
-from aiogram.filters import CommandStart, Command
+from aiogram.types import Message, CallbackQuery, LabeledPrice, ContentType, InlineKeyboardMarkup, InlineKeyboardButton, InputMediaPhoto, BufferedInputFile, FSInputFile, InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
 from aiogram import types
 from core.utils import bot, PRICE
 import config
+import core.callbacks as cb
 import core.keyboards as kb
 import core.database.requests as rq
-from core.database.models import async_session
-from datetime import datetime, timedelta
-import logging
+import core.database.stats as stats
+from core.database.models import User
+from core.holds import create_hold, HOLD_TTL
+from core.reminders import scheduler
+from core.render import render_cars_page, render_car_details, render_calendar, render_cache, render_search_results, car_details_text, render_catalog_menu
+from core.sender import sender, log_send_errors, BULK
+from core.metrics import metrics, log_handler_error
+from core.profiler import profiler
+from core.reports import export_bookings, xlsx_supported, ReportTooLarge, REPORT_FORMATS, BOOKING_STATUSES
+import core.imports as imports
+from core.storage import storage
+from datetime import date, datetime, timedelta
+import asyncio
+import os
+import tempfile
+import time
 
 router = Router()
+# Все inline-кнопки обрабатываются через одну таблицу по коду действия,
+# она регистрируется в роутере в конце модуля
+callbacks = cb.CallbackTable()
+
+# Сколько автомобилей показывать на одной странице каталога
+CATALOG_PAGE_SIZE = getattr(config, "CATALOG_PAGE_SIZE", 10)
+# Ограничения Telegram: фото в альбоме и символов в сообщении
+MEDIA_GROUP_SIZE = 10
+MESSAGE_LIMIT = 4096
+# Сколько машин показывать в результатах поиска в чате и в inline-режиме
+SEARCH_RESULTS = 10
+INLINE_RESULTS = 20
+# Предельный размер файла, который бот может скачать через Bot API
+DOWNLOAD_LIMIT = 20 * 1024 * 1024
+# Сколько ошибок импорта перечислять в ответе
+IMPORT_ERRORS_SHOWN = 20
+# Предельная длительность профилирования командой /profile, секунды
+MAX_PROFILE_SECONDS = 300
+# Payload счёта: по нему pre-checkout и оплата находят бронь, даже если
+# временные данные уже удалены при истечении удержания
+BOOKING_PAYLOAD_PREFIX = "booking:"
+SUBSCRIPTION_PAYLOAD = "subscription"
+
+
+def booking_payload(booking_id):
+    return f"{BOOKING_PAYLOAD_PREFIX}{booking_id}"
+
+
+def parse_booking_payload(payload):
+    # id брони из payload счёта или None
+    if payload and payload.startswith(BOOKING_PAYLOAD_PREFIX):
+        booking_id = payload[len(BOOKING_PAYLOAD_PREFIX):]
+        if booking_id.isdigit():
+            return int(booking_id)
+    return None
 
 class Register(StatesGroup):
     name = State()
@@ -22,6 +71,10 @@ class BookingState(StatesGroup):
     selecting_dates = State()
     confirming = State()
 
+class CatalogState(StatesGroup):
+    free_dates = State()
+    search = State()
+
 # Добавим новые состояния для добавления автомобиля
 class AdminCarState(StatesGroup):
     brand = State()
@@ -31,10 +84,24 @@ class AdminCarState(StatesGroup):
     price = State()
     image = State()
 
+class AdminImportState(StatesGroup):
+    document = State()
+
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, user: User, command: CommandObject):
     try:
-        user = await rq.get_user(message.from_user.id)
+        # Ссылка из inline-результата поиска: t.me/<бот>?start=<кнопка машины>
+        if command.args:
+            try:
+                action, values = cb.unpack(command.args)
+            except ValueError:
+                action = None
+            if action is cb.CAR:
+                rendered = await render_car_details(*values)
+                if rendered:
+                    text, keyboard = rendered
+                    await message.answer(text, reply_markup=keyboard)
+                    return
         if not user:
             await message.answer(
                 "Добро пожаловать в Car booking! Пожалуйста, пройдите регистрацию.", 
@@ -43,7 +110,7 @@ async def cmd_start(message: Message):
         else:
             await message.answer("С возвращением в Car booking!", reply_markup=kb.main)
     except Exception as e:
-        logging.error(f"Error in cmd_start: {e}")
+        log_handler_error(f"Error in cmd_start: {e}")
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 
@@ -55,10 +122,12 @@ async def cmd_help(message: Message):
     Доступные команды:
     /start - Начать работу с ботом
     /help - Показать это сообщение
+    /search <запрос> - Найти автомобиль по марке, модели или описанию
     
     Основные функции:
     • Регистрация - Зарегистрироваться в системе
     • Каталог - Просмотр доступных автомобилей
+    • Поиск - Поиск по марке, модели и описанию, также @бот <запрос> в любом чате
     """
     
     if is_admin(message.from_user.id):
@@ -68,6 +137,11 @@ async def cmd_help(message: Message):
         /add_car - Добавить новый автомобиль
         /list_cars - Просмотреть все автомобили
         /delete_car <id> - Удалить автомобиль
+        /import - Добавить или изменить автомобили из файла CSV/XLSX
+        /stats - Задержки обработчиков и запросов к базе
+        /profile <секунды> - Профилировать работающего бота
+        /report <с> <по> [статус] [csv|xlsx] - Выгрузить брони за период
+        /utilization [дней] - Загрузка и выручка по типам машин
         """
         help_text += admin_help
         
@@ -77,71 +151,157 @@ async def cmd_help(message: Message):
 @router.message(F.text == "Каталог")
 async def catalog(message: Message):
     try:
-        await message.answer(
-            "Выберите категорию автомобиля:", 
-            reply_markup=kb.get_catalog_keyboard()
-        )
+        text, keyboard = await render_catalog_menu()
+        await message.answer(text, reply_markup=keyboard)
     except Exception as e:
-        logging.error(f"Error in catalog: {e}")
+        log_handler_error(f"Error in catalog: {e}")
         await message.answer("Произошла ошибка при открытии каталога")
 
 
-@router.callback_query(lambda c: c.data.startswith('filter_'))
-async def process_filter(callback: CallbackQuery):
+async def show_cars_page(callback: CallbackQuery, filter_type, after=None, before=None):
+    text, keyboard = await render_cars_page(
+        filter_type, after=after, before=before, page_size=CATALOG_PAGE_SIZE
+    )
+    await callback.message.edit_text(text, reply_markup=keyboard)
+
+
+@callbacks.handler(cb.FILTER)
+async def process_filter(callback: CallbackQuery, filter_type):
     try:
         await callback.answer()
-        filter_type = callback.data.split('_')[1]
-        if filter_type == 'all':
-            cars = await rq.get_cars()
-        else:
-            cars = await rq.get_cars_by_filter(car_type=filter_type)
-            
-        if cars:
-            text = "Найденные автомобили:\n\n"
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[])
-            
-            for car in cars:
-                text += f"🚗 {car.brand} {car.model} - {car.price_per_day} руб/день\n"
-                keyboard.inline_keyboard.append([
-                    InlineKeyboardButton(
-                        text=f"{car.brand} {car.model}",
-                        callback_data=f"car_{car.id}"
-                    )
-                ])
-            
-            keyboard.inline_keyboard.append([
-                InlineKeyboardButton(text="Назад в каталог", callback_data="back_to_catalog")
-            ])
-            
-            await callback.message.edit_text(text, reply_markup=keyboard)
+        await show_cars_page(callback, filter_type)
+    except Exception as e:
+        log_handler_error(f"Error in process_filter: {e}")
+        await callback.answer("Произошла ошибка при фильтрации")
+
+
+@callbacks.handler(cb.PAGE)
+async def process_page(callback: CallbackQuery, direction, price, car_id, filter_type):
+    try:
+        await callback.answer()
+        cursor = (price, car_id)
+        if direction == "n":
+            await show_cars_page(callback, filter_type, after=cursor)
         else:
-            await callback.message.edit_text(
-                "По вашему запросу ничего не найдено",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[
-                    InlineKeyboardButton(text="Назад в каталог", callback_data="back_to_catalog")
-                ]])
+            await show_cars_page(callback, filter_type, before=cursor)
+    except Exception as e:
+        log_handler_error(f"Error in process_page: {e}")
+        await callback.answer("Произошла ошибка при переходе по страницам")
+
+
+@callbacks.handler(cb.FREE_DATES)
+async def ask_free_dates(callback: CallbackQuery, state: FSMContext):
+    await callback.answer()
+    await state.set_state(CatalogState.free_dates)
+    await callback.message.answer(
+        "Введите период в формате: DD.MM.YYYY-DD.MM.YYYY, "
+        "и я покажу автомобили, свободные на эти даты"
+    )
+
+
+@router.message(CatalogState.free_dates)
+async def process_free_dates(message: Message, state: FSMContext):
+    try:
+        dates = message.text.split('-')
+        if len(dates) != 2:
+            await message.answer("Неверный формат. Используйте формат: DD.MM.YYYY-DD.MM.YYYY")
+            return
+        start_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y").date()
+        end_date = datetime.strptime(dates[1].strip(), "%d.%m.%Y").date()
+
+        if end_date < start_date:
+            await message.answer("Дата окончания должна быть не раньше даты начала")
+            return
+        if not rq.occupancy.covers(start_date, end_date):
+            await message.answer(
+                f"Можно выбрать период начиная с сегодняшнего дня и не дальше "
+                f"{rq.occupancy.horizon_days} дней вперёд"
             )
+            return
+
+        await state.clear()
+        text, keyboard = await render_cars_page(
+            kb.free_cars_filter(start_date, end_date), page_size=CATALOG_PAGE_SIZE
+        )
+        await message.answer(text, reply_markup=keyboard)
+    except ValueError:
+        await message.answer("Неверный формат даты. Используйте формат: DD.MM.YYYY-DD.MM.YYYY")
     except Exception as e:
-        logging.error(f"Error in process_filter: {e}")
-        await callback.answer("Произошла ошибка при фильтрации")
+        log_handler_error(f"Error in process_free_dates: {e}")
+        await message.answer("Произошла ошибка при поиске свободных автомобилей")
+        await state.clear()
 
-@router.callback_query(F.data == "back_to_catalog")
+
+@callbacks.handler(cb.BACK_TO_CATALOG)
 async def back_to_catalog(callback: CallbackQuery):
     try:
         await callback.answer()
-        await callback.message.edit_text(
-            "Выберите категорию автомобиля:",
-            reply_markup=kb.get_catalog_keyboard()
-        )
+        text, keyboard = await render_catalog_menu()
+        await callback.message.edit_text(text, reply_markup=keyboard)
     except Exception as e:
-        logging.error(f"Error in back_to_catalog: {e}")
+        log_handler_error(f"Error in back_to_catalog: {e}")
         await callback.answer("Произошла ошибка при возврате в каталог")
 
 
+@router.message(F.text == "Поиск")
+async def ask_search(message: Message, state: FSMContext):
+    await state.set_state(CatalogState.search)
+    await message.answer("Введите марку, модель или особенность, например: camry, 7 мест")
+
+
+async def answer_search(message: Message, query):
+    try:
+        text, keyboard = await render_search_results(query, limit=SEARCH_RESULTS)
+        await message.answer(text, reply_markup=keyboard)
+    except Exception as e:
+        log_handler_error(f"Error in search: {e}")
+        await message.answer("Произошла ошибка при поиске")
+
+
+@router.message(CatalogState.search, F.text, ~F.text.startswith("/"))
+async def process_search(message: Message, state: FSMContext):
+    await state.clear()
+    await answer_search(message, message.text)
+
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, state: FSMContext, command: CommandObject):
+    if not command.args:
+        await ask_search(message, state)
+        return
+    await answer_search(message, command.args)
+
+
+# Inline-режим (@бот camry в любом чате); включается в BotFather командой
+# /setinline. Кнопка результата открывает карточку машины в личном чате
+@router.inline_query()
+async def inline_search(query: InlineQuery):
+    try:
+        offset = int(query.offset or 0)
+        cars = await rq.search_cars(query.query, limit=INLINE_RESULTS, offset=offset)
+        username = (await bot.me()).username
+        results = [
+            InlineQueryResultArticle(
+                id=str(car.id),
+                title=f"{car.brand} {car.model}",
+                description=f"{car.type}, {car.price_per_day} руб/день",
+                input_message_content=InputTextMessageContent(message_text=car_details_text(car)),
+                reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+                    text="Забронировать",
+                    url=f"https://t.me/{username}?start={cb.CAR.pack(car.id)}",
+                )]]),
+            )
+            for car in cars
+        ]
+        next_offset = str(offset + len(cars)) if len(cars) == INLINE_RESULTS else ""
+        await query.answer(results, cache_time=60, next_offset=next_offset)
+    except Exception as e:
+        log_handler_error(f"Error in inline_search: {e}")
+
+
 @router.message(F.text == "Регистрация")
-async def register(message: Message, state: FSMContext):
+async def register(message: Message, state: FSMContext, user: User):
     try:
-        user = await rq.get_user(message.from_user.id)
         if not user:
             await state.set_state(Register.name)
             await message.answer("Введите ваше имя")
@@ -151,7 +311,7 @@ async def register(message: Message, state: FSMContext):
                 reply_markup=kb.main
             )
     except Exception as e:
-        logging.error(f"Error in register: {e}")
+        log_handler_error(f"Error in register: {e}")
         await message.answer("Произошла ошибка. Попробуйте позже.")
 
 
@@ -190,12 +350,12 @@ async def register_number(message: Message, state: FSMContext):
                 "Номер телефона не был передан. Пожалуйста, отправьте контакт."
             )
     except Exception as e:
-        logging.error(f"Error in register_number: {e}")
+        log_handler_error(f"Error in register_number: {e}")
         await message.answer("Произошла ошибка при регистрации. Попробуйте позже.")
 
 
 @router.message(F.text == "buy")
-async def buy(message: types.Message, amount=None, description=None):
+async def buy(message: types.Message, amount=None, description=None, booking_id=None):
     try:
         if not config.PAYMENTS_TOKEN:
             await message.answer("Платежи временно недоступны")
@@ -227,45 +387,60 @@ async def buy(message: types.Message, amount=None, description=None):
             is_flexible=False,
             prices=[price],
             start_parameter="car-booking",
-            payload="booking-payment",
+            payload=booking_payload(booking_id) if booking_id else SUBSCRIPTION_PAYLOAD,
         )
     except Exception as e:
-        logging.error(f"Error in buy: {e}")
+        log_handler_error(f"Error in buy: {e}")
         await message.answer("Ошибка при создании платежа. Попробуйте позже.")
 
 
 @router.pre_checkout_query(lambda query: True)
 async def pre_checkout_query(pre_checkout_q: types.PreCheckoutQuery):
+    # Оплату брони принимаем, только пока удержание дат не истекло. Бронь
+    # берётся из payload: временные данные к этому моменту могут быть удалены
+    if pre_checkout_q.invoice_payload != SUBSCRIPTION_PAYLOAD:
+        booking_id = parse_booking_payload(pre_checkout_q.invoice_payload)
+        if booking_id is None or not await rq.is_hold_active(booking_id):
+            await bot.answer_pre_checkout_query(
+                pre_checkout_q.id,
+                ok=False,
+                error_message="Время на оплату истекло. Оформите бронирование заново."
+            )
+            return
     await bot.answer_pre_checkout_query(pre_checkout_q.id, ok=True)
 
 
 @router.message(F.content_type == ContentType.SUCCESSFUL_PAYMENT)
-async def successful_payment(message: types.Message, state: FSMContext):
+async def successful_payment(message: types.Message, state: FSMContext, user: User):
     try:
-        user_id = message.from_user.id
         amount = message.successful_payment.total_amount / 100
         payment_status = "completed"
         
-        # Получаем сохраненные данные бронирования
-        booking_data = await rq.get_booking_temp_data(user_id)
+        # Бронь определяется по payload счёта, временные данные только удаляем
+        booking_id = parse_booking_payload(message.successful_payment.invoice_payload)
+        if user:
+            await rq.get_booking_temp_data(user.id)
         
-        if not booking_data:
+        if booking_id is None:
             await bot.send_message(
                 message.chat.id,
                 "Ошибка: данные бронирования не найдены"
             )
             return
 
-        booking = await rq.add_booking(
-            user_id=user_id,
-            car_id=booking_data['car_id'],
-            start_date=booking_data['start_date'],
-            end_date=booking_data['end_date'],
+        booking, conflicts = await rq.complete_hold(
+            booking_id,
             total_price=amount,
             payment_status=payment_status
         )
         
-        if booking:
+        if conflicts:
+            await bot.send_message(
+                message.chat.id,
+                "Платёж получен, но автомобиль уже забронирован на эти даты другим клиентом.\n"
+                "Пожалуйста, обратитесь в поддержку для возврата средств."
+            )
+        elif booking:
             await bot.send_message(
                 message.chat.id,
                 f"Платёж на сумму {amount} {message.successful_payment.currency} прошел успешно!\n"
@@ -278,52 +453,99 @@ async def successful_payment(message: types.Message, state: FSMContext):
                 "Произошла ошибка при сохранении бронирования. Пожалуйста, обратитесь в поддержку."
             )
     except Exception as e:
-        logging.error(f"Payment error: {e}")
+        log_handler_error(f"Payment error: {e}")
         await bot.send_message(
             message.chat.id,
             "Произошла ошибка при обработке платежа. Пожалуйста, обратитесь в поддержку."
         )
 
 
-@router.callback_query(lambda c: c.data.startswith('car_'))
-async def car_details(callback: CallbackQuery):
+@callbacks.handler(cb.CAR)
+async def car_details(callback: CallbackQuery, car_id):
     try:
         await callback.answer()
-        car_id = int(callback.data.split('_')[1])
-        car = await rq.get_car_by_id(car_id)
-        if car:
-            text = f"""
-🚗 {car.brand} {car.model}
-📝 Тип: {car.type}
-💰 Цена: {car.price_per_day} руб/день
-📋 Описание: {car.description}
-"""
-            keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="Забронировать", callback_data=f"book_{car_id}")],
-                [InlineKeyboardButton(text="Назад", callback_data="back_to_catalog")]
-            ])
+        rendered = await render_car_details(car_id)
+        if rendered:
+            text, keyboard = rendered
             await callback.message.edit_text(text, reply_markup=keyboard)
         else:
             await callback.answer("Автомобиль не найден")
     except Exception as e:
-        logging.error(f"Error in car_details: {e}")
+        log_handler_error(f"Error in car_details: {e}")
         await callback.answer("Произошла ошибка при получении информации")
 
 
-@router.callback_query(lambda c: c.data.startswith('book_'))
-async def start_booking(callback: CallbackQuery, state: FSMContext):
+@callbacks.handler(cb.BOOK)
+async def start_booking(callback: CallbackQuery, car_id, state: FSMContext, user: User):
     try:
-        car_id = int(callback.data.split('_')[1])
-        await state.update_data(car_id=car_id)
+        if not user:
+            await callback.answer()
+            await callback.message.answer(
+                "Для бронирования пройдите регистрацию.", reply_markup=kb.main
+            )
+            return
+        await state.update_data(car_id=car_id, calendar_start=None)
         await state.set_state(BookingState.selecting_dates)
         await callback.message.answer(
-            "Введите даты бронирования в формате: DD.MM.YYYY-DD.MM.YYYY",
+            "Выберите в календаре дату начала и дату окончания бронирования "
+            "или введите даты в формате: DD.MM.YYYY-DD.MM.YYYY",
             reply_markup=types.ReplyKeyboardRemove()
         )
+        today = date.today()
+        await callback.message.answer(
+            "📅 Календарь доступности:",
+            reply_markup=render_calendar(car_id, today.year, today.month)
+        )
     except Exception as e:
-        logging.error(f"Error in start_booking: {e}")
+        log_handler_error(f"Error in start_booking: {e}")
         await callback.answer("Произошла ошибка при начале бронирования")
 
+
+@callbacks.handler(cb.IGNORE)
+async def ignore_callback(callback: CallbackQuery):
+    await callback.answer()
+
+
+@callbacks.handler(cb.CALENDAR, state=BookingState.selecting_dates)
+async def calendar_navigate(callback: CallbackQuery, car_id, year, month, state: FSMContext):
+    try:
+        await callback.answer()
+        data = await state.get_data()
+        await callback.message.edit_reply_markup(reply_markup=render_calendar(
+            car_id, year, month, selected=data.get('calendar_start')
+        ))
+    except Exception as e:
+        log_handler_error(f"Error in calendar_navigate: {e}")
+
+
+@callbacks.handler(cb.DAY, state=BookingState.selecting_dates)
+async def calendar_pick_day(callback: CallbackQuery, car_id, day, state: FSMContext):
+    try:
+        await callback.answer()
+        ordinal = day.toordinal()
+        data = await state.get_data()
+        start = data.get('calendar_start')
+
+        # Первое нажатие выбирает начало, второе - окончание периода
+        if start is None or ordinal < start:
+            await state.update_data(calendar_start=ordinal)
+            await callback.message.edit_reply_markup(reply_markup=render_calendar(
+                car_id, day.year, day.month, selected=ordinal
+            ))
+            return
+
+        await state.update_data(calendar_start=None)
+        await prepare_booking(
+            callback.message,
+            state,
+            datetime.combine(date.fromordinal(start), datetime.min.time()),
+            datetime.combine(date.fromordinal(ordinal), datetime.min.time()),
+        )
+    except Exception as e:
+        log_handler_error(f"Error in calendar_pick_day: {e}")
+        await callback.message.answer("Произошла ошибка при выборе даты. Попробуйте позже.")
+
+
 @router.message(BookingState.selecting_dates)
 async def process_booking_dates(message: Message, state: FSMContext):
     try:
@@ -335,48 +557,56 @@ async def process_booking_dates(message: Message, state: FSMContext):
 
         start_date = datetime.strptime(dates[0].strip(), "%d.%m.%Y")
         end_date = datetime.strptime(dates[1].strip(), "%d.%m.%Y")
+        await prepare_booking(message, state, start_date, end_date)
 
-        # Проверяем валидность дат
-        if start_date < datetime.now():
-            await message.answer("Дата начала не может быть в прошлом")
-            return
-        
-        if end_date <= start_date:
-            await message.answer("Дата окончания должна быть позже даты начала")
-            return
+    except ValueError:
+        await message.answer("Неверный формат даты. Используйте формат: DD.MM.YYYY-DD.MM.YYYY")
+    except Exception as e:
+        log_handler_error(f"Error in process_booking_dates: {e}")
+        await message.answer("Произошла ошибка при обработке дат. Попробуйте позже.")
+        await state.clear()
 
-        if (end_date - start_date).days > 30:
-            await message.answer("Максимальный период бронирования - 30 дней")
-            return
 
-        # Получаем данные о выбранной машине
-        data = await state.get_data()
-        car = await rq.get_car_by_id(data['car_id'])
-        if not car:
-            await message.answer("Выбранный автомобиль недоступен")
-            await state.clear()
-            return
+async def prepare_booking(message: Message, state: FSMContext, start_date, end_date):
+    # Проверяем валидность дат
+    if start_date < datetime.now():
+        await message.answer("Дата начала не может быть в прошлом")
+        return
+    
+    if end_date <= start_date:
+        await message.answer("Дата окончания должна быть позже даты начала")
+        return
 
-        # Проверяем, не забронирована ли машина на эти даты
-        bookings = await rq.get_car_booking(car.id)
-        for booking in bookings:
-            if (start_date <= booking.end_date and end_date >= booking.start_date):
-                await message.answer("Автомобиль уже забронирован на эти даты")
-                return
-
-        # Рассчитываем стоимость
-        days = (end_date - start_date).days + 1
-        total_price = days * float(car.price_per_day)
-
-        # Сохраняем данные бронирования
-        await state.update_data(
-            start_date=start_date.date(),
-            end_date=end_date.date(),
-            total_price=total_price
-        )
+    if (end_date - start_date).days > 30:
+        await message.answer("Максимальный период бронирования - 30 дней")
+        return
+
+    # Получаем данные о выбранной машине
+    data = await state.get_data()
+    car = await rq.get_car_by_id(data['car_id'])
+    if not car:
+        await message.answer("Выбранный автомобиль недоступен")
+        await state.clear()
+        return
+
+    # Проверяем, не забронирована ли машина на эти даты
+    if not await rq.is_car_available(car.id, start_date, end_date):
+        await message.answer("Автомобиль уже забронирован на эти даты")
+        return
+
+    # Рассчитываем стоимость
+    days = (end_date - start_date).days + 1
+    total_price = days * float(car.price_per_day)
+
+    # Сохраняем данные бронирования
+    await state.update_data(
+        start_date=start_date.date(),
+        end_date=end_date.date(),
+        total_price=total_price
+    )
 
-        # Показываем подтверждение
-        confirmation_text = f"""
+    # Показываем подтверждение
+    confirmation_text = f"""
 Подтвердите бронирование:
 
 🚗 {car.brand} {car.model}
@@ -386,29 +616,46 @@ async def process_booking_dates(message: Message, state: FSMContext):
 
 Для подтверждения нажмите 'Оплатить'
 """
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text="Оплатить", callback_data="confirm_booking")],
-            [InlineKeyboardButton(text="Отменить", callback_data="cancel_booking")]
-        ])
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Оплатить", callback_data=cb.CONFIRM_BOOKING.pack())],
+        [InlineKeyboardButton(text="Отменить", callback_data=cb.CANCEL_BOOKING.pack())]
+    ])
 
-        await message.answer(confirmation_text, reply_markup=keyboard)
-        await state.set_state(BookingState.confirming)
+    await message.answer(confirmation_text, reply_markup=keyboard)
+    await state.set_state(BookingState.confirming)
 
-    except ValueError:
-        await message.answer("Неверный формат даты. Используйте формат: DD.MM.YYYY-DD.MM.YYYY")
-    except Exception as e:
-        logging.error(f"Error in process_booking_dates: {e}")
-        await message.answer("Произошла ошибка при обработке дат. Попробуйте позже.")
-        await state.clear()
 
-@router.callback_query(F.data == "confirm_booking", BookingState.confirming)
-async def confirm_booking(callback: CallbackQuery, state: FSMContext):
+@callbacks.handler(cb.CONFIRM_BOOKING, state=BookingState.confirming)
+async def confirm_booking(callback: CallbackQuery, state: FSMContext, user: User):
     try:
+        if not user:
+            await callback.message.answer(
+                "Для бронирования пройдите регистрацию.", reply_markup=kb.main
+            )
+            await state.clear()
+            return
         data = await state.get_data()
         car = await rq.get_car_by_id(data['car_id'])
+
+        # Удерживаем даты за пользователем до оплаты
+        hold, conflicts = await create_hold(
+            user_id=user.id,
+            car_id=data['car_id'],
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+            total_price=data['total_price']
+        )
+        if not hold:
+            if conflicts:
+                await callback.message.answer("Автомобиль уже забронирован на эти даты")
+            else:
+                await callback.message.answer("Произошла ошибка при подтверждении бронирования")
+            await state.clear()
+            return
         
         # Сохраняем данные бронирования во временное хранилище
-        await rq.save_booking_temp_data(callback.from_user.id, {
+        await rq.save_booking_temp_data(user.id, {
+            'booking_id': hold.id,
             'car_id': data['car_id'],
             'start_date': data['start_date'],
             'end_date': data['end_date'],
@@ -418,20 +665,22 @@ async def confirm_booking(callback: CallbackQuery, state: FSMContext):
         description = f"""
 Бронирование автомобиля {car.brand} {car.model}
 С {data['start_date'].strftime('%d.%m.%Y')} по {data['end_date'].strftime('%d.%m.%Y')}
+Даты удерживаются за вами {int(HOLD_TTL.total_seconds() // 60)} минут
 """
         # Вызываем функцию создания платежа с суммой из бронирования
         await buy(
             callback.message, 
             amount=data['total_price'],
-            description=description
+            description=description,
+            booking_id=hold.id
         )
         await state.clear()
     except Exception as e:
-        logging.error(f"Error in confirm_booking: {e}")
+        log_handler_error(f"Error in confirm_booking: {e}")
         await callback.message.answer("Произошла ошибка при подтверждении бронирования")
         await state.clear()
 
-@router.callback_query(F.data == "cancel_booking")
+@callbacks.handler(cb.CANCEL_BOOKING)
 async def cancel_booking(callback: CallbackQuery, state: FSMContext):
     await state.clear()
     await callback.message.answer("Бронирование отменено", reply_markup=kb.main)
@@ -492,7 +741,7 @@ async def process_image(message: Message, state: FSMContext):
         file_id = photo.file_id
         
         # Создаем новый автомобиль в базе
-        async with async_session() as session:
+        async with rq.session_for_write() as session:
             car = await rq.add_car(
                 brand=data['brand'],
                 model=data['model'],
@@ -517,10 +766,68 @@ async def process_image(message: Message, state: FSMContext):
         await state.clear()
         
     except Exception as e:
-        logging.error(f"Error in process_image: {e}")
+        log_handler_error(f"Error in process_image: {e}")
         await message.answer("Произошла ошибка при сохранении автомобиля.")
         await state.clear()
 
+# Массовое добавление и изменение машин из файла. Файл можно прислать с
+# подписью /import или следующим сообщением после команды
+@router.message(Command("import"))
+async def cmd_import(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    if message.document:
+        await import_document(message)
+        return
+    await state.set_state(AdminImportState.document)
+    await message.answer(
+        "Отправьте файл CSV или XLSX. Первая строка - названия колонок: "
+        f"{', '.join(imports.IMPORT_COLUMNS)}.\n"
+        "Строка без id добавляет машину (нужны brand, model, type, price_per_day), "
+        "строка с id меняет заполненные поля, например цену или is_available (1/0)."
+    )
+
+
+@router.message(AdminImportState.document, F.document)
+async def process_import_document(message: Message, state: FSMContext):
+    await state.clear()
+    await import_document(message)
+
+
+async def import_document(message: Message):
+    document = message.document
+    fmt = (document.file_name or "").rsplit(".", 1)[-1].lower()
+    if fmt not in imports.IMPORT_FORMATS:
+        await message.answer("Поддерживаются файлы .csv и .xlsx")
+        return
+    if fmt == "xlsx" and not imports.xlsx_supported():
+        await message.answer("Для импорта из XLSX установите openpyxl, пока доступен только CSV.")
+        return
+    if document.file_size and document.file_size > DOWNLOAD_LIMIT:
+        await message.answer("Файл больше 20 МБ, разбейте его на части.")
+        return
+
+    fd, path = tempfile.mkstemp(prefix="cars-", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        await message.answer("Загружаю автомобили...")
+        await bot.download(document, destination=path)
+        added, updated, errors = await imports.import_cars(path, fmt)
+        lines = [f"Импорт завершён: добавлено {added}, изменено {updated}, ошибок {len(errors)}"]
+        lines += [f"Строка {line}: {error}" for line, error in errors[:IMPORT_ERRORS_SHOWN]]
+        if len(errors) > IMPORT_ERRORS_SHOWN:
+            lines.append(f"... и ещё {len(errors) - IMPORT_ERRORS_SHOWN}")
+        await message.answer("\n".join(lines)[:MESSAGE_LIMIT])
+    except imports.ImportFileError as e:
+        await message.answer(f"Файл не загружен: {e}")
+    except Exception as e:
+        log_handler_error(f"Error in import_document: {e}")
+        await message.answer("Произошла ошибка при загрузке автомобилей.")
+    finally:
+        os.remove(path)
+
+
 # Команда для просмотра всех автомобилей (для админа)
 @router.message(Command("list_cars"))
 async def cmd_list_cars(message: Message):
@@ -534,6 +841,11 @@ async def cmd_list_cars(message: Message):
             await message.answer("Список автомобилей пуст.")
             return
             
+        # Фото отправляются альбомами по 10 штук, машины без фото - общими
+        # текстовыми сообщениями. Отправка идёт через очередь с низким
+        # приоритетом, чтобы не упираться в лимиты Telegram
+        photos = []
+        texts = []
         for car in cars:
             text = f"""
 ID: {car.id}
@@ -544,12 +856,33 @@ ID: {car.id}
 ✅ Доступен: {'Да' if car.is_available else 'Нет'}
 """
             if car.image_url:
-                await message.answer_photo(car.image_url, caption=text)
+                photos.append(InputMediaPhoto(media=car.image_url, caption=text[:1024]))
             else:
-                await message.answer(text)
-                
+                texts.append(text)
+
+        chat_id = message.chat.id
+        await message.answer(f"Отправляю список из {len(cars)} автомобилей...")
+        for i in range(0, len(photos), MEDIA_GROUP_SIZE):
+            album = photos[i:i + MEDIA_GROUP_SIZE]
+            sender.submit(
+                chat_id, lambda album=album: message.answer_media_group(album), priority=BULK
+            ).add_done_callback(log_send_errors)
+
+        chunk = ""
+        for text in texts:
+            if len(chunk) + len(text) > MESSAGE_LIMIT:
+                sender.submit(
+                    chat_id, lambda chunk=chunk: message.answer(chunk), priority=BULK
+                ).add_done_callback(log_send_errors)
+                chunk = ""
+            chunk += text
+        if chunk:
+            sender.submit(
+                chat_id, lambda chunk=chunk: message.answer(chunk), priority=BULK
+            ).add_done_callback(log_send_errors)
+
     except Exception as e:
-        logging.error(f"Error in cmd_list_cars: {e}")
+        log_handler_error(f"Error in cmd_list_cars: {e}")
         await message.answer("Произошла ошибка при получении списка автомобилей.")
 
 # Команда для удаления автомобиля
@@ -562,7 +895,7 @@ async def cmd_delete_car(message: Message):
     try:
         # Ожидаем ID автомобиля после команды
         car_id = int(message.text.split()[1])
-        async with async_session() as session:
+        async with rq.session_for_write() as session:
             if await rq.delete_car(car_id, session):
                 await message.answer(f"Автомобиль с ID {car_id} успешно удален.")
             else:
@@ -570,9 +903,183 @@ async def cmd_delete_car(message: Message):
     except (ValueError, IndexError):
         await message.answer("Используйте формат: /delete_car <id>")
     except Exception as e:
-        logging.error(f"Error in cmd_delete_car: {e}")
+        log_handler_error(f"Error in cmd_delete_car: {e}")
         await message.answer("Произошла ошибка при удалении автомобиля.")
 
+# Сводка метрик с момента запуска; полные гистограммы отдаёт /metrics
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
+
+    def ms(seconds):
+        return f"{seconds * 1000:.1f}"
+
+    def ratio(hits, misses):
+        total = hits + misses
+        return f"{hits / total:.0%}" if total else "-"
+
+    updates = metrics.update_latency
+    lines = [
+        f"📊 Статистика за {int(time.time() - metrics.started) // 60} мин",
+        f"Обновлений: {updates.count}, в обработке: {metrics.updates_in_flight}",
+        f"Обновление p50/p95: {ms(updates.quantile(0.5))}/{ms(updates.quantile(0.95))} мс",
+        f"Запросов к базе на обновление: "
+        f"{metrics.update_queries.sum / updates.count if updates.count else 0:.1f}",
+        "",
+        "Обработчики (вызовы, p50/p95 мс, ошибки):",
+    ]
+    handlers = sorted(metrics.handler_latency.items(), key=lambda item: -item[1].count)
+    for name, histogram in handlers[:15]:
+        lines.append(
+            f"{name}: {histogram.count}, {ms(histogram.quantile(0.5))}/"
+            f"{ms(histogram.quantile(0.95))}, {metrics.handler_errors.get(name, 0)}"
+        )
+    throttled = ", ".join(f"{reason} {count}" for reason, count in metrics.throttled.items())
+    lines.append(f"Отброшено ограничителем: {throttled or 0}")
+    lines.append(f"Напоминаний: отправлено {scheduler.sent}, ожидают {len(scheduler.wheel)}")
+    lines += ["", "Запросы к базе (число, среднее мс):"]
+    for verb, histogram in sorted(metrics.query_latency.items()):
+        lines.append(f"{verb}: {histogram.count}, {ms(histogram.sum / histogram.count)}")
+    lines += [
+        "",
+        f"Кэш каталога: {ratio(rq.catalog_cache.hits, rq.catalog_cache.misses)}",
+        f"Кэш сообщений: {ratio(render_cache.hits, render_cache.misses)}",
+        f"Кэш поиска: {ratio(rq.search_cache.hits, rq.search_cache.misses)}",
+        f"Кэш FSM: {ratio(storage.hits, storage.misses)}",
+        f"Кэш пользователей: {ratio(rq.user_cache.hits, rq.user_cache.misses)}",
+    ]
+    await message.answer("\n".join(lines))
+
+
+# Профиль живого процесса: стеки для flamegraph и сводка горячих функций.
+# Профилирование идёт в фоновой задаче: обработчик не должен держать
+# очередь обновлений пользователя до пяти минут
+profile_task = None
+
+
+async def send_profile(message: Message, seconds):
+    try:
+        result = await profiler.profile(seconds)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        await message.answer_document(
+            BufferedInputFile(result.collapsed().encode(), filename=f"profile-{stamp}.folded"),
+            caption="Стеки в формате collapsed для flamegraph.pl или speedscope",
+        )
+        await message.answer_document(
+            BufferedInputFile(result.top().encode(), filename=f"profile-{stamp}-top.txt"),
+            caption=f"Горячие функции, {result.samples} выборок",
+        )
+    except Exception as e:
+        log_handler_error(f"Error in cmd_profile: {e}")
+        await message.answer("Произошла ошибка при профилировании.")
+
+
+@router.message(Command("profile"))
+async def cmd_profile(message: Message):
+    global profile_task
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
+
+    try:
+        parts = message.text.split()
+        seconds = int(parts[1]) if len(parts) > 1 else 30
+        if not 1 <= seconds <= MAX_PROFILE_SECONDS:
+            raise ValueError
+    except ValueError:
+        await message.answer(f"Используйте формат: /profile <секунды от 1 до {MAX_PROFILE_SECONDS}>")
+        return
+    if profiler.running or (profile_task and not profile_task.done()):
+        await message.answer("Профилирование уже идёт, дождитесь результата.")
+        return
+
+    profile_task = asyncio.create_task(send_profile(message, seconds))
+    await message.answer(f"Профилирую {seconds} с, результат пришлю отдельным сообщением.")
+
+# Загрузка парка и выручка по типам автомобилей из сводки по дням
+@router.message(Command("utilization"))
+async def cmd_utilization(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
+
+    try:
+        parts = message.text.split()
+        days = int(parts[1]) if len(parts) > 1 else 90
+        if not 1 <= days <= 3660:
+            raise ValueError
+    except ValueError:
+        await message.answer("Используйте формат: /utilization <дней от 1 до 3660>")
+        return
+
+    try:
+        async with rq.session_for_read() as session:
+            report = await stats.utilization_by_type(session, days)
+        if not report:
+            await message.answer("Данных пока нет.")
+            return
+        lines = [f"Загрузка за {days} дн. (тип: машин, занято, новых броней, выручка):"]
+        for car_type, cars, booked, ratio, started, revenue in report:
+            lines.append(f"{car_type}: {cars}, {ratio:.0%}, {started}, {revenue:,.2f} руб")
+        await message.answer("\n".join(lines))
+    except Exception as e:
+        log_handler_error(f"Error in cmd_utilization: {e}")
+        await message.answer("Произошла ошибка при расчёте загрузки.")
+
+# Выгрузка броней за период; файл пишется потоково и не держится в памяти
+@router.message(Command("report"))
+async def cmd_report(message: Message):
+    if not is_admin(message.from_user.id):
+        await message.answer("У вас нет прав для выполнения этой команды.")
+        return
+
+    try:
+        parts = message.text.split()
+        start_date = datetime.strptime(parts[1], "%d.%m.%Y").date()
+        end_date = datetime.strptime(parts[2], "%d.%m.%Y").date()
+        if end_date < start_date:
+            raise ValueError
+        status, fmt = None, "csv"
+        for arg in parts[3:]:
+            if arg.lower() in REPORT_FORMATS:
+                fmt = arg.lower()
+            elif arg.lower() in BOOKING_STATUSES:
+                status = arg.lower()
+            else:
+                raise ValueError
+    except (ValueError, IndexError):
+        await message.answer(
+            "Используйте формат: /report DD.MM.YYYY DD.MM.YYYY [статус] [csv|xlsx]\n"
+            f"Статусы: {', '.join(BOOKING_STATUSES)}"
+        )
+        return
+    if fmt == "xlsx" and not xlsx_supported():
+        await message.answer("Для выгрузки в XLSX установите openpyxl, пока доступен только CSV.")
+        return
+
+    try:
+        await message.answer("Формирую отчёт...")
+        path, count = await export_bookings(start_date, end_date, status, fmt)
+        try:
+            name = f"bookings-{start_date:%Y%m%d}-{end_date:%Y%m%d}.{fmt}"
+            if path.endswith(".gz"):
+                name += ".gz"
+            await message.answer_document(
+                FSInputFile(path, filename=name),
+                caption=f"Брони с {parts[1]} по {parts[2]}: {count}",
+            )
+        finally:
+            os.remove(path)
+    except ReportTooLarge as e:
+        await message.answer(
+            f"Отчёт ({e.args[0]} броней) больше 50 МБ, уменьшите период или выберите статус."
+        )
+    except Exception as e:
+        log_handler_error(f"Error in cmd_report: {e}")
+        await message.answer("Произошла ошибка при формировании отчёта.")
+
 @router.message(Command("cancel"))
 @router.message(F.text.lower() == "отмена")
 async def cmd_cancel(message: Message, state: FSMContext):
@@ -583,3 +1090,6 @@ async def cmd_cancel(message: Message, state: FSMContext):
             "Действие отменено. Вернулись в главное меню.", 
             reply_markup=kb.main
         )
+
+
+router.callback_query.register(callbacks.dispatch)
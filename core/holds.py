@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+import core.database.requests as rq
+
+# Сколько неоплаченная бронь удерживает даты за пользователем
+HOLD_TTL = timedelta(minutes=15)
+
+
+class HoldSweeper:
+    """Снимает истёкшие удержания.
+
+    Сроки хранятся в min-куче, поэтому фоновая задача спит ровно до
+    ближайшего срока и не сканирует таблицу bookings.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, expires_at, booking_id, user_id):
+        heapq.heappush(self._heap, (expires_at, booking_id, user_id))
+        # Будим задачу, только если новый срок стал ближайшим
+        if self._heap[0][1] == booking_id:
+            self._wakeup.set()
+
+    async def load(self):
+        holds = await rq.get_active_holds()
+        for booking in holds:
+            self.schedule(booking.expires_at, booking.id, booking.user_id)
+        logging.info(f"Loaded {len(holds)} booking holds")
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = datetime.utcnow()
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                due.append(heapq.heappop(self._heap))
+
+            try:
+                expired = await rq.expire_holds([booking_id for _, booking_id, _ in due])
+            except Exception as e:
+                logging.error(f"Error in HoldSweeper: {e}")
+                for item in due:
+                    heapq.heappush(self._heap, item)
+                await asyncio.sleep(1)
+                continue
+
+            for _, booking_id, user_id in due:
+                await rq.discard_booking_temp_data(user_id, booking_id)
+            if expired:
+                logging.info(f"Expired {expired} booking holds")
+
+
+sweeper = HoldSweeper()
+
+
+async def create_hold(user_id, car_id, start_date, end_date, total_price, ttl=HOLD_TTL):
+    booking, conflicts = await rq.reserve_car(
+        user_id=user_id,
+        car_id=car_id,
+        start_date=start_date,
+        end_date=end_date,
+        total_price=total_price,
+        payment_status="pending",
+        expires_at=datetime.utcnow() + ttl,
+    )
+    if booking:
+        sweeper.schedule(booking.expires_at, booking.id, user_id)
+    return booking, conflicts
@@ -0,0 +1,180 @@
+import asyncio
+import csv
+from decimal import Decimal, InvalidOperation
+
+import core.database.requests as rq
+
+# XLSX необязателен: без openpyxl принимается только CSV
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+IMPORT_FORMATS = ("csv", "xlsx")
+# Строк в одной транзакции записи
+BATCH_SIZE = 1000
+# Колонки файла совпадают с полями cars. Строка без id добавляет машину,
+# строка с id меняет только заполненные поля этой машины
+IMPORT_COLUMNS = ("id", "brand", "model", "type", "description", "price_per_day", "is_available", "image_url")
+REQUIRED_FOR_NEW = ("brand", "model", "type", "price_per_day")
+MAX_LENGTH = {"brand": 100, "model": 100, "type": 50, "description": 120, "image_url": 255}
+MAX_PRICE = Decimal("99999999.99")
+TRUE_VALUES = ("1", "true", "yes", "да", "+")
+FALSE_VALUES = ("0", "false", "no", "нет", "-")
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def xlsx_supported():
+    return load_workbook is not None
+
+
+def _csv_rows(path):
+    # Excel с русской локалью сохраняет CSV в cp1251 и с разделителем «;»
+    encoding = "utf-8-sig"
+    try:
+        with open(path, encoding=encoding) as file:
+            for _ in file:
+                pass
+    except UnicodeDecodeError:
+        encoding = "cp1251"
+    with open(path, newline="", encoding=encoding) as file:
+        first = file.readline()
+        file.seek(0)
+        delimiter = ";" if first.count(";") > first.count(",") else ","
+        yield from csv.reader(file, delimiter=delimiter)
+
+
+def _xlsx_rows(path):
+    # В режиме read_only openpyxl читает лист потоком, а не целиком
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _parse_header(row):
+    columns = [cell.strip().lower() for cell in row]
+    unknown = [column for column in columns if column and column not in IMPORT_COLUMNS]
+    if unknown:
+        raise ImportFileError(f"Неизвестные колонки: {', '.join(unknown)}")
+    if "id" not in columns and not all(column in columns for column in REQUIRED_FOR_NEW):
+        raise ImportFileError(
+            f"Нужна колонка id или колонки {', '.join(REQUIRED_FOR_NEW)}"
+        )
+    return columns
+
+
+def parse_row(columns, row):
+    """Поля машины из строки файла; ValueError с текстом ошибки для отчёта."""
+    values = {}
+    for column, cell in zip(columns, row):
+        cell = cell.strip()
+        if not column or not cell:
+            continue
+        if column == "id":
+            if not cell.isdigit() or int(cell) == 0:
+                raise ValueError(f"id должен быть положительным целым, а не {cell!r}")
+            values["id"] = int(cell)
+        elif column == "price_per_day":
+            try:
+                price = Decimal(cell.replace(" ", "").replace(",", "."))
+            except InvalidOperation:
+                raise ValueError(f"цена должна быть числом, а не {cell!r}")
+            if not 0 < price <= MAX_PRICE:
+                raise ValueError(f"цена {cell} вне допустимого диапазона")
+            values["price_per_day"] = price.quantize(Decimal("0.01"))
+        elif column == "is_available":
+            if cell.lower() in TRUE_VALUES:
+                values["is_available"] = True
+            elif cell.lower() in FALSE_VALUES:
+                values["is_available"] = False
+            else:
+                raise ValueError(f"is_available должно быть 1 или 0, а не {cell!r}")
+        else:
+            if len(cell) > MAX_LENGTH[column]:
+                raise ValueError(f"{column} длиннее {MAX_LENGTH[column]} символов")
+            values[column] = cell
+
+    if "id" in values:
+        if len(values) == 1:
+            raise ValueError("нет полей для изменения")
+        return values
+    missing = [column for column in REQUIRED_FOR_NEW if column not in values]
+    if missing:
+        raise ValueError(f"для новой машины не заполнены: {', '.join(missing)}")
+    values.setdefault("description", "")
+    values.setdefault("image_url", "")
+    values.setdefault("is_available", True)
+    return values
+
+
+def _next_batch(rows, columns, line, seen_ids, size):
+    # Читает и проверяет следующие size строк: (новые, изменения, ошибки,
+    # номер последней строки). Выполняется в потоке
+    new_cars, changes, errors = [], [], []
+    for row in rows:
+        line += 1
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            values = parse_row(columns, row)
+        except ValueError as e:
+            errors.append((line, str(e)))
+        else:
+            if "id" not in values:
+                new_cars.append(values)
+            elif values["id"] in seen_ids:
+                errors.append((line, f"машина {values['id']} уже изменена выше в файле"))
+            else:
+                seen_ids.add(values["id"])
+                changes.append((line, values))
+        if len(new_cars) + len(changes) >= size:
+            break
+    return new_cars, changes, errors, line
+
+
+async def import_cars(path, fmt="csv", batch_size=BATCH_SIZE):
+    """Добавляет и изменяет машины по файлу и возвращает
+    (добавлено, изменено, [(номер строки, ошибка), ...]).
+
+    Файл читается и проверяется потоком в отдельном потоке, а записывается
+    пакетами по batch_size строк, каждый пакет - одна транзакция. Строки с
+    ошибками пропускаются. Кэш каталога сбрасывается один раз в конце.
+    """
+    rows = (_xlsx_rows if fmt == "xlsx" else _csv_rows)(path)
+    header = await asyncio.to_thread(next, rows, None)
+    if header is None:
+        raise ImportFileError("Файл пуст")
+    columns = _parse_header(header)
+
+    added = updated = 0
+    errors = []
+    seen_ids = set()
+    line = 1
+    try:
+        while True:
+            new_cars, changes, batch_errors, line = await asyncio.to_thread(
+                _next_batch, rows, columns, line, seen_ids, batch_size
+            )
+            errors += batch_errors
+            if not new_cars and not changes:
+                break
+            missing = await rq.import_cars_batch(new_cars, [values for _, values in changes])
+            errors += [
+                (number, f"машины {values['id']} нет в каталоге")
+                for number, values in changes
+                if values["id"] in missing
+            ]
+            added += len(new_cars)
+            updated += len(changes) - len(missing)
+    finally:
+        rows.close()
+        if added or updated:
+            rq.catalog_cache.invalidate()
+    errors.sort()
+    return added, updated, errors
@@ -1,3 +1,7 @@
+import calendar
+import zlib
+from datetime import date
+from decimal import Decimal
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -5,11 +9,13 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 
+import core.callbacks as cb
+
 main = ReplyKeyboardMarkup(
     keyboard=[
         [KeyboardButton(text="Регистрация")],
         [KeyboardButton(text="Каталог")],
-        [KeyboardButton(text="")],
+        [KeyboardButton(text="Поиск")],
         [KeyboardButton(text="")],
     ],
     resize_keyboard=True,
@@ -17,20 +23,161 @@ main = ReplyKeyboardMarkup(
 )
 
 
-def get_catalog_keyboard(car_types=None):
-    keyboard = [
-        [InlineKeyboardButton(text="Все автомобили", callback_data="filter_all")],
-        [InlineKeyboardButton(text="Седаны", callback_data="filter_sedan")],
-        [InlineKeyboardButton(text="Внедорожники", callback_data="filter_suv")],
-        [InlineKeyboardButton(text="Хэтчбеки", callback_data="filter_hatchback")],
+# Названия типов в меню; типы, которых здесь нет, показываются как есть
+TYPE_LABELS = {
+    "sedan": "Седаны",
+    "suv": "Внедорожники",
+    "hatchback": "Хэтчбеки",
+}
+
+
+# Меню каталога строится по счётчикам: car_types - пары (тип, число машин),
+# price_ranges - тройки (от, до или None, число машин)
+def get_catalog_keyboard(car_types=None, price_ranges=None, total=None):
+    all_text = "Все автомобили" if total is None else f"Все автомобили ({total})"
+    keyboard = [[InlineKeyboardButton(text=all_text, callback_data=cb.FILTER.pack("all"))]]
+    for car_type, count in car_types or ():
+        keyboard.append([InlineKeyboardButton(
+            text=f"{TYPE_LABELS.get(car_type, car_type)} ({count})",
+            callback_data=cb.FILTER.pack(type_filter(car_type)),
+        )])
+    prices = [
+        InlineKeyboardButton(
+            text=f"{low}–{high} ₽ ({count})" if high else f"от {low} ₽ ({count})",
+            callback_data=cb.FILTER.pack(price_filter(low, high)),
+        )
+        for low, high, count in price_ranges or ()
     ]
+    # Ценовые диапазоны по два в ряд
+    keyboard += [prices[i:i + 2] for i in range(0, len(prices), 2)]
+    keyboard.append([InlineKeyboardButton(text="📅 Свободные на даты", callback_data=cb.FREE_DATES.pack())])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
-# Обновляем существующую клавиатуру
-catalog = get_catalog_keyboard()
+
+# Курсор страницы (цена, id) передаётся в callback_data
+def page_callback(filter_type, direction, cursor):
+    price, car_id = cursor
+    return cb.PAGE.pack(direction, price, car_id, filter_type)
+
+
+# Самый длинный курсор: цена DECIMAL(10, 2) и id SQLite
+WIDEST_CURSOR = (Decimal("99999999.99"), 2 ** 63 - 1)
+
+
+# Тип передаётся как есть, если с ним помещаются и кнопки страниц, иначе
+# как type-<crc32 типа>
+def type_filter(car_type):
+    try:
+        page_callback(car_type, "n", WIDEST_CURSOR)
+    except ValueError:
+        return f"type-{cb.to_base36(zlib.crc32(car_type.encode()))}"
+    return car_type
+
+
+def parse_type_filter(filter_type, car_types):
+    # Тип из каталога, для которого type_filter дал filter_type, или None
+    for car_type in car_types:
+        if type_filter(car_type) == filter_type:
+            return car_type
+    return None
+
+
+# Фильтр свободных на период машин передаётся как free-<начало>-<конец>
+def free_cars_filter(start_date, end_date):
+    return f"free-{start_date.toordinal()}-{end_date.toordinal()}"
+
+
+def parse_free_cars_filter(filter_type):
+    _, start, end = filter_type.split('-')
+    return date.fromordinal(int(start)), date.fromordinal(int(end))
+
+
+# Ценовой диапазон передаётся как price-<от>-<до>, "до" пусто для последнего
+def price_filter(low, high):
+    return f"price-{low}-{high or ''}"
+
+
+def parse_price_filter(filter_type):
+    _, low, high = filter_type.split('-')
+    return int(low), int(high) if high else None
+
+
+def get_cars_keyboard(cars, filter_type, prev_cursor=None, next_cursor=None):
+    keyboard = [
+        [InlineKeyboardButton(text=f"{car.brand} {car.model}", callback_data=cb.CAR.pack(car.id))]
+        for car in cars
+    ]
+    navigation = []
+    if prev_cursor:
+        navigation.append(InlineKeyboardButton(
+            text="« Назад", callback_data=page_callback(filter_type, "p", prev_cursor)
+        ))
+    if next_cursor:
+        navigation.append(InlineKeyboardButton(
+            text="Вперёд »", callback_data=page_callback(filter_type, "n", next_cursor)
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    keyboard.append([InlineKeyboardButton(text="Назад в каталог", callback_data=cb.BACK_TO_CATALOG.pack())])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
 get_number = ReplyKeyboardMarkup(
     keyboard=[[KeyboardButton(text="Отправить номер", request_contact=True)]],
     resize_keyboard=True,
 )
+
+
+MONTHS = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь",
+)
+WEEKDAYS = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+def _ignore(text):
+    return InlineKeyboardButton(text=text, callback_data=cb.IGNORE.pack())
+
+
+# Календарь бронирования: занятые дни и дни вне [first_day, last_day]
+# недоступны для выбора
+def get_calendar_keyboard(car_id, year, month, busy_days, first_day, last_day, selected=None):
+    keyboard = [
+        [_ignore(f"{MONTHS[month - 1]} {year}")],
+        [_ignore(day) for day in WEEKDAYS],
+    ]
+    for week in calendar.monthcalendar(year, month):
+        row = []
+        for day in week:
+            if not day:
+                row.append(_ignore(" "))
+                continue
+            current = date(year, month, day)
+            if day in busy_days:
+                row.append(_ignore("✖"))
+            elif not first_day <= current <= last_day:
+                row.append(_ignore("·"))
+            elif current.toordinal() == selected:
+                row.append(InlineKeyboardButton(
+                    text=f"[{day}]", callback_data=cb.DAY.pack(car_id, current)
+                ))
+            else:
+                row.append(InlineKeyboardButton(
+                    text=str(day), callback_data=cb.DAY.pack(car_id, current)
+                ))
+        keyboard.append(row)
+
+    previous_month = (year, month - 1) if month > 1 else (year - 1, 12)
+    next_month = (year, month + 1) if month < 12 else (year + 1, 1)
+    navigation = []
+    if previous_month >= (first_day.year, first_day.month):
+        navigation.append(InlineKeyboardButton(
+            text="«", callback_data=cb.CALENDAR.pack(car_id, *previous_month)
+        ))
+    if next_month <= (last_day.year, last_day.month):
+        navigation.append(InlineKeyboardButton(
+            text="»", callback_data=cb.CALENDAR.pack(car_id, *next_month)
+        ))
+    if navigation:
+        keyboard.append(navigation)
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
@@ -0,0 +1,161 @@
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from aiohttp import web
+from sqlalchemy import event
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами в формате Prometheus."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Оценка по корзинам с линейной интерполяцией внутри корзины
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                low = self.buckets[i - 1] if i else 0
+                high = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.handler_latency = {}
+        self.handler_errors = {}
+        self.in_flight = {}
+        self.updates_in_flight = 0
+        self.update_latency = Histogram()
+        self.update_queries = Histogram(COUNT_BUCKETS)
+        self.query_latency = {}
+        self.loop_lag = Histogram()
+        self.throttled = {}
+
+    def handler_histogram(self, name):
+        histogram = self.handler_latency.get(name)
+        if histogram is None:
+            histogram = self.handler_latency[name] = Histogram()
+        return histogram
+
+    def count_error(self, handler):
+        self.handler_errors[handler] = self.handler_errors.get(handler, 0) + 1
+
+    def observe_query(self, verb, seconds):
+        histogram = self.query_latency.get(verb)
+        if histogram is None:
+            histogram = self.query_latency[verb] = Histogram(QUERY_BUCKETS)
+        histogram.observe(seconds)
+
+
+metrics = Metrics()
+
+# Счётчик запросов к базе текущего обновления. Список, а не число: движок
+# SQLAlchemy выполняет запросы в копии контекста и должен менять тот же объект
+update_queries = ContextVar("update_queries", default=None)
+# Имя выполняющегося обработчика, его выставляет HandlerMetricsMiddleware
+current_handler = ContextVar("current_handler", default=None)
+
+
+def log_handler_error(text):
+    # Обработчики сами перехватывают исключения и отвечают пользователю,
+    # поэтому ошибка учитывается там, где пишется в лог
+    logging.error(text)
+    handler = current_handler.get()
+    if handler is not None:
+        metrics.count_error(handler)
+
+
+def instrument_engine(engine):
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        metrics.observe_query(statement.split(None, 1)[0].upper(), elapsed)
+        counter = update_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name, histogram, **labels):
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        yield f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}"
+    yield f"{name}_bucket{_labels(**labels, le='+Inf')} {histogram.count}"
+    suffix = _labels(**labels) if labels else ""
+    yield f"{name}_sum{suffix} {histogram.sum}"
+    yield f"{name}_count{suffix} {histogram.count}"
+
+
+def render_prometheus():
+    lines = [
+        "# TYPE bot_handler_latency_seconds histogram",
+    ]
+    for handler, histogram in sorted(metrics.handler_latency.items()):
+        lines += _histogram_lines("bot_handler_latency_seconds", histogram, handler=handler)
+    lines.append("# TYPE bot_handler_errors_total counter")
+    for handler, count in sorted(metrics.handler_errors.items()):
+        lines.append(f"bot_handler_errors_total{_labels(handler=handler)} {count}")
+    lines.append("# TYPE bot_handler_in_flight gauge")
+    for handler, count in sorted(metrics.in_flight.items()):
+        lines.append(f"bot_handler_in_flight{_labels(handler=handler)} {count}")
+    lines.append("# TYPE bot_updates_in_flight gauge")
+    lines.append(f"bot_updates_in_flight {metrics.updates_in_flight}")
+    lines.append("# TYPE bot_update_latency_seconds histogram")
+    lines += _histogram_lines("bot_update_latency_seconds", metrics.update_latency)
+    lines.append("# TYPE bot_update_db_queries histogram")
+    lines += _histogram_lines("bot_update_db_queries", metrics.update_queries)
+    lines.append("# TYPE bot_db_query_latency_seconds histogram")
+    for verb, histogram in sorted(metrics.query_latency.items()):
+        lines += _histogram_lines("bot_db_query_latency_seconds", histogram, statement=verb)
+    lines.append("# TYPE bot_throttled_total counter")
+    for reason, count in sorted(metrics.throttled.items()):
+        lines.append(f"bot_throttled_total{_labels(reason=reason)} {count}")
+    lines.append("# TYPE bot_event_loop_lag_seconds histogram")
+    lines += _histogram_lines("bot_event_loop_lag_seconds", metrics.loop_lag)
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host, port, path="/metrics"):
+    app = web.Application()
+    app.router.add_get(path, metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
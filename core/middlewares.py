@@ -0,0 +1,221 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from core.callbacks import CallbackTable
+from core.metrics import metrics, update_queries, current_handler, instrument_engine
+import core.database.requests as rq
+from core.utils import TokenBucket
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware обновлений: общее время обработки и число
+    запросов к базе на одно обновление."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        counter = [0]
+        token = update_queries.set(counter)
+        metrics.updates_in_flight += 1
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            metrics.update_latency.observe(time.perf_counter() - started)
+            metrics.update_queries.observe(counter[0])
+            metrics.updates_in_flight -= 1
+            update_queries.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: задержка, ошибки и число выполняющихся
+    вызовов по имени обработчика. Ошибки, перехваченные самим обработчиком,
+    учитываются через log_handler_error.
+
+    Имя обработчика известно только после фильтров, поэтому этот middleware
+    регистрируется на событиях роутера, а не на обновлениях.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = data["handler"].callback
+        # Нажатия кнопок приходят в общий обработчик таблицы callbacks,
+        # имя конкретной функции знает только она
+        table = getattr(callback, "__self__", None)
+        if isinstance(table, CallbackTable):
+            name = table.handler_name(event)
+        else:
+            name = callback.__name__
+        histogram = metrics.handler_histogram(name)
+        metrics.in_flight[name] = metrics.in_flight.get(name, 0) + 1
+        token = current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.count_error(name)
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - started)
+            metrics.in_flight[name] -= 1
+            current_handler.reset(token)
+
+
+def setup_metrics(dispatcher, router, *engines):
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    handler_metrics = HandlerMetricsMiddleware()
+    for observer in (
+        router.message, router.callback_query, router.pre_checkout_query, router.inline_query
+    ):
+        observer.middleware(handler_metrics)
+    for engine in engines:
+        instrument_engine(engine)
+
+
+class _UserLimit:
+    __slots__ = ("bucket", "seen", "last_data", "last_at", "warned")
+
+    def __init__(self, rate, burst):
+        self.bucket = TokenBucket(rate, burst)
+        self.seen = 0
+        self.last_data = None
+        self.last_at = 0
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Ограничение частоты сообщений и нажатий кнопок до обращения к базе.
+
+    У каждого пользователя своё ведро токенов, у всего бота - общее.
+    Повторное нажатие той же кнопки в течение duplicate_window секунд
+    не выполняется второй раз. Таблица пользователей ограничена max_users
+    записями и очищается от неактивных дольше idle_ttl секунд, поэтому
+    память не растёт от числа пользователей.
+    """
+
+    def __init__(
+        self,
+        user_rate=2,
+        user_burst=6,
+        global_rate=50,
+        global_wait=2,
+        duplicate_window=1,
+        max_users=10_000,
+        idle_ttl=600,
+        exempt_ids=(),
+    ):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.global_bucket = TokenBucket(global_rate)
+        self.global_wait = global_wait
+        self.duplicate_window = duplicate_window
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self.exempt_ids = set(exempt_ids)
+        self._users = OrderedDict()
+
+    def _user(self, user_id, now):
+        # Записи упорядочены по последней активности: протухшие всегда в начале
+        users = self._users
+        while users:
+            oldest_id, oldest = next(iter(users.items()))
+            if now - oldest.seen < self.idle_ttl and len(users) < self.max_users:
+                break
+            if oldest_id == user_id:
+                break
+            del users[oldest_id]
+        limit = users.get(user_id)
+        if limit is None:
+            limit = users[user_id] = _UserLimit(self.user_rate, self.user_burst)
+        users.move_to_end(user_id)
+        limit.seen = now
+        return limit
+
+    async def _reject(self, event, limit, reason):
+        metrics.throttled[reason] = metrics.throttled.get(reason, 0) + 1
+        if isinstance(event, CallbackQuery):
+            # Ответ на callback нужен в любом случае, иначе кнопка «зависнет»
+            text = None if reason == "duplicate" else "Слишком часто, подождите немного"
+            await event.answer(text)
+        elif limit is not None and not limit.warned:
+            limit.warned = True
+            await event.answer("Слишком много сообщений, подождите немного")
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = getattr(event, "from_user", None)
+        # Подтверждение оплаты не ограничиваем: его уже не повторить
+        if (
+            user is None
+            or user.id in self.exempt_ids
+            or isinstance(event, Message) and event.successful_payment
+        ):
+            return await handler(event, data)
+
+        now = time.monotonic()
+        limit = self._user(user.id, now)
+        if isinstance(event, CallbackQuery):
+            if event.data == limit.last_data and now - limit.last_at < self.duplicate_window:
+                return await self._reject(event, limit, "duplicate")
+            limit.last_data = event.data
+            limit.last_at = now
+
+        if not limit.bucket.try_acquire():
+            return await self._reject(event, limit, "user")
+        limit.warned = False
+
+        # Общий лимит не отбрасывает сразу: короткий всплеск переждём
+        try:
+            await asyncio.wait_for(self.global_bucket.acquire(), self.global_wait)
+        except asyncio.TimeoutError:
+            return await self._reject(event, None, "global")
+        return await handler(event, data)
+
+
+def setup_throttling(dispatcher, **limits):
+    throttling = ThrottlingMiddleware(**limits)
+    dispatcher.message.outer_middleware(throttling)
+    dispatcher.callback_query.outer_middleware(throttling)
+    return throttling
+
+
+class UserMiddleware(BaseMiddleware):
+    """Передаёт обработчикам строку users отправителя аргументом user.
+
+    Пользователь берётся из кэша rq.user_cache, поэтому обработчикам не
+    нужно ходить в базу за ним самим. Для незарегистрированных user=None.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        from_user = getattr(event, "from_user", None)
+        data["user"] = await rq.get_user(from_user.id) if from_user else None
+        return await handler(event, data)
+
+
+def setup_user_identity(dispatcher):
+    # Регистрируется после ограничителя, чтобы отброшенные обновления не
+    # обращались к базе
+    users = UserMiddleware()
+    for observer in (dispatcher.message, dispatcher.callback_query, dispatcher.pre_checkout_query):
+        observer.outer_middleware(users)
@@ -0,0 +1,98 @@
+import calendar
+from datetime import date, timedelta
+
+
+class OccupancyIndex:
+    """Занятость автомобилей по дням в виде битовых масок.
+
+    Маска автомобиля - целое число, бит i которого означает, что машина занята
+    в день origin + i. Проверка периода сводится к одному AND с маской
+    периода, поэтому подбор свободных машин по всему парку занимает
+    микросекунды. Индекс покрывает horizon_days дней вперёд; origin
+    периодически сдвигается на сегодняшний день.
+    """
+
+    def __init__(self, horizon_days=180):
+        self.horizon_days = horizon_days
+        self.origin = date.today()
+        # Версии меняются при каждом изменении занятости: общая и по машинам
+        self.version = 0
+        self.versions = {}
+        self._masks = {}
+
+    def clear(self):
+        self.origin = date.today()
+        self._masks.clear()
+        self.version += 1
+        for car_id in self.versions:
+            self.versions[car_id] += 1
+
+    def load(self, bookings):
+        # Полная перестройка по парам (car_id, start, end): origin и горизонт
+        # считаются один раз на все брони, а не для каждой
+        self.clear()
+        origin = self.origin
+        last_day = self.horizon_days - 1
+        masks = self._masks
+        for car_id, start_date, end_date in bookings:
+            first = max((start_date - origin).days, 0)
+            last = min((end_date - origin).days, last_day)
+            if last >= first:
+                masks[car_id] = masks.get(car_id, 0) | ((1 << (last - first + 1)) - 1) << first
+        for car_id in masks:
+            self.versions[car_id] = self.versions.get(car_id, 0) + 1
+
+    def _advance_origin(self):
+        shift = (date.today() - self.origin).days
+        if shift > 0:
+            self.origin += timedelta(days=shift)
+            for car_id, mask in self._masks.items():
+                self._masks[car_id] = mask >> shift
+
+    def _range_mask(self, start_date, end_date):
+        self._advance_origin()
+        first = max((start_date - self.origin).days, 0)
+        last = min((end_date - self.origin).days, self.horizon_days - 1)
+        if last < first:
+            return 0
+        return ((1 << (last - first + 1)) - 1) << first
+
+    def covers(self, start_date, end_date):
+        return (
+            start_date >= date.today()
+            and end_date < date.today() + timedelta(days=self.horizon_days)
+        )
+
+    def occupy(self, car_id, start_date, end_date):
+        mask = self._range_mask(start_date, end_date)
+        if mask:
+            self._masks[car_id] = self._masks.get(car_id, 0) | mask
+            self.versions[car_id] = self.versions.get(car_id, 0) + 1
+            self.version += 1
+
+    def release(self, car_id, start_date, end_date):
+        # Активные брони одной машины не пересекаются, поэтому биты можно
+        # просто снять
+        mask = self._range_mask(start_date, end_date)
+        if mask and car_id in self._masks:
+            self._masks[car_id] &= ~mask
+            self.versions[car_id] = self.versions.get(car_id, 0) + 1
+            self.version += 1
+
+    def free_checker(self, start_date, end_date):
+        # Функция car_id -> свободна ли машина весь период
+        mask = self._range_mask(start_date, end_date)
+        masks = self._masks
+        return lambda car_id: not masks.get(car_id, 0) & mask
+
+    def busy_days(self, car_id, year, month):
+        # Номера занятых дней месяца для календаря бронирования
+        days_in_month = calendar.monthrange(year, month)[1]
+        first = date(year, month, 1)
+        mask = self._range_mask(first, first + timedelta(days=days_in_month - 1))
+        busy = self._masks.get(car_id, 0) & mask
+        offset = (first - self.origin).days
+        return {
+            day for day in range(1, days_in_month + 1)
+            if 0 <= offset + day - 1 and busy >> (offset + day - 1) & 1
+        }
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from core.metrics import metrics
+
+
+def _frame_label(code):
+    # Для библиотек оставляем путь от site-packages, для кода бота - от core/
+    path = code.co_filename.replace("\\", "/")
+    if "site-packages/" in path:
+        path = path.split("site-packages/", 1)[1]
+    elif "/core/" in path:
+        path = path[path.rfind("/core/") + 1:]
+    else:
+        path = path.rsplit("/", 1)[-1]
+    return f"{path}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _is_idle(stack):
+    # Вершина стека в selectors - цикл ждёт событий и ничем не занят
+    return stack.rsplit(";", 1)[-1].startswith("selectors.py:")
+
+
+class SamplingProfiler:
+    """Статистический профилировщик потока событийного цикла.
+
+    Отдельный поток раз в interval секунд снимает стек потока цикла через
+    sys._current_frames(), поэтому сам цикл не замедляется трассировкой.
+    Результат - стеки в формате collapsed (flamegraph.pl, speedscope) и
+    сводка по самым горячим функциям.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self):
+        return self._lock.locked()
+
+    def _sample(self, thread_id, stop, stacks):
+        labels = {}
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            stack.reverse()
+            stacks[";".join(stack)] += 1
+
+    async def profile(self, seconds):
+        async with self._lock:
+            stacks = Counter()
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample,
+                args=(threading.get_ident(), stop, stacks),
+                name="sampling-profiler",
+                daemon=True,
+            )
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+            return ProfileResult(stacks)
+
+
+class ProfileResult:
+    def __init__(self, stacks):
+        self.stacks = stacks
+        self.samples = sum(stacks.values())
+        self.idle = sum(count for stack, count in stacks.items() if _is_idle(stack))
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top(self, limit=20):
+        # Собственное время - функция на вершине стека, общее - где угодно в стеке
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for label in set(frames):
+                total[label] += count
+
+        busy = self.samples - self.idle
+        lines = [
+            f"Выборок: {self.samples}, цикл занят в {busy / max(self.samples, 1):.0%} из них",
+            "",
+            f"{'own':>6} {'total':>6}  function",
+        ]
+        for label, count in own.most_common(limit):
+            if _is_idle(label):
+                continue
+            lines.append(
+                f"{count / max(self.samples, 1):>6.1%} "
+                f"{total[label] / max(self.samples, 1):>6.1%}  {label}"
+            )
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler()
+
+
+class LoopLagMonitor:
+    """Сторож событийного цикла.
+
+    Задача в цикле раз в interval секунд отмечает, что цикл жив, и
+    записывает задержку своего пробуждения в метрики. Поток-сторож
+    замечает, что отметки нет дольше threshold, и один раз логирует стек
+    потока цикла - то есть код, который его блокирует.
+    """
+
+    def __init__(self, threshold=0.1, interval=0.05):
+        self.threshold = threshold
+        self.interval = interval
+        self._heartbeat = time.monotonic()
+        self._stop = threading.Event()
+        self._task = None
+        self._watchdog = None
+
+    async def _beat(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0)
+            metrics.loop_lag.observe(lag)
+            if lag > self.threshold:
+                logging.warning(f"Event loop was blocked for {lag * 1000:.0f} ms")
+            self._heartbeat = time.monotonic()
+
+    def _watch(self, thread_id):
+        reported = None
+        while not self._stop.wait(self.threshold / 2):
+            heartbeat = self._heartbeat
+            if time.monotonic() - heartbeat < self.threshold + self.interval:
+                continue
+            if reported == heartbeat:
+                continue
+            # Один стек на каждую блокировку, а не на каждую проверку
+            reported = heartbeat
+            frame = sys._current_frames().get(thread_id)
+            if frame is not None:
+                stack = "".join(traceback.format_stack(frame))
+                logging.warning(f"Event loop is blocked, current stack:\n{stack}")
+
+    def start(self):
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._beat())
+        self._watchdog = threading.Thread(
+            target=self._watch,
+            args=(threading.get_ident(),),
+            name="loop-watchdog",
+            daemon=True,
+        )
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import core.database.requests as rq
+from core.sender import sender, BULK
+from core.utils import bot
+
+# Сколько напоминаний читается из базы и отправляется за один шаг
+BATCH_SIZE = 100
+# Через сколько повторить напоминание после сетевой ошибки
+RETRY_DELAY = timedelta(minutes=1)
+
+
+def reminder_text(reminder):
+    car = f"{reminder.brand} {reminder.model}" if reminder.brand else "автомобиля"
+    period = f"{reminder.start_date.strftime('%d.%m.%Y')} - {reminder.end_date.strftime('%d.%m.%Y')}"
+    if reminder.kind == "start":
+        return f"🔔 Напоминание: {reminder.start_date.strftime('%d.%m.%Y')} начинается аренда {car} ({period})."
+    return f"🔔 Напоминание: сегодня последний день аренды {car} ({period}). Не забудьте вернуть автомобиль."
+
+
+class ReminderScheduler:
+    """Отправляет напоминания о бронях в срок.
+
+    Сроки всех неотправленных напоминаний лежат в rq.reminder_wheel, поэтому
+    задача спит до ближайшего срока и не опрашивает таблицу bookings.
+    Напоминания одного срока отправляются пакетами по BATCH_SIZE через
+    очередь исходящих сообщений с низким приоритетом. Пакет сначала
+    забирается из reminders одним DELETE ... RETURNING, поэтому при общей
+    базе каждое напоминание отправляет один процесс, а перезапуск не
+    повторяет отправленных. Строки возвращаются в таблицу после временной
+    ошибки и при остановке - для ещё не начатых отправок.
+    """
+
+    def __init__(self, wheel=None):
+        self.wheel = rq.reminder_wheel if wheel is None else wheel
+        self.sent = 0
+
+    async def load(self):
+        self.wheel.clear()
+        async for rows in rq.stream_pending_reminders():
+            for reminder_id, due_at in rows:
+                self.wheel.add(reminder_id, due_at)
+        logging.info(f"Loaded {len(self.wheel)} booking reminders")
+
+    async def run(self):
+        wheel = self.wheel
+        while True:
+            wheel.wakeup.clear()
+            due_at = wheel.next_due()
+            if due_at is None:
+                await wheel.wakeup.wait()
+                continue
+
+            delay = (due_at - datetime.utcnow()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(wheel.wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            due = wheel.pop_due(datetime.utcnow())
+            for start in range(0, len(due), BATCH_SIZE):
+                await self._deliver(due[start:start + BATCH_SIZE])
+
+    async def _deliver(self, reminder_ids):
+        claim = asyncio.ensure_future(rq.claim_reminders(reminder_ids))
+        try:
+            claimed = await asyncio.shield(claim)
+        except asyncio.CancelledError:
+            # Остановка во время запроса: забранные строки возвращаем
+            await asyncio.shield(self._restore_claim(claim))
+            raise
+        except Exception as e:
+            logging.error(f"Error in ReminderScheduler: {e}")
+            self._retry(reminder_ids)
+            await asyncio.sleep(1)
+            return
+
+        started = set()
+        aborted = False
+
+        async def send(reminder):
+            # После остановки очередь ещё дорабатывает, но эти строки уже возвращены
+            if aborted:
+                return
+            started.add(reminder.id)
+            await bot.send_message(reminder.tg_id, reminder_text(reminder))
+
+        futures = [
+            sender.submit(reminder.tg_id, lambda reminder=reminder: send(reminder), priority=BULK)
+            for reminder in claimed
+        ]
+        try:
+            results = await asyncio.gather(*futures, return_exceptions=True)
+        except asyncio.CancelledError:
+            aborted = True
+            unsent = [reminder for reminder in claimed if reminder.id not in started]
+            await asyncio.shield(self._restore(unsent, datetime.utcnow()))
+            raise
+
+        # Заблокировавшему бота пользователю повторная отправка не поможет
+        failed = []
+        for reminder, result in zip(claimed, results):
+            if isinstance(result, Exception) and not isinstance(
+                result, (TelegramForbiddenError, TelegramBadRequest)
+            ):
+                logging.error(f"Error sending reminder {reminder.id}: {result}")
+                failed.append(reminder)
+        self.sent += len(claimed) - len(failed)
+        await self._restore(failed, datetime.utcnow() + RETRY_DELAY)
+
+    async def _restore_claim(self, claim):
+        try:
+            claimed = await claim
+        except Exception:
+            # Транзакция не прошла, строки остались в таблице
+            return
+        await self._restore(claimed, datetime.utcnow())
+
+    async def _restore(self, claimed, due_at):
+        if not claimed:
+            return
+        try:
+            restored = await rq.restore_reminders(claimed, due_at)
+        except Exception as e:
+            logging.error(f"Error in ReminderScheduler, {len(claimed)} reminders lost: {e}")
+            return
+        for reminder_id, due_at in restored:
+            self.wheel.add(reminder_id, due_at)
+
+    def _retry(self, reminder_ids):
+        due_at = datetime.utcnow() + RETRY_DELAY
+        for reminder_id in reminder_ids:
+            self.wheel.add(reminder_id, due_at)
+
+
+scheduler = ReminderScheduler()
@@ -0,0 +1,202 @@
+from collections import OrderedDict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+import core.callbacks as cb
+import core.keyboards as kb
+import core.database.requests as rq
+
+
+class RenderCache:
+    """LRU-кэш готовых сообщений каталога: текст и клавиатура.
+
+    Записи действительны только для той версии каталога, при которой они
+    построены; смена версии очищает кэш целиком.
+    """
+
+    def __init__(self, max_size=512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._version = None
+
+    def get(self, key, version):
+        if version != self._version:
+            self._items.clear()
+            self._version = version
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item
+
+    def put(self, key, version, item):
+        if version != self._version:
+            return item
+        self._items[key] = item
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+        return item
+
+
+render_cache = RenderCache()
+calendar_cache = RenderCache(max_size=1024)
+menu_cache = RenderCache(max_size=1)
+
+NOT_FOUND = (
+    "По вашему запросу ничего не найдено",
+    InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="Назад в каталог", callback_data=cb.BACK_TO_CATALOG.pack())
+    ]]),
+)
+
+
+async def render_cars_page(filter_type, after=None, before=None, page_size=10):
+    await rq.catalog_cache.get()
+    version = rq.catalog_cache.version
+    key = ("page", filter_type, after, before, page_size)
+    # Подборка по датам зависит от занятости и меняется слишком часто для кэша
+    free_between = None
+    if filter_type.startswith('free-'):
+        free_between = kb.parse_free_cars_filter(filter_type)
+    else:
+        cached = render_cache.get(key, version)
+        if cached:
+            return cached
+
+    # Диапазон [от, до): цены хранятся с копейками, поэтому верхняя граница
+    # включительно - на копейку меньше
+    prices = {}
+    if filter_type.startswith('price-'):
+        low, high = kb.parse_price_filter(filter_type)
+        prices = {"min_price": low, "max_price": high - Decimal("0.01") if high else None}
+
+    car_type = None if filter_type == 'all' or free_between or prices else filter_type
+    if filter_type.startswith('type-'):
+        # Длинный тип в кнопке заменён хэшем, настоящий ищем среди типов каталога
+        car_type = kb.parse_type_filter(filter_type, rq.facets.types)
+        if car_type is None:
+            return render_cache.put(key, version, NOT_FOUND)
+    cars = await rq.get_cars_by_filter(
+        car_type=car_type,
+        after=after,
+        before=before,
+        limit=page_size,
+        free_between=free_between,
+        **prices,
+    )
+    if not cars:
+        return NOT_FOUND if free_between else render_cache.put(key, version, NOT_FOUND)
+
+    first, last = rq.catalog_key(cars[0]), rq.catalog_key(cars[-1])
+    has_prev = await rq.get_cars_by_filter(
+        car_type=car_type, before=first, limit=1, free_between=free_between, **prices
+    )
+    has_next = await rq.get_cars_by_filter(
+        car_type=car_type, after=last, limit=1, free_between=free_between, **prices
+    )
+
+    if free_between:
+        start_date, end_date = free_between
+        text = (
+            f"Свободные автомобили с {start_date.strftime('%d.%m.%Y')} "
+            f"по {end_date.strftime('%d.%m.%Y')}:\n\n"
+        )
+    else:
+        text = "Найденные автомобили:\n\n"
+    for car in cars:
+        text += f"🚗 {car.brand} {car.model} - {car.price_per_day} руб/день\n"
+    keyboard = kb.get_cars_keyboard(
+        cars,
+        filter_type,
+        prev_cursor=first if has_prev else None,
+        next_cursor=last if has_next else None,
+    )
+    if free_between:
+        return text, keyboard
+    return render_cache.put(key, version, (text, keyboard))
+
+
+# Меню каталога перестраивается только при изменении счётчиков rq.facets.
+# Обращение к кэшу каталога перечитывает его по max_age, а с ним и счётчики
+async def render_catalog_menu():
+    await rq.catalog_cache.get()
+    facets = rq.facets
+    cached = menu_cache.get("menu", facets.version)
+    if cached:
+        return cached
+    text = "Выберите категорию автомобиля:"
+    if facets.total:
+        text += f"\nДоступно {facets.available} из {facets.total}"
+    keyboard = kb.get_catalog_keyboard(
+        facets.type_counts(), facets.price_counts(), total=facets.total
+    )
+    return menu_cache.put("menu", facets.version, (text, keyboard))
+
+
+def car_details_text(car):
+    return f"""
+🚗 {car.brand} {car.model}
+📝 Тип: {car.type}
+💰 Цена: {car.price_per_day} руб/день
+📋 Описание: {car.description}
+"""
+
+
+async def render_car_details(car_id):
+    await rq.catalog_cache.get()
+    version = rq.catalog_cache.version
+    key = ("car", car_id)
+    cached = render_cache.get(key, version)
+    if cached:
+        return cached
+
+    car = await rq.get_car_by_id(car_id)
+    if not car:
+        return None
+    text = car_details_text(car)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Забронировать", callback_data=cb.BOOK.pack(car_id))],
+        [InlineKeyboardButton(text="Назад", callback_data=cb.BACK_TO_CATALOG.pack())]
+    ])
+    return render_cache.put(key, version, (text, keyboard))
+
+
+# Результаты поиска кэшируются в rq.search_cache, построить сообщение дёшево
+async def render_search_results(query, limit=10):
+    cars = await rq.search_cars(query, limit=limit)
+    if not cars:
+        return NOT_FOUND
+    text = f"Найдено по запросу «{query[:100]}»:\n\n"
+    for car in cars:
+        text += f"🚗 {car.brand} {car.model} - {car.price_per_day} руб/день\n"
+    return text, kb.get_cars_keyboard(cars, None)
+
+
+# Календарь строится из индекса занятости без запросов к базе и кэшируется,
+# пока не изменится занятость этой машины
+def render_calendar(car_id, year, month, selected=None):
+    today = date.today()
+    occupancy = rq.occupancy
+    key = (car_id, year, month, selected, occupancy.versions.get(car_id, 0))
+    cached = calendar_cache.get(key, today)
+    if cached:
+        return cached
+
+    # Бронировать можно с завтрашнего дня и в пределах горизонта индекса
+    keyboard = kb.get_calendar_keyboard(
+        car_id,
+        year,
+        month,
+        occupancy.busy_days(car_id, year, month),
+        first_day=today + timedelta(days=1),
+        last_day=today + timedelta(days=occupancy.horizon_days - 1),
+        selected=selected,
+    )
+    return calendar_cache.put(key, today, keyboard)
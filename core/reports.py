@@ -0,0 +1,117 @@
+import asyncio
+import csv
+import gzip
+import os
+import shutil
+import tempfile
+
+import core.database.requests as rq
+from core.database.models import Booking
+
+# XLSX необязателен: без openpyxl доступен только CSV
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+REPORT_HEADER = (
+    "ID брони",
+    "Начало",
+    "Окончание",
+    "Статус",
+    "Сумма",
+    "ID автомобиля",
+    "Марка",
+    "Модель",
+    "Telegram ID",
+    "Имя",
+    "Телефон",
+)
+REPORT_FORMATS = ("csv", "xlsx")
+BOOKING_STATUSES = tuple(Booking.payment_status.type.enums)
+# Предельный размер файла, который бот может отправить через Bot API
+UPLOAD_LIMIT = 50 * 1024 * 1024
+
+
+class ReportTooLarge(Exception):
+    pass
+
+
+def xlsx_supported():
+    return Workbook is not None
+
+
+def _cell(value):
+    return "" if value is None else str(value)
+
+
+class _CsvSink:
+    # Разделитель «;» и BOM: так файл сразу открывается в Excel с русской локалью
+    def __init__(self, path):
+        self.file = open(path, "w", newline="", encoding="utf-8-sig")
+        self.writer = csv.writer(self.file, delimiter=";")
+        self.writer.writerow(REPORT_HEADER)
+
+    def write(self, rows):
+        self.writer.writerows([_cell(value) for value in row] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _XlsxSink:
+    # В режиме write_only openpyxl сбрасывает строки во временный файл,
+    # а не держит лист в памяти
+    def __init__(self, path):
+        self.path = path
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet("Брони")
+        self.sheet.append(REPORT_HEADER)
+
+    def write(self, rows):
+        for row in rows:
+            self.sheet.append([
+                float(value) if i == 4 and value is not None else value
+                for i, value in enumerate(row)
+            ])
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+def _compress(path):
+    with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.remove(path)
+    return path + ".gz"
+
+
+async def export_bookings(start_date, end_date, status=None, fmt="csv"):
+    """Пишет отчёт по броням во временный файл и возвращает (путь, число строк).
+
+    Строки приходят из базы порциями и сразу дописываются в файл; запись
+    выполняется в потоке, чтобы не останавливать цикл событий. CSV больше
+    лимита Bot API сжимается gzip. Удалить файл должен вызывающий.
+    """
+    fd, path = tempfile.mkstemp(prefix="bookings-", suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        sink = await asyncio.to_thread(_XlsxSink if fmt == "xlsx" else _CsvSink, path)
+        count = 0
+        try:
+            async for rows in rq.stream_booking_report(start_date, end_date, status):
+                await asyncio.to_thread(sink.write, rows)
+                count += len(rows)
+        finally:
+            await asyncio.to_thread(sink.close)
+
+        if os.path.getsize(path) > UPLOAD_LIMIT and fmt == "csv":
+            path = await asyncio.to_thread(_compress, path)
+        if os.path.getsize(path) > UPLOAD_LIMIT:
+            raise ReportTooLarge(count)
+        return path, count
+    except BaseException:
+        for leftover in (path, path + ".gz"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        raise
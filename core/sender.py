@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendDocument, SendInvoice, SendMediaGroup, SendMessage, SendPhoto
+
+from core.utils import TokenBucket
+
+# Приоритеты: меньшее значение отправляется раньше
+INTERACTIVE = 0
+BULK = 10
+
+# Лимиты Telegram: около 30 сообщений в секунду всего и одно в секунду в чат.
+# Общий лимит очереди ниже, чтобы оставить запас на всплески ответов
+GLOBAL_RATE = 25
+CHAT_RATE = 1
+CHAT_BURST = 3
+# Чаты, получившие 429 одновременно, повторяют отправку вразброс, иначе
+# повторы снова приходят пачкой и снова упираются в лимит
+RETRY_JITTER = 0.2
+
+# Запросы, которые создают сообщение в чате и считаются в лимитах Telegram
+SEND_METHODS = (SendMessage, SendPhoto, SendMediaGroup, SendDocument, SendInvoice)
+
+# Выставлен, пока запрос отправляет сама очередь: middleware не должен
+# ставить его в очередь второй раз
+_in_queue = ContextVar("outbound_in_queue", default=False)
+
+
+class _Chat:
+    __slots__ = ("bucket", "items", "busy", "active", "scheduled", "lock")
+
+    def __init__(self):
+        self.bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+        # Куча (приоритет, номер, call, future, попытка)
+        self.items = []
+        self.busy = False
+        self.active = 0
+        self.scheduled = False
+        # Интерактивные ответы в один чат уходят по очереди
+        self.lock = asyncio.Lock()
+
+    def idle(self):
+        return not (self.items or self.busy or self.active or self.scheduled)
+
+
+class OutboundQueue:
+    """Очередь исходящих сообщений с ограничением скорости.
+
+    У каждого чата своя очередь и своё ведро токенов. Диспетчер выдаёт
+    отправителям только чаты, у которых есть токен, поэтому длинная
+    рассылка в один чат не занимает отправителей, пока другие чаты ждут.
+    В чате сообщения уходят по одному, в порядке приоритета и постановки.
+
+    Интерактивные ответы (priority=INTERACTIVE) отправляются сразу в задаче
+    обработчика: они берут токены чата и общие токены в долг и не ждут их,
+    а массовые отправки ждут, пока долг не погасится. Ответ 429
+    приостанавливает чат на retry_after секунд и повторяет отправку.
+    """
+
+    def __init__(self, workers=4, max_chats=10_000, max_attempts=10):
+        self.workers = workers
+        self.max_chats = max_chats
+        self.max_attempts = max_attempts
+        self.global_bucket = TokenBucket(GLOBAL_RATE)
+        self._chats = OrderedDict()
+        self._ready = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._idle = None
+        self._slots = None
+        self._pending = 0
+        self._dispatcher = None
+        self._tasks = set()
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat()
+            # Вытесняем давно не использованные чаты без сообщений в работе
+            while len(self._chats) > self.max_chats:
+                old_id, old = next(iter(self._chats.items()))
+                if not old.idle():
+                    break
+                del self._chats[old_id]
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    def _start(self):
+        if self._dispatcher is None:
+            self._wakeup = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._slots = asyncio.Semaphore(self.workers)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def _schedule(self, chat_id, chat):
+        # Чат с сообщениями попадает в кучу готовых по приоритету первого
+        if chat.items and not chat.busy and not chat.active and not chat.scheduled:
+            priority, seq = chat.items[0][:2]
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+            chat.scheduled = True
+            self._wakeup.set()
+
+    def _schedule_later(self, delay, chat_id, chat):
+        def wake():
+            chat.scheduled = False
+            self._schedule(chat_id, chat)
+
+        chat.scheduled = True
+        asyncio.get_running_loop().call_later(delay, wake)
+
+    def submit(self, chat_id, call, priority=BULK):
+        # call - функция без аргументов, возвращающая корутину отправки
+        self._start()
+        if priority == INTERACTIVE:
+            return asyncio.ensure_future(self._send_now(chat_id, call))
+        future = asyncio.get_running_loop().create_future()
+        chat = self._chat(chat_id)
+        heapq.heappush(chat.items, (priority, next(self._seq), call, future, 1))
+        self._pending += 1
+        self._idle.clear()
+        self._schedule(chat_id, chat)
+        return future
+
+    async def send(self, chat_id, call, priority=INTERACTIVE):
+        if priority == INTERACTIVE:
+            self._start()
+            return await self._send_now(chat_id, call)
+        return await self.submit(chat_id, call, priority)
+
+    async def _send_now(self, chat_id, call):
+        chat = self._chat(chat_id)
+        chat.active += 1
+        token = _in_queue.set(True)
+        try:
+            async with chat.lock:
+                for attempt in range(1, self.max_attempts + 1):
+                    paused = chat.bucket.paused_for()
+                    if paused:
+                        await asyncio.sleep(paused)
+                    chat.bucket.consume()
+                    self.global_bucket.consume()
+                    try:
+                        return await call()
+                    except TelegramRetryAfter as e:
+                        if attempt == self.max_attempts:
+                            raise
+                        logging.warning(f"Flood control, retry in {e.retry_after} s")
+                        chat.bucket.pause(e.retry_after * (1 + random.uniform(0, RETRY_JITTER)))
+        finally:
+            _in_queue.reset(token)
+            chat.active -= 1
+            self._schedule(chat_id, chat)
+
+    async def _dispatch(self):
+        while True:
+            if not self._ready:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            _, _, chat_id = heapq.heappop(self._ready)
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                continue
+            chat.scheduled = False
+            if chat.busy or chat.active or not chat.items:
+                continue
+
+            delay = chat.bucket.delay()
+            if delay:
+                # Чат ждёт свой токен, не задерживая остальные
+                self._schedule_later(delay, chat_id, chat)
+                continue
+            delay = self.global_bucket.delay()
+            if delay:
+                # Общий лимит исчерпан: ждать приходится всем
+                self._schedule(chat_id, chat)
+                await asyncio.sleep(delay)
+                continue
+
+            await self._slots.acquire()
+            chat.bucket.consume()
+            self.global_bucket.consume()
+            chat.busy = True
+            task = asyncio.create_task(self._send(chat_id, chat, heapq.heappop(chat.items)))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, chat_id, chat, item):
+        priority, seq, call, future, attempt = item
+        _in_queue.set(True)
+        done = True
+        try:
+            result = await call()
+            if not future.done():
+                future.set_result(result)
+        except TelegramRetryAfter as e:
+            if attempt < self.max_attempts:
+                logging.warning(f"Flood control, retry in {e.retry_after} s")
+                chat.bucket.pause(e.retry_after * (1 + random.uniform(0, RETRY_JITTER)))
+                # Повтор встаёт на своё место в очереди чата
+                heapq.heappush(chat.items, (priority, seq, call, future, attempt + 1))
+                done = False
+            elif not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            chat.busy = False
+            self._slots.release()
+            if done:
+                self._pending -= 1
+                if not self._pending:
+                    self._idle.set()
+            self._schedule(chat_id, chat)
+
+    async def close(self, timeout=10):
+        if self._dispatcher is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Outbound queue closed with {self._pending} unsent messages")
+        tasks = [self._dispatcher, *self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._dispatcher = None
+        self._tasks.clear()
+
+
+class OutboundMiddleware(BaseRequestMiddleware):
+    """Пропускает сообщения, которые бот отправляет из обработчиков, через
+    очередь с приоритетом INTERACTIVE: они учитываются в лимитах чата и
+    переживают ответ 429, а массовые отправки уступают им токены."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        if _in_queue.get() or chat_id is None or not isinstance(method, SEND_METHODS):
+            return await make_request(bot, method)
+        return await self.queue.send(chat_id, lambda: make_request(bot, method), INTERACTIVE)
+
+
+sender = OutboundQueue()
+
+
+def setup_outbound(bot, queue=sender):
+    bot.session.middleware(OutboundMiddleware(queue))
+
+
+def log_send_errors(future):
+    if not future.cancelled() and future.exception():
+        logging.error(f"Error in outbound message: {future.exception()}")
@@ -0,0 +1,223 @@
+import asyncio
+import pickle
+from collections import OrderedDict
+from typing import Any, Mapping
+
+import aiosqlite
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS fsm ("
+    "key TEXT PRIMARY KEY, state TEXT, data BLOB)",
+    "CREATE TABLE IF NOT EXISTS kv ("
+    "namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB, "
+    "PRIMARY KEY (namespace, key))",
+)
+
+UPSERT_FSM = (
+    "INSERT INTO fsm (key, state, data) VALUES (?, ?, ?) "
+    "ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data"
+)
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище в SQLite, общее для нескольких процессов бота.
+
+    Записи попадают в LRU-кэш и в режиме shared сразу коммитятся в базу:
+    другие процессы должны видеть состояние, как только обработчик
+    продолжил работу, и подтверждённая запись не должна пропасть при
+    падении. Изменения других процессов отслеживаются через PRAGMA
+    data_version: при любом чужом коммите кэш сбрасывается. Один процесс
+    может передать shared=False - тогда чтения идут из кэша без обращения к
+    базе, а записи уходят пачкой раз в flush_interval секунд.
+    """
+
+    def __init__(
+        self, path="fsm.sqlite3", cache_size=1024, flush_interval=0.05, shared=True
+    ):
+        self.path = path
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.shared = shared
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._connect_lock = asyncio.Lock()
+        # Соединение одно на процесс: коммит не должен попасть между
+        # запросом и чтением его курсора в другой корутине
+        self._db_lock = asyncio.Lock()
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._flush_task = None
+        self._data_version = None
+
+    async def _connection(self):
+        if self._db is None:
+            async with self._connect_lock:
+                if self._db is None:
+                    db = await aiosqlite.connect(self.path)
+                    await db.execute("PRAGMA journal_mode=WAL")
+                    await db.execute("PRAGMA synchronous=NORMAL")
+                    await db.execute("PRAGMA busy_timeout=5000")
+                    for statement in SCHEMA:
+                        await db.execute(statement)
+                    await db.commit()
+                    self._db = db
+        return self._db
+
+    async def _sync_cache(self, db):
+        # data_version меняется только после коммитов других соединений
+        async with db.execute("PRAGMA data_version") as cursor:
+            version = (await cursor.fetchone())[0]
+        if version != self._data_version:
+            self._data_version = version
+            self._cache.clear()
+
+    def _remember(self, key, record):
+        self._cache[key] = record
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _get_record(self, key: StorageKey):
+        db = await self._connection()
+        async with self._db_lock:
+            if self.shared:
+                await self._sync_cache(db)
+            key = self.key_builder.build(key)
+            record = self._pending.get(key) or self._cache.get(key)
+            if record is not None:
+                self.hits += 1
+                self._cache[key] = record
+                self._cache.move_to_end(key)
+                return record
+
+            self.misses += 1
+            async with db.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)) as cursor:
+                row = await cursor.fetchone()
+        if row:
+            record = (row[0], pickle.loads(row[1]) if row[1] else {})
+        else:
+            record = (None, {})
+        self._remember(key, record)
+        return record
+
+    async def _write(self, key: StorageKey, record):
+        key = self.key_builder.build(key)
+        self._pending[key] = record
+        self._remember(key, record)
+        if self.shared:
+            await self.flush()
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        upserts = []
+        deletes = []
+        for key, (state, data) in pending.items():
+            if state is None and not data:
+                deletes.append((key,))
+            else:
+                upserts.append((key, state, pickle.dumps(data)))
+
+        db = await self._connection()
+        try:
+            async with self._db_lock:
+                if upserts:
+                    await db.executemany(UPSERT_FSM, upserts)
+                if deletes:
+                    await db.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+                await db.commit()
+        except Exception:
+            # Более свежие записи, сделанные во время сброса, не затираем
+            for key, record in pending.items():
+                self._pending.setdefault(key, record)
+            raise
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._get_record(key)
+        state = state.state if isinstance(state, State) else state
+        await self._write(key, (state, data))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await self._get_record(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        state, _ = await self._get_record(key)
+        await self._write(key, (state, data.copy()))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await self._get_record(key)
+        return data.copy()
+
+    async def kv_set(self, namespace, key, value):
+        db = await self._connection()
+        async with self._db_lock:
+            await db.execute(
+                "INSERT OR REPLACE INTO kv (namespace, key, value) VALUES (?, ?, ?)",
+                (namespace, str(key), pickle.dumps(value)),
+            )
+            await db.commit()
+
+    async def kv_get(self, namespace, key):
+        db = await self._connection()
+        async with self._db_lock, db.execute(
+            "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, str(key))
+        ) as cursor:
+            row = await cursor.fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    async def kv_pop(self, namespace, key):
+        # DELETE ... RETURNING: значение забирает только один процесс
+        db = await self._connection()
+        async with self._db_lock:
+            async with db.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? RETURNING value",
+                (namespace, str(key)),
+            ) as cursor:
+                row = await cursor.fetchone()
+            await db.commit()
+        return pickle.loads(row[0]) if row else None
+
+    async def kv_delete_if(self, namespace, key, predicate):
+        db = await self._connection()
+        async with self._db_lock:
+            async with db.execute(
+                "SELECT value FROM kv WHERE namespace = ? AND key = ?", (namespace, str(key))
+            ) as cursor:
+                row = await cursor.fetchone()
+            if not row or not predicate(pickle.loads(row[0])):
+                return False
+            # Удаляем, только если значение не успели перезаписать
+            cursor = await db.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND value = ?",
+                (namespace, str(key), row[0]),
+            )
+            await db.commit()
+            return cursor.rowcount > 0
+
+    async def close(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        await self.flush()
+        if self._db is not None:
+            await self._db.close()
+            self._db = None
+
+
+storage = SQLiteStorage()
@@ -0,0 +1,79 @@
+import asyncio
+import heapq
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class TimerWheel:
+    """Таймеры с точностью до resolution.
+
+    Таймеры одного интервала лежат в одной ячейке - множестве ключей, а куча
+    хранит только номера непустых ячеек. Поэтому добавление и отмена стоят
+    O(1), срабатывает сразу вся ячейка, а память - один ключ на таймер:
+    напоминания на одно время суток занимают одну ячейку на день. Отмена
+    требует тот же срок, что и добавление; ячейка, опустевшая после отмены,
+    удаляется из кучи лениво.
+
+    wakeup выставляется, когда появился таймер раньше всех прежних.
+    """
+
+    def __init__(self, resolution=timedelta(minutes=1)):
+        self.resolution = resolution
+        self.wakeup = asyncio.Event()
+        self._slots = {}
+        self._heap = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _slot(self, due):
+        return (due - EPOCH) // self.resolution
+
+    def add(self, key, due):
+        slot = self._slot(due)
+        keys = self._slots.get(slot)
+        if keys is None:
+            keys = self._slots[slot] = set()
+            heapq.heappush(self._heap, slot)
+            if self._heap[0] == slot:
+                self.wakeup.set()
+        if key not in keys:
+            keys.add(key)
+            self._count += 1
+
+    def cancel(self, key, due):
+        slot = self._slot(due)
+        keys = self._slots.get(slot)
+        if keys is None or key not in keys:
+            return False
+        keys.remove(key)
+        self._count -= 1
+        if not keys:
+            del self._slots[slot]
+        return True
+
+    def next_due(self):
+        # Начало ближайшей непустой ячейки или None
+        heap = self._heap
+        while heap and heap[0] not in self._slots:
+            heapq.heappop(heap)
+        return EPOCH + heap[0] * self.resolution if heap else None
+
+    def pop_due(self, now):
+        # Ключи всех ячеек, начало которых не позже now
+        due = []
+        last = self._slot(now)
+        heap = self._heap
+        while heap and heap[0] <= last:
+            keys = self._slots.pop(heapq.heappop(heap), None)
+            if keys:
+                due.extend(keys)
+        self._count -= len(due)
+        return due
+
+    def clear(self):
+        self._slots.clear()
+        self._heap.clear()
+        self._count = 0
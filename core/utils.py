@@ -1,6 +1,75 @@
+import asyncio
+import time
+
 from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import LabeledPrice
-from config import TELEGRAM_BOT_TOKEN
+import config
+
+
+def create_bot():
+    # TELEGRAM_API_URL направляет запросы на локальный сервер Bot API,
+    # например на заглушку из bench/fake_bot_api.py
+    api_url = getattr(config, "TELEGRAM_API_URL", None)
+    if not api_url:
+        return Bot(token=config.TELEGRAM_BOT_TOKEN)
+    session = AiohttpSession(api=TelegramAPIServer.from_base(api_url))
+    return Bot(token=config.TELEGRAM_BOT_TOKEN, session=session)
+
 
-bot = Bot(token=TELEGRAM_BOT_TOKEN)
+bot = create_bot()
 PRICE = LabeledPrice(label="Подписка на 1 месяц", amount=500 * 100)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity про запас."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._paused_until = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    def try_acquire(self, tokens=1):
+        now = self._refill()
+        if now < self._paused_until or self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+    async def acquire(self, tokens=1):
+        while True:
+            now = self._refill()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+            elif self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            else:
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def delay(self, tokens=1):
+        # Через сколько секунд try_acquire(tokens) выдаст токены
+        now = self._refill()
+        return max(self._paused_until - now, (tokens - self.tokens) / self.rate, 0)
+
+    def paused_for(self):
+        return max(self._paused_until - time.monotonic(), 0)
+
+    def consume(self, tokens=1):
+        # Берёт токены без ожидания; запас уходит в минус не больше чем на
+        # capacity, и остальные ждут, пока долг не погасится
+        self._refill()
+        self.tokens = max(self.tokens - tokens, -self.capacity)
+
+    def pause(self, seconds):
+        # Например, после ответа 429 с retry_after
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
@@ -0,0 +1,151 @@
+import asyncio
+import hmac
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from aiogram.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_shard_key(update: Update):
+    # Обновления одного пользователя должны попадать в один и тот же обработчик
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    user = getattr(event, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    if chat:
+        return chat.id
+    return update.update_id
+
+
+class UpdateWorkerPool:
+    """Ограниченный пул обработчиков обновлений.
+
+    У каждого обработчика своя очередь; обновление попадает в очередь по
+    id пользователя, поэтому события одного пользователя обрабатываются
+    строго по порядку. Переполненная очередь задерживает приём новых
+    обновлений (back-pressure).
+    """
+
+    def __init__(self, dispatcher, bot, workers=8, queue_size=100):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self._queues = [asyncio.Queue(maxsize=queue_size) for _ in range(workers)]
+        self._tasks = []
+
+    @property
+    def pending(self):
+        return sum(queue.qsize() for queue in self._queues)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker(queue)) for queue in self._queues]
+
+    async def submit(self, update: Update):
+        queue = self._queues[update_shard_key(update) % len(self._queues)]
+        await queue.put(update)
+
+    async def _worker(self, queue):
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as e:
+                logging.error(f"Error while processing update {update.update_id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def drain(self, timeout=30):
+        # Дожидаемся обработки уже принятых обновлений, затем останавливаем пул
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)), timeout
+            )
+        except asyncio.TimeoutError:
+            logging.warning(f"Webhook pool stopped with {self.pending} unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+def create_webhook_app(pool: UpdateWorkerPool, secret_token, path="/webhook", submit_timeout=5):
+    async def handle_update(request: web.Request):
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), secret_token.encode()):
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": pool.bot})
+        except Exception as e:
+            logging.error(f"Invalid webhook update: {e}")
+            return web.Response(status=400)
+        try:
+            await asyncio.wait_for(pool.submit(update), submit_timeout)
+        except asyncio.TimeoutError:
+            # Telegram повторит доставку, когда очередь освободится
+            return web.Response(status=503)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def run_webhook(
+    dispatcher,
+    bot,
+    host="127.0.0.1",
+    port=8080,
+    path="/webhook",
+    workers=8,
+    queue_size=100,
+    secret_token=None,
+    webhook_url=None,
+):
+    if not secret_token:
+        # Случайный токен годится, только если вебхук регистрирует сам бот;
+        # сам токен в лог не пишем
+        if not webhook_url:
+            raise ValueError("Webhook secret token is required: set WEBHOOK_SECRET or --secret")
+        secret_token = secrets.token_urlsafe(32)
+        logging.info("Generated a random webhook secret token")
+
+    pool = UpdateWorkerPool(dispatcher, bot, workers=workers, queue_size=queue_size)
+    app = create_webhook_app(pool, secret_token, path=path)
+    runner = web.AppRunner(app)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass
+
+    await dispatcher.emit_startup(bot=bot)
+    pool.start()
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    if webhook_url:
+        await bot.set_webhook(
+            webhook_url.rstrip("/") + path,
+            secret_token=secret_token,
+            max_connections=workers,
+            allowed_updates=dispatcher.resolve_used_update_types(),
+        )
+    logging.info(f"Webhook server listening on {host}:{port}{path}")
+
+    try:
+        await stop.wait()
+    finally:
+        logging.info("Webhook server is shutting down")
+        # Сначала перестаём принимать запросы, затем дорабатываем принятые
+        await runner.cleanup()
+        await pool.drain()
+        await dispatcher.emit_shutdown(bot=bot)
+        await bot.session.close()